@@ -1,19 +1,28 @@
 #!/usr/bin/env python3
 from .logger import Logger
 from . import __version__
-from .config import Config, print_config
-from .schemagen import schemagen
-from .adapter_moodlecli import MoodleCLI
-from .populate import populate
 from argparse import ArgumentParser
 from enum import StrEnum, auto
 from pathlib import Path
 from os.path import realpath
 
+# NOTE: subcommands (and with them yaml and the adapters) are only imported once we know which one runs,
+#       so --help and --version stay fast and don't need a config directory.
+
 class Commands(StrEnum):
 	SCHEMAGEN = auto()
 	SHOWCONFIG = auto()
+	VALIDATE = auto()
 	POPULATE = auto()
+	REBASE = auto()
+	BENCHMARK = auto()
+	LOADTEST = auto()
+	CONTENTION = auto()
+	SERVE = auto()
+
+
+DEFAULT_CHECKPOINT = Path("populate.checkpoint.json")
+""" where populate records its progress unless told otherwise """
 
 
 if __name__ == '__main__':
@@ -23,6 +32,12 @@ if __name__ == '__main__':
 	ap.add_argument("--version", action="version", version=f"%(prog)s {__version__}")
 	ap.add_argument("-c", "--config", type=Path, help="directory to read configs from")
 	ap.add_argument("-v", "--verbose", action="store_true", help="enable verbose output")
+	ap.add_argument(
+		"--log-format",
+		choices=("text", "json"),
+		default="text",
+		help="print log messages as colored text or as one JSON object per line"
+	)
 	# subcommands
 	sp = ap.add_subparsers(
 		metavar="<command>",
@@ -33,31 +48,302 @@ if __name__ == '__main__':
 	# schemagen
 	schemagen_parser = sp.add_parser(Commands.SCHEMAGEN, help="generate schemas for configs")
 	schemagen_parser.add_argument("-o", "--out", required=True, help="directory to put schema files in")
+	schemagen_parser.add_argument("--compact", action="store_true", help="write schemas without indentation")
+	schemagen_parser.add_argument(
+		"--force",
+		action="store_true",
+		help="regenerate every schema, even those whose inputs haven't changed"
+	)
 	# showconfig
 	showconfig_parser = sp.add_parser(Commands.SHOWCONFIG, help="show current config")
+	# validate
+	validate_parser = sp.add_parser(Commands.VALIDATE, help="check configs and report everything wrong with them")
 	# populate
 	populate_parser = sp.add_parser(Commands.POPULATE, help="reset and populate database")
 	populate_parser.add_argument(
 		"--moodledir",
 		required=True,
+		action="append",
+		help="directory where moodle is installed (e.g. /bitnami/moodle/) - repeat to populate several instances at once"
+	)
+	populate_parser.add_argument(
+		"--checkpoint",
 		type=Path,
+		help=f"file to record progress in after every stage (default: {DEFAULT_CHECKPOINT})"
+	)
+	populate_parser.add_argument(
+		"--resume",
+		action="store_true",
+		help="continue where the run that wrote --checkpoint died instead of starting over"
+	)
+	populate_parser.add_argument(
+		"--checkpoint-calls",
+		action="store_true",
+		help="also record every webservice call creating a plan or slot, so --resume doesn't create a half-done one again"
+	)
+	populate_parser.add_argument("--metrics", type=Path, help="file to write per-stage metrics to as JSON")
+	populate_parser.add_argument(
+		"--trace",
+		type=Path,
+		help="file to write a timeline of stages, PHP processes and webservice calls to (chrome trace format, see perfetto)"
+	)
+	populate_parser.add_argument(
+		"--profile",
+		action="store_true",
+		help="have PHP scripts report their execution time, peak memory and DB reads/writes"
+	)
+	populate_parser.add_argument(
+		"--commit-interval",
+		type=int,
+		default=0,
+		metavar="N",
+		help="commit bulk writes every N items instead of once per stage (default: 0, once per stage)"
+	)
+	populate_parser.add_argument(
+		"--compile",
+		type=Path,
+		metavar="OUT",
+		help="instead of populating, write a single self-contained php program doing the same to OUT"
+	)
+	populate_parser.add_argument(
+		"--execute",
+		action="store_true",
+		help="run the program written by --compile and write the created IDs to OUT with a .ids.json suffix"
+	)
+	# rebase
+	rebase_parser = sp.add_parser(Commands.REBASE, help="move all dates forward to now instead of populating again")
+	rebase_parser.add_argument(
+		"--moodledir",
+		required=True,
 		help="directory where moodle is installed (e.g. /bitnami/moodle/)"
 	)
+	# serve
+	serve_parser = sp.add_parser(Commands.SERVE, help="keep config and moodle loaded, and reset moodle on request")
+	serve_parser.add_argument(
+		"--moodledir",
+		required=True,
+		help="directory where moodle is installed (e.g. /bitnami/moodle/)"
+	)
+	serve_parser.add_argument(
+		"--socket",
+		default="eduplanner_demo.sock",
+		help="unix socket to listen for requests on (default: eduplanner_demo.sock)"
+	)
+	serve_parser.add_argument(
+		"--commit-interval",
+		type=int,
+		default=0,
+		metavar="N",
+		help="commit bulk writes every N items instead of once per stage (default: 0, once per stage)"
+	)
+	# benchmark
+	benchmark_parser = sp.add_parser(Commands.BENCHMARK, help="benchmark populate against an in-memory moodle")
+	benchmark_parser.add_argument(
+		"--sizes",
+		type=lambda s: [int(n) for n in s.split(",")],
+		default=[10, 100, 1000],
+		help="comma-separated numbers of students to generate configs for (default: 10,100,1000)"
+	)
+	benchmark_parser.add_argument("-o", "--out", help="file to store results in as JSON")
+	benchmark_parser.add_argument("--compare", help="JSON results of a previous benchmark to compare against")
+	benchmark_parser.add_argument("--seed", type=int, default=0, help="seed for the generated configs")
+	benchmark_parser.add_argument(
+		"--latency",
+		metavar="PROCESS,ITEM",
+		help="pretend every PHP process takes PROCESS and every DB row ITEM milliseconds (e.g. 80,0.5)"
+	)
+	
+	# loadtest
+	loadtest_parser = sp.add_parser(Commands.LOADTEST, help="replay read calls as populated users and report latencies")
+	loadtest_parser.add_argument(
+		"--moodledir",
+		required=True,
+		help="directory where moodle is installed (e.g. /bitnami/moodle/)"
+	)
+	loadtest_parser.add_argument("--requests", type=int, default=1000, help="number of calls to make (default: 1000)")
+	loadtest_parser.add_argument(
+		"--concurrency",
+		type=int,
+		default=8,
+		help="number of clients making calls at once, each with a php process of its own (default: 8)"
+	)
+	loadtest_parser.add_argument(
+		"--student-mix",
+		metavar="FUNCTION=WEIGHT,...",
+		help="calls students make and how often, e.g. plan_get_plan=3,user_get_user=1 (default: a mix of listings)"
+	)
+	loadtest_parser.add_argument(
+		"--teacher-mix",
+		metavar="FUNCTION=WEIGHT,...",
+		help="calls teachers make and how often (default: a mix of listings)"
+	)
+	loadtest_parser.add_argument("--seed", type=int, default=0, help="seed for picking users and calls")
+	loadtest_parser.add_argument("-o", "--out", help="file to store results in as JSON")
+	
+	# contention
+	contention_parser = sp.add_parser(Commands.CONTENTION, help="have students reserve the same slots at once and check capacities hold")
+	contention_parser.add_argument(
+		"--moodledir",
+		required=True,
+		help="directory where moodle is installed (e.g. /bitnami/moodle/)"
+	)
+	contention_parser.add_argument(
+		"--week",
+		type=int,
+		default=0,
+		help="which occurrence of the slots to reserve, 0 being the next one (default: 0)"
+	)
+	contention_parser.add_argument(
+		"--concurrency",
+		type=int,
+		default=8,
+		help="number of clients reserving at once, each with a php process of its own (default: 8)"
+	)
+	contention_parser.add_argument("--slots", type=int, help="only use this many slots, the most contended first (default: all)")
+	contention_parser.add_argument(
+		"--students",
+		type=int,
+		help="only have this many of the students mapped to a slot try to reserve it (default: all)"
+	)
+	contention_parser.add_argument("--seed", type=int, default=0, help="seed for picking students")
+	contention_parser.add_argument("-o", "--out", help="file to store results in as JSON")
 	
 	# read arguments
 	args = ap.parse_args()
-	config = Config(args.config)
-	Logger.init(args.verbose)
+	Logger.init(args.verbose, json=args.log_format == "json")
 	
 	# execute subcommands
 	match args.command:
 		case Commands.SCHEMAGEN:
-			password, users, courses, slots, plans = config.read_moodle_config()
-			schemagen(realpath(args.out), courses, users)
+			from .config import Config
+			from .schemagen import schemagen
+			password, users, courses, slots, plans = Config(args.config).read_moodle_config()
+			schemagen(realpath(args.out), courses, users, compact=args.compact, force=args.force)
 		case Commands.SHOWCONFIG:
-			print_config(config)
+			from .config import Config, print_config
+			print_config(Config(args.config))
+		case Commands.VALIDATE:
+			from .config import Config
+			from .validate import validate
+			violations = validate(Config(args.config))
+			for violation in violations:
+				Logger.error(str(violation))
+			if violations:
+				Logger.error(f"found {len(violations)} problem(s)")
+				exit(1)
+			Logger.success("configs are valid")
+		case Commands.POPULATE if args.compile is not None:
+			if len(args.moodledir) != 1:
+				ap.error("--compile takes exactly one --moodledir")
+			# the program runs as a whole, so there's nothing to checkpoint, resume or profile per script
+			for flag, given in (
+				("--checkpoint", args.checkpoint is not None),
+				("--resume", args.resume),
+				("--checkpoint-calls", args.checkpoint_calls),
+				("--profile", args.profile),
+			):
+				if given:
+					ap.error(f"{flag} can't be used with --compile")
+			if not args.execute:
+				for flag, given in (("--metrics", args.metrics is not None), ("--trace", args.trace is not None)):
+					if given:
+						ap.error(f"{flag} requires --execute when used with --compile")
+			args.moodledir = args.moodledir[0]
+			from .config import Config
+			from .adapter_moodlecli import MoodleCLI
+			from .compiler import compile_populate, run_compiled
+			from .trace import Trace
+			import json
+			with open(args.compile, "w") as f:
+				f.write(compile_populate(Config(args.config), args.moodledir, args.commit_interval))
+			Logger.success(f"wrote populate program to {args.compile}")
+			if args.execute:
+				if args.trace is not None:
+					Trace.start("populate")
+				moodle_adapter = MoodleCLI(args.moodledir)
+				try:
+					ids = run_compiled(moodle_adapter, args.compile)
+				finally:
+					if args.trace is not None:
+						Trace.write(args.trace)
+				summary = args.compile.with_suffix(".ids.json")
+				with open(summary, "w") as f:
+					json.dump(ids, f, indent=4)
+				Logger.success(f"wrote created IDs to {summary}")
+				if args.metrics is not None:
+					moodle_adapter.metrics.print_table()
+					moodle_adapter.metrics.write(args.metrics)
 		case Commands.POPULATE:
-			moodle_adapter = MoodleCLI(args.moodledir)
-			populate(moodle_adapter, config)
+			if args.execute:
+				ap.error("--execute requires --compile")
+			from .config import Config
+			from .trace import Trace
+			checkpoint = args.checkpoint if args.checkpoint is not None else DEFAULT_CHECKPOINT
+			if args.trace is not None:
+				Trace.start("populate")
+			# also write the trace when populate fails (exit() included), that's when it's needed most
+			try:
+				if len(args.moodledir) > 1:
+					from .fanout import populate_instances, print_summary, write_results
+					results = populate_instances(
+						args.moodledir,
+						Config(args.config),
+						checkpoint,
+						args.resume,
+						args.profile,
+						args.commit_interval,
+						args.trace is not None,
+						args.checkpoint_calls,
+					)
+					for result in results:
+						Trace.extend(result.trace)
+					print_summary(results)
+					if args.metrics is not None:
+						write_results(results, args.metrics)
+					if any(result.error is not None for result in results):
+						exit(1)
+				else:
+					from .adapter_moodlecli import MoodleCLI
+					from .populate import populate
+					moodle_adapter = MoodleCLI(args.moodledir[0], profile=args.profile, commit_interval=args.commit_interval)
+					populate(moodle_adapter, Config(args.config), str(checkpoint), args.resume, steps=args.checkpoint_calls)
+					if args.metrics is not None:
+						moodle_adapter.metrics.print_table()
+						moodle_adapter.metrics.write(args.metrics)
+			finally:
+				if args.trace is not None:
+					Trace.write(args.trace)
+		case Commands.REBASE:
+			from .adapter_moodlecli import MoodleCLI
+			from .populate import rebase
+			rebase(MoodleCLI(args.moodledir))
+		case Commands.SERVE:
+			from .config import Config
+			from .adapter_moodlecli import MoodleCLI
+			from .serve import serve
+			serve(args.socket, MoodleCLI(args.moodledir, commit_interval=args.commit_interval), Config(args.config))
+		case Commands.BENCHMARK:
+			from .benchmark import benchmark
+			from .adapter_memory import Latency
+			latency = None if args.latency is None else Latency.parse(args.latency)
+			benchmark(args.sizes, args.out, args.compare, args.seed, latency)
+		case Commands.LOADTEST:
+			from .config import Config
+			from .model import Capability
+			from .loadtest import loadtest, parse_mix, DEFAULT_MIXES
+			mixes = dict(DEFAULT_MIXES)
+			if args.student_mix is not None:
+				mixes[Capability.STUDENT] = parse_mix(args.student_mix)
+			if args.teacher_mix is not None:
+				mixes[Capability.TEACHER] = parse_mix(args.teacher_mix)
+			loadtest(args.moodledir, Config(args.config), args.requests, args.concurrency, mixes, args.seed, args.out)
+		case Commands.CONTENTION:
+			from .config import Config
+			from .contention import contention
+			results = contention(
+				args.moodledir, Config(args.config), args.week, args.concurrency, args.slots, args.students, args.seed, args.out
+			)
+			if results["exceeded"]:
+				exit(1)
 		case _:
 			raise NotImplementedError("should be unreachable")
@@ -0,0 +1,240 @@
+from collections.abc import Iterable, Iterator, Collection
+from contextlib import contextmanager
+from dataclasses import dataclass
+from itertools import count
+from time import perf_counter, sleep
+
+from .metrics import Metrics
+from .moodleadapter import MoodleAdapter, MoodleAdapterOpen
+from .checkpoint import Checkpoint
+from .progress import Progress
+from .model import Plan, Slot, User as mUser, Task as mTask, Course as mCourse, NOW, KanbanColumn, Notification, Reservation
+
+#
+# NOTE: This is a stand-in for a real moodle instance. It doesn't talk to anything and just keeps everything in
+#       memory, assigning IDs the same way moodle's auto-increment columns would.
+#       It also counts how many PHP processes MoodleCLI would have spawned for the same calls, which is what
+#       dominates a real run, and can optionally take as long as they would (see Latency).
+#
+
+FIRST_USERID = 3
+""" moodle ships with the guest (1) and admin (2) user """
+
+
+@dataclass
+class Latency:
+	""" how long MemoryMoodle pretends things take, so scheduling changes can be measured without a real moodle """
+
+	process: float = 0.0
+	""" seconds per PHP process MoodleCLI would spawn (starting php and bootstrapping moodle) """
+	item: float = 0.0
+	""" seconds per row written to the DB """
+
+	@staticmethod
+	def parse(spec: str) -> 'Latency':
+		""" parses "PROCESS,ITEM" in milliseconds, e.g. "80,0.5" """
+		process, _, item = spec.partition(",")
+		return Latency(float(process) / 1000, float(item or 0) / 1000)
+
+
+class MemoryMoodle(MoodleAdapter):
+	""" keeps everything in memory instead of talking to moodle """
+
+	latency: Latency
+	""" how long calls take """
+
+	def __init__(self, metrics: Metrics | None = None, latency: Latency | None = None):
+		self.metrics = metrics if metrics is not None else Metrics()
+		self.latency = latency if latency is not None else Latency()
+		self.__reset()
+
+	def __spawn(self, n: int = 1, items: int = 0) -> None:
+		""" records n PHP processes MoodleCLI would have spawned at this point, writing `items` rows between them """
+		if n == 0:
+			return
+		delay = n * self.latency.process + items * self.latency.item
+		if delay > 0:
+			sleep(delay)
+		for _ in range(n):
+			self.metrics.record_process(delay / n)
+
+	def __reset(self) -> None:
+		self.courses: dict[int, mCourse] = {}
+		self.tasks: dict[int, tuple[int, mTask]] = {}
+		self.users: dict[int, mUser] = {}
+		self.enrols: set[tuple[int, int]] = set()
+		self.submissions: set[tuple[int, int]] = set()
+		self.grades: dict[tuple[int, int], int] = {}
+		self.plans: dict[int, Plan] = {}
+		self.slots: dict[int, Slot] = {}
+		self.kanban: dict[tuple[int, int], KanbanColumn] = {}
+		self.reservations: list[tuple[int, Reservation]] = []
+		self.notifications: list[tuple[int, Notification]] = []
+		self.epoch: int | None = None
+		# indexes, to check references the way foreign keys would
+		self.enrols_byuser: dict[int, set[int]] = {}
+		self.submissions_bytask: dict[int, set[int]] = {}
+		self.plan_byuser: dict[int, int] = {}
+		self.__courseids = count(2) # course 1 is the site course
+		self.__taskids = count(1)
+		self.__userids = count(FIRST_USERID)
+		self.__slotids = count(1)
+		self.__mappingids = count(1)
+
+	def prepare(self, token: str) -> None:
+		self.__spawn() # password hash
+
+	@contextmanager
+	def connect(self) -> Iterator[MoodleAdapterOpen]:
+		self.__spawn() # maintenance on
+		start = perf_counter()
+		try:
+			yield self
+		finally:
+			self.__spawn() # maintenance off
+			self.metrics.downtime += perf_counter() - start
+
+	def clear(self) -> None:
+		self.__spawn()
+		self.__reset()
+
+	def add_courses(self, courses: Collection[mCourse]) -> None:
+		self.__spawn(items=len(courses))
+		for course in courses:
+			course.moodleid = next(self.__courseids)
+			self.courses[course.moodleid] = course
+			Progress.advance()
+
+	def add_tasks(self, tasks: Collection[tuple[mCourse, mTask]]) -> None:
+		self.__spawn(items=len(tasks))
+		for course, task in tasks:
+			assert course.moodleid in self.courses
+			task.moodleid = next(self.__taskids)
+			self.tasks[task.moodleid] = (course.moodleid, task)
+			Progress.advance()
+
+	def add_users(self, users: Collection[mUser], token: str) -> None:
+		new = sum(1 for user in users if user.moodleid_ is None)
+		if new:
+			self.__spawn(items=new)
+		for user in users:
+			if user.moodleid_ is None:
+				user.moodleid = next(self.__userids)
+				self.users[user.moodleid] = user
+			self.__spawn(items=1) # user_get_user
+			Progress.advance(2)
+
+	def lookup_users(self, users: Iterable[mUser]) -> list[mUser]:
+		self.__spawn()
+		ids = {user.id: moodleid for moodleid, user in self.users.items()}
+		missing = []
+		for user in users:
+			moodleid = ids.get(user.id)
+			if moodleid is None:
+				missing.append(user)
+			else:
+				user.moodleid = moodleid
+		return missing
+
+	def add_user_enrols(self, user: mUser, courses: Collection[mCourse]) -> None:
+		self.__spawn(items=len(courses))
+		assert user.moodleid in self.users
+		for course in courses:
+			assert course.moodleid in self.courses
+			self.enrols.add((user.moodleid, course.moodleid))
+			self.enrols_byuser.setdefault(user.moodleid, set()).add(course.moodleid)
+		Progress.advance(len(courses))
+
+	def add_submissions(self, tasks: Collection[tuple[mUser, mTask]]) -> None:
+		self.__spawn(items=len(tasks))
+		for user, task in tasks:
+			courseid, _ = self.tasks[task.moodleid]
+			assert courseid in self.enrols_byuser.get(user.moodleid, ()), "submitting to a course the user isn't in"
+			self.submissions.add((user.moodleid, task.moodleid))
+			self.submissions_bytask.setdefault(task.moodleid, set()).add(user.moodleid)
+		Progress.advance(len(tasks))
+
+	def add_grades(self, tasks: Collection[tuple[mUser, mTask]]) -> None:
+		self.__spawn(items=len(tasks))
+		for user, task in tasks:
+			assert user.moodleid in self.submissions_bytask.get(task.moodleid, ()), "grading a task that wasn't submitted"
+			self.grades[(user.moodleid, task.moodleid)] = 100
+		Progress.advance(len(tasks))
+
+	def add_plans(self, plans: Collection[Plan], checkpoint: Checkpoint | None = None) -> None:
+		for plan in plans:
+			# invite, accept and set access per member, rename once, one call per deadline
+			self.__steps(checkpoint, "plans", plan.owner.id, [
+				*(f"{step}:{member.id}" for step in ("invite", "accept", "access") for member in plan.members),
+				"rename",
+				*(f"deadline:{deadline.task.id}" for deadline in plan.deadlines),
+			])
+			for user in (plan.owner, *plan.members):
+				assert user.moodleid in self.users
+				self.plan_byuser[user.moodleid] = plan.owner.moodleid
+			for deadline in plan.deadlines:
+				assert deadline.task.moodleid in self.tasks
+			self.plans[plan.owner.moodleid] = plan
+
+	def add_slots(self, slots: Collection[Slot], checkpoint: Checkpoint | None = None) -> None:
+		for slot in slots:
+			self.__steps(checkpoint, "slots", slot.id, [
+				"create",
+				*(f"mapping:{i}" for i in range(len(slot.mappings))),
+				*(f"supervisor:{supervisor.id}" for supervisor in slot.supervisors),
+			])
+			slot.moodleid = next(self.__slotids)
+			for mapping in slot.mappings:
+				assert mapping.course.moodleid in self.courses
+				mapping.moodleid = next(self.__mappingids)
+			for supervisor in slot.supervisors:
+				assert supervisor.moodleid in self.users
+			self.slots[slot.moodleid] = slot
+
+	def __steps(self, checkpoint: Checkpoint | None, stage: str, key: str, steps: list[str]) -> None:
+		""" pretends to make a webservice call per step, skipping and recording them like MoodleCLI does """
+		todo = [step for step in steps if checkpoint is None or not checkpoint.step_done(stage, key, step)]
+		self.__spawn(len(todo), len(todo))
+		if checkpoint is not None:
+			for step in todo:
+				checkpoint.record_step(stage, key, step)
+		Progress.advance(len(steps))
+
+	def add_kanban_entries(self, entries: Collection[tuple[mUser, mTask, KanbanColumn]]) -> None:
+		if not entries:
+			return # MoodleCLI skips empty batches
+		self.__spawn(items=len(entries))
+		for user, task, column in entries:
+			assert user.moodleid in self.users and task.moodleid in self.tasks
+			self.kanban[(user.moodleid, task.moodleid)] = column
+		Progress.advance(len(entries))
+
+	def add_reservations(self, reservations: Collection[tuple[Slot, Reservation]]) -> None:
+		if not reservations:
+			return # MoodleCLI skips empty batches
+		self.__spawn(items=len(reservations))
+		for slot, reservation in reservations:
+			assert slot.moodleid in self.slots and reservation.user.moodleid in self.users
+			self.reservations.append((slot.moodleid, reservation))
+		Progress.advance(len(reservations))
+
+	def add_notifications(self, notifications: Collection[tuple[mUser, Notification]]) -> None:
+		if not notifications:
+			return # MoodleCLI skips empty batches
+		self.__spawn(items=len(notifications))
+		for user, notification in notifications:
+			assert user.moodleid in self.users
+			self.notifications.append((user.moodleid, notification))
+		Progress.advance(len(notifications))
+
+	def record_epoch(self) -> None:
+		self.__spawn(items=1)
+		self.epoch = int(NOW.timestamp())
+
+	def rebase(self) -> int | None:
+		self.__spawn()
+		if self.epoch is None:
+			return None
+		shift = int(NOW.timestamp()) - self.epoch
+		self.epoch += shift
+		return shift
@@ -1,19 +1,28 @@
 from os import stat, getuid
-from os.path import realpath, join as pathjoin
+from os.path import basename, realpath, join as pathjoin
 from pwd import getpwuid
-from functools import cached_property
+from functools import cached_property, wraps
 from subprocess import Popen, PIPE
+from tempfile import TemporaryFile
 import json
+import re
 from enum import StrEnum, auto
-from collections.abc import Iterator, Iterable, Collection
+from collections.abc import Iterator, Iterable, Collection, Callable
 from contextlib import contextmanager
-from typing import Any
-from datetime import datetime, UTC, timedelta
-from unittest import result
+from typing import IO, Any
+from datetime import date, timedelta
+from time import perf_counter
 
 from .logger import Logger
+from .metrics import Metrics
+from .progress import Progress
+from .trace import Trace
 from .moodleadapter import MoodleAdapter, MoodleAdapterOpen
-from .model import Plan, Slot, User as mUser, Task as mTask, Course as mCourse
+from .checkpoint import Checkpoint
+from .model import (
+	Plan, Slot, SlotMapping, Deadline, MoodleObject, User as mUser, Task as mTask, Course as mCourse, NOW,
+	KanbanColumn, Notification, NotificationType, Reservation,
+)
 
 #
 # NOTE: All of this essentially works by injecting php code into the moodle codebase (or if you wanna see it that way:
@@ -47,16 +56,23 @@ class DBTable(StrEnum):
 	LBP_USERS = "local_lbplanner_users"
 	COURSES = "course"
 	USERS = "user"
+	ASSIGNMENTS = "assign"
 	SUBMISSIONS = "assign_submission"
 	GRADES = "assign_grades"
+	EVENTS = "event"
 
 def e(orig: str) -> str:
 	""" escapes strings so they can be used for inserting into php single-quoted strings """
 	return orig.replace('\\', '\\\\').replace('\'', "\\'").strip() # should be good enough
 
+class PhpExpr(str):
+	""" a php expression that gets inserted into php code as-is instead of being serialized as a string """
+
 def php_serialize(orig: dict | list | str) -> str:
 	""" serializes a string into php code """
-	if isinstance(orig, dict):
+	if isinstance(orig, PhpExpr):
+		return orig
+	elif isinstance(orig, dict):
 		return '[' + ', '.join([f"{php_serialize(k)}=>{php_serialize(v)}" for k, v in orig.items()]) + ']'
 	elif isinstance(orig, list):
 		return '[' + ", ".join([php_serialize(v) for v in orig]) + ']'
@@ -67,43 +83,43 @@ def php_serialize(orig: dict | list | str) -> str:
 	else:
 		raise NotImplementedError(f"cannot serialize object of type {type(orig)}")
 
-def php_dump(code: str) -> None:
-	""" dumps php code output for debugging purposes """
-	
-	## print with line numbers in different color
+class PhpRefs:
+	""" decides how the php_* code generators refer to moodle IDs and points in time
 
+	This one is for code that runs in a separate process per call: IDs that are already known are inlined as
+	literals and newly created IDs are echoed, separated by NUL bytes.
+	"""
 
-class MoodleCLI(MoodleAdapter):
-	""" Connects to a moodle instance via the CLI scripts """
-	__slots__ = ('moodledir')
+	def id(self, obj: MoodleObject) -> PhpExpr:
+		""" a php expression evaluating to the moodle ID of an object """
+		return PhpExpr(f"{obj.moodleid}")
 
-	moodledir: str
-	""" where moodle is located """
-	
-	def __init__(self, moodledir: str):
-		self.moodledir = realpath(moodledir)
-	
-	@contextmanager
-	def connect(self) -> Iterator[MoodleAdapterOpen]:
-		if self.exec_uid != getuid():
-			raise OSError(f"Must run as {getpwuid(self.exec_uid).pw_name}, {getpwuid(getuid()).pw_name} instead")
-		
-		self.enable_maintenance()
-		try:
-			yield self
-		finally:
-			self.disable_maintenance()
-	
-	def enable_maintenance(self) -> None:
-		""" enables moodle maintenance mode """
-		self.__run_script(SCRIPTNAME.MAINTENANCE, ("--enable",))
+	def time(self, days: int) -> PhpExpr:
+		""" a php expression evaluating to the UNIX timestamp `days` days after model.NOW """
+		return PhpExpr(f"{int((NOW + timedelta(days=days)).timestamp())}")
 
-	def disable_maintenance(self) -> None:
-		""" disables moodle maintenance mode """
-		self.__run_script(SCRIPTNAME.MAINTENANCE, ("--disable",))
-	
-	def clear(self) -> None:
-		self.__run_code(f"""
+	def store(self, kind: str) -> str:
+		""" a php statement reporting `$id` as the moodle ID of the `kind` object with the config ID `$key` """
+		return 'echo $id . "\\0";'
+
+
+EPOCH_COMPONENT = "eduplanner_demo"
+""" plugin name under which the time everything was populated relative to is kept in moodle's config """
+
+REBASED_DATES: dict[DBTable, tuple[tuple[str, ...], str | None]] = {
+	DBTable.ASSIGNMENTS: (("duedate", "cutoffdate", "gradingduedate", "allowsubmissionsfromdate"), None),
+	DBTable.SUBMISSIONS: (("timecreated", "timemodified"), None),
+	DBTable.GRADES: (("timecreated", "timemodified"), None),
+	DBTable.EVENTS: (("timestart", "timesort"), "modulename = 'assign'"),
+	DBTable.LBP_PLAN_DEADLINES: (("deadlinestart", "deadlineend"), None),
+	DBTable.LBP_NOTIFICATIONS: (("timestamp", "timestamp_read"), None),
+}
+""" every timestamp populate creates, as table: (columns, condition on which rows or None for all of them)
+
+Reservations are kept as dates of a slot's occurrences instead, see php_rebase.
+"""
+
+PHP_CLEAR = f"""
 $DB->delete_records("{DBTable.LBP_NOTIFICATIONS}");
 $DB->delete_records("{DBTable.LBP_RESERVATIONS}");
 $DB->delete_records("{DBTable.LBP_SLOTFILTERS}");
@@ -134,112 +150,110 @@ $allcourseids = $DB->get_fieldset('{DBTable.COURSES}', 'id');
 foreach ($allcourseids as $courseid) {{
 	delete_course($courseid, false);
 }}
-""")
+unset_config('epoch', '{EPOCH_COMPONENT}');
+"""
+""" deletes everything eduplanner cares about """
 
-	def add_users(self, users: Iterable[mUser], token: str) -> None:
-		caplists = {user.name: ",".join([f"'local/lb_planner:{cap}'" for cap in user.capabilities]) for user in users}
-		clazzs = {user.name: f"'{e(user.clazz)}'" if user.clazz is not None else 'null' for user in users}
-		firstnames = {}
-		lastnames = {}
-		
-		for user in users:
-			splitpoint = user.name.rfind(' ')
-			
-			if splitpoint == -1:
-				firstnames[user.name] = user.name
-				lastnames[user.name] = ''
-				continue
-			
-			firstnames[user.name] = user.name[:splitpoint]
-			lastnames[user.name] = user.name[splitpoint + 1:]
-		
-		data = ",".join([
-			f"'{e(user.name.replace(' ', '_'))}'=>"
-			f"['{token}',[{caplists[user.name]}],{clazzs[user.name]},'{e(firstnames[user.name])}','{e(lastnames[user.name])}']"
-			for user in users
-		])
-		stdout = self.__run_code(f"""
-$tocreate = [{data}];
+PHP_CALL_EXTERNAL = """
+// NOTE: this is mostly taken from external_api::call_external_function(…);
+if (!function_exists('lbp_call_external')) {
+	function lbp_call_external(string $functionname, array $args, int $userid) {
+		global $USER;
+		$USER = core_user::get_user($userid, '*', MUST_EXIST);
+		$externalfunctioninfo = external_api::external_function_info($functionname);
+		// validate parameters
+		$callable = [$externalfunctioninfo->classname, 'validate_parameters'];
+		$params = call_user_func(
+			$callable,
+			$externalfunctioninfo->parameters_desc,
+			$args
+		);
+		$params = array_values($params);
+		// call API function
+		$result = call_user_func_array([$externalfunctioninfo->classname, $externalfunctioninfo->methodname], $params);
+		// validate result
+		if ($externalfunctioninfo->returns_desc !== null) {
+			$result = call_user_func([$externalfunctioninfo->classname, 'clean_returnvalue'], $externalfunctioninfo->returns_desc, $result);
+		}
+		return $result;
+	}
+}
+"""
+""" defines lbp_call_external(), which calls a webservice function as a specific user (needs lib/externallib)
 
-$syscontext = context_system::instance(0, MUST_EXIST, false);
+NOTE: only if it isn't defined yet, since a resident worker runs lots of scripts in the same process
+"""
 
-foreach ($tocreate as $usrname => [$passwd, $capabilities, $clazz, $firstname, $lastname]) {{
-	$userid = create_user_record($usrname, $passwd)->id;
-	foreach ($capabilities as $capability) {{
-		$roles = get_roles_with_capability($capability);
-		role_assign(array_key_first($roles), $userid, $syscontext);
-	}}
-	if ($clazz !== null)
-		$DB->set_field('user', 'address', $clazz, ['id' => $userid]);
-	$DB->set_field('user', 'firstname', $firstname, ['id' => $userid]);
-	$DB->set_field('user', 'lastname', $lastname, ['id' => $userid]);
-	$DB->set_field('user', 'email', "user{{$userid}}@example.com", ['id' => $userid]);
-	echo $userid . "\\0";
-}}
-""", True)
-		assert stdout is not None
-		userIDs = stdout[:-1].split('\0')
-		for user, userID in zip(users, userIDs):
-			user.moodleid = int(userID)
-			# get eduplanner user - this creates it for future use
-			self.__run_webservice_function("user_get_user", {}, as_user=user.moodleid)
+def php_call_external(function: str, parameters: dict, as_user: str, namespace: str = "local_lbplanner") -> PhpExpr:
+	""" a php expression calling a webservice function via lbp_call_external()
 
+	:param str function: the name of the function to call
+	:param dict parameters: the parameters to pass to the function
+	:param str as_user: php expression evaluating to the ID of the user to run this as
+	:param str namespace: the namespace of the function
+	"""
+	return PhpExpr(f"lbp_call_external('{namespace}_{function}', {php_serialize(parameters)}, {as_user})")
 
-	def add_courses(self, courses: Collection[mCourse]) -> None:
-		data = ",".join([
-			f"['fullname' => '{e(course.name)}', 'shortname' => '{e(course.name)}', 'category' => $catid, 'idnumber' => '', 'tags' => ['eduplanner']]"
-			for course in courses
-		])
-		stdout = self.__run_code(f"""
-$catid = core_course_category::get_default()->id;
-$courses = [
-	{data}
-];
+PHP_BEGIN = """
+$lbptransaction = $DB->start_delegated_transaction();
+$lbpuncommitted = 0;
+"""
+""" starts a transaction - anything not committed when the script dies is rolled back """
 
-foreach ($courses as $course) {{
-	echo create_course((object)$course)->id . "\\0";
-}}
-""", True, ['course/lib'])
-		assert stdout is not None
-		courseIDs = stdout[:-1].split('\0')[:]
-		assert len(courseIDs) == len(courses)
-		for course, courseID in zip(courses, courseIDs):
-			Logger.success(f"Created course '{course.name}' with ID {courseID}")
-			course.moodleid = int(courseID)
+PHP_COMMIT = """
+$lbptransaction->allow_commit();
+"""
+""" commits the transaction started by PHP_BEGIN """
 
-	def add_user_enrols(self, user: mUser, courses: Collection[mCourse]) -> None:
-		data = ",".join([f"{course.moodleid}" for course in courses])
-		
-		self.__run_code(f"""
-$courses = [{data}];
-$userid = {user.moodleid};
+def php_checkpoint(commit_interval: int) -> str:
+	""" php code committing the transaction started by PHP_BEGIN every `commit_interval` items and starting a new one
 
-$studentrole = $DB->get_record('role', ['archetype'=>'student']);
-$enrolplugin = enrol_get_plugin('manual');
+	:param int commit_interval: how many items to commit at once, 0 to only commit once everything is done
+	"""
+	if commit_interval <= 0:
+		return ""
+	return f"""
+	if (++$lbpuncommitted >= {commit_interval}) {{
+		$lbptransaction->allow_commit();
+		$lbptransaction = $DB->start_delegated_transaction();
+		$lbpuncommitted = 0;
+	}}"""
 
-foreach ($courses as $courseid) {{
-	$instance = $DB->get_record('enrol', ['courseid' => $courseid, 'enrol' => 'manual']);
-	$enrolplugin->enrol_user($instance, $userid, $studentrole->id);
+def php_add_courses(courses: Iterable[mCourse], refs: PhpRefs, commit_interval: int = 0) -> str:
+	""" creates courses (needs course/lib) """
+	data = ",".join([
+		f"'{e(course.id)}' => ['fullname' => '{e(course.name)}', 'shortname' => '{e(course.name)}', 'category' => $catid, 'idnumber' => '', 'tags' => ['eduplanner']]"
+		for course in courses
+	])
+	return f"""
+$catid = core_course_category::get_default()->id;
+$courses = [
+	{data}
+];
+{PHP_BEGIN}
+foreach ($courses as $key => $course) {{
+	$id = create_course((object)$course)->id;
+	{refs.store('courses')}{php_checkpoint(commit_interval)}
 }}
-""")
+{PHP_COMMIT}"""
 
-	def add_tasks(self, tasks: Collection[tuple[mCourse, mTask]]) -> None:
-		assigns = ",".join([
-			f"""[
-				'name' => '{e(task.name)}',
-				'description' => '{e(task.description)}',
-				'duedate' => {task.absdue},
-				'courseid' => {course.moodleid},
-				'modulename' => 'assign'
-			]""" for course, task in tasks
-		])
-		
-		stdout = self.__run_code(f"""
+def php_add_tasks(tasks: Iterable[tuple[mCourse, mTask]], refs: PhpRefs, commit_interval: int = 0) -> str:
+	""" creates an assignment per task (needs course/modlib and lib/datalib) """
+	assigns = ",".join([
+		f"""'{e(task.id)}' => [
+			'name' => '{e(task.name)}',
+			'description' => '{e(task.description)}',
+			'duedate' => {refs.time(task.due)},
+			'courseid' => {refs.id(course)},
+			'modulename' => 'assign'
+		]""" for course, task in tasks
+	])
+	return f"""
 $assigns = [{assigns}];
 
 $USER->id = 2;
-
-foreach ($assigns as $assign) {{
+{PHP_BEGIN}
+foreach ($assigns as $key => $assign) {{
 	$course = get_course($assign['courseid']);
 	[$module, $context, $cw, $cm, $data] = prepare_new_moduleinfo_data($course, 'assign', 1);
 	$data->name = $assign['name'];
@@ -259,208 +273,958 @@ foreach ($assigns as $assign) {{
 		= false;
 	$data->grade = 100;
 	// setting module and returning assignid
-	echo add_moduleinfo($data, $course)->instance . "\\0";
+	$id = add_moduleinfo($data, $course)->instance;
+	{refs.store('tasks')}{php_checkpoint(commit_interval)}
 }}
-""", True, ["course/modlib", "lib/datalib"])
-		assert stdout is not None
-		taskIDs = stdout[:-1].split('\0')
-		assert len(taskIDs) == len(tasks)
-		for (course, task), taskID in zip(tasks, taskIDs):
-			task.moodleid = int(taskID)
-			Logger.debug(f"Created task '{task.name}' in course '{course.name}' with ID {taskID}")
-
-	def add_submissions(self, tasks: Iterable[tuple[mUser, mTask]]) -> None:
-		data = ",".join([
-			f"['userid' => {user.moodleid}, 'assignment' => {task.moodleid}, 'status' => 'submitted', 'latest' => 1]"
-			for user, task in tasks
-		])
-		self.__run_code(f"""
+{PHP_COMMIT}"""
+
+def moodle_username(user: mUser) -> str:
+	""" the username a user is created with """
+	# moodle only accepts lowercase usernames
+	return user.name.replace(' ', '_').lower()
+
+def php_add_users(users: Iterable[mUser], password: str, refs: PhpRefs, commit_interval: int = 0, passwordhash: str | None = None) -> str:
+	""" creates users and assigns them the roles matching their capabilities (needs user/lib)
+
+	:param str|None passwordhash: the password already hashed by hash_internal_user_password(), to not hash it here
+	"""
+	users = list(users)
+	capabilities = sorted({cap for user in users for cap in user.capabilities})
+	data = []
+	for user in users:
+		caplist = ",".join([f"'local/lb_planner:{cap}'" for cap in user.capabilities])
+		splitpoint = user.name.rfind(' ')
+		if splitpoint == -1:
+			firstname, lastname = user.name, ''
+		else:
+			firstname, lastname = user.name[:splitpoint], user.name[splitpoint + 1:]
+		data.append(
+			f"'{e(user.id)}'=>"
+			f"['{e(moodle_username(user))}',[{caplist}],'{e(user.clazz or '')}','{e(firstname)}','{e(lastname)}']"
+		)
+	roles = ",".join([f"'local/lb_planner:{cap}'" for cap in capabilities])
+	return f"""
+$tocreate = [{",".join(data)}];
+// moodle's hashes are deliberately slow, and every user gets the same password anyway
+$passwordhash = {f"'{e(passwordhash)}'" if passwordhash is not None else f"hash_internal_user_password('{e(password)}')"};
+$verified = false;
+
+$syscontext = context_system::instance(0, MUST_EXIST, false);
+// the same few roles are assigned over and over, so look each one up only once
+$roleids = [];
+foreach ([{roles}] as $capability) {{
+	$roleids[$capability] = array_key_first(get_roles_with_capability($capability));
+}}
+{PHP_BEGIN}
+foreach ($tocreate as $key => [$usrname, $capabilities, $clazz, $firstname, $lastname]) {{
+	// everything in one insert, instead of create_user_record() and an update per field afterwards
+	$id = user_create_user((object)[
+		'auth' => 'manual',
+		'confirmed' => 1,
+		'mnethostid' => $CFG->mnet_localhost_id,
+		'username' => $usrname,
+		'password' => $passwordhash,
+		'firstname' => $firstname,
+		'lastname' => $lastname,
+		'email' => "{{$usrname}}@example.com",
+		'address' => $clazz,
+	], false);
+	if (!$verified) {{
+		// make sure logging in with the configured password works with the shared hash
+		if (!validate_internal_user_password($DB->get_record('user', ['id' => $id], '*', MUST_EXIST), '{e(password)}')) {{
+			throw new coding_exception("shared password hash does not validate for user $usrname");
+		}}
+		$verified = true;
+	}}
+	foreach ($capabilities as $capability) {{
+		role_assign($roleids[$capability], $id, $syscontext);
+	}}
+	{refs.store('users')}{php_checkpoint(commit_interval)}
+}}
+{PHP_COMMIT}"""
+
+def php_add_user_enrols(enrols: Iterable[tuple[mUser, Collection[mCourse]]], refs: PhpRefs, commit_interval: int = 0) -> str:
+	""" enrols users in courses as students """
+	data = ",".join([
+		f"[{refs.id(user)}, [{','.join([refs.id(course) for course in courses])}]]"
+		for user, courses in enrols
+	])
+	return f"""
+$enrols = [{data}];
+
+$studentrole = $DB->get_record('role', ['archetype'=>'student']);
+$enrolplugin = enrol_get_plugin('manual');
+{PHP_BEGIN}
+foreach ($enrols as [$userid, $courses]) {{
+	foreach ($courses as $courseid) {{
+		$instance = $DB->get_record('enrol', ['courseid' => $courseid, 'enrol' => 'manual']);
+		$enrolplugin->enrol_user($instance, $userid, $studentrole->id);{php_checkpoint(commit_interval)}
+	}}
+}}
+{PHP_COMMIT}"""
+
+def php_add_submissions(tasks: Iterable[tuple[mUser, mTask]], refs: PhpRefs) -> str:
+	""" marks tasks as submitted """
+	data = ",".join([
+		f"['userid' => {refs.id(user)}, 'assignment' => {refs.id(task)}, 'status' => 'submitted', 'latest' => 1]"
+		for user, task in tasks
+	])
+	return f"""
 $data = [
 	{data}
 ];
+{PHP_BEGIN}
 $DB->insert_records('{DBTable.SUBMISSIONS}', $data);
-""")
+{PHP_COMMIT}"""
 
-	def add_grades(self, tasks: Iterable[tuple[mUser, mTask]]) -> None:
-		
-		assigns = ",".join([f"[{user.moodleid}, {task.moodleid}]" for user, task in tasks])
-		
-		self.__run_code(f"""
+def php_add_grades(tasks: Iterable[tuple[mUser, mTask]], refs: PhpRefs, commit_interval: int = 0) -> str:
+	""" gives full marks for tasks (needs mod/assign/locallib) """
+	assigns = ",".join([f"[{refs.id(user)}, {refs.id(task)}]" for user, task in tasks])
+	return f"""
 $assigns = [
 	{assigns}
 ];
-
+{PHP_BEGIN}
 foreach ($assigns as [$userid, $assignid]) {{
 	$cm = get_coursemodule_from_instance('assign', $assignid, 0, false, MUST_EXIST);
 	$context = context_module::instance($cm->id);
 	$assignment = new assign($context, $cm, null);
 	$grade = $assignment->get_user_grade($userid, true, 1);
 	$grade->grade = 100;
-	$assignment->update_grade($grade);
+	$assignment->update_grade($grade);{php_checkpoint(commit_interval)}
+}}
+{PHP_COMMIT}"""
+
+NOTIFICATION_TYPES: dict[NotificationType, int] = {
+	NotificationType.INVITE: 0,
+	NotificationType.INVITE_ACCEPTED: 1,
+	NotificationType.INVITE_DECLINED: 2,
+	NotificationType.PLAN_LEFT: 3,
+	NotificationType.PLAN_REMOVED: 4,
+	NotificationType.USER_REGISTERED: 5,
+}
+""" how eduplanner stores notification types """
+
+def php_add_kanban_entries(entries: Iterable[tuple[mUser, mTask, KanbanColumn]], refs: PhpRefs) -> str:
+	""" puts tasks on users' kanban boards """
+	data = ",".join([f"[{refs.id(user)}, {refs.id(task)}, '{column}']" for user, task, column in entries])
+	return f"""
+$entries = [{data}];
+
+// kanban entries refer to course modules, but tasks are known by their assignment ID
+$assignmodule = $DB->get_field('modules', 'id', ['name' => 'assign'], MUST_EXIST);
+$cmids = $DB->get_records_menu('course_modules', ['module' => $assignmodule], '', 'instance, id');
+$records = [];
+foreach ($entries as [$userid, $assignid, $column]) {{
+	$records[] = ['userid' => $userid, 'cmid' => $cmids[$assignid], 'column' => $column];
+}}
+{PHP_BEGIN}
+$DB->insert_records('{DBTable.LBP_KANBANENTRIES}', $records);
+{PHP_COMMIT}"""
+
+def php_add_reservations(reservations: Iterable[tuple[Slot, Reservation]], refs: PhpRefs) -> str:
+	""" reserves slots for students, as if they had reserved them themselves """
+	data = ",".join([
+		f"['slotid' => {refs.id(slot)}, 'userid' => {refs.id(reservation.user)}, 'reserverid' => {refs.id(reservation.user)}, "
+		f"'date' => gmdate('Y-m-d', {refs.time((slot.date(reservation.week) - NOW.date()).days)})]"
+		for slot, reservation in reservations
+	])
+	return f"""
+$records = [{data}];
+{PHP_BEGIN}
+$DB->insert_records('{DBTable.LBP_RESERVATIONS}', $records);
+{PHP_COMMIT}"""
+
+def php_add_notifications(notifications: Iterable[tuple[mUser, Notification]], refs: PhpRefs) -> str:
+	""" sends users notifications """
+	data = ",".join([
+		f"['userid' => {refs.id(user)}, 'type' => {NOTIFICATION_TYPES[notification.type]}, 'status' => {int(notification.read)}, "
+		f"'timestamp' => {refs.time(notification.time)}, 'timestamp_read' => {refs.time(notification.time) if notification.read else 'null'}]"
+		for user, notification in notifications
+	])
+	return f"""
+$records = [{data}];
+{PHP_BEGIN}
+$DB->insert_records('{DBTable.LBP_NOTIFICATIONS}', $records);
+{PHP_COMMIT}"""
+
+def php_record_epoch(refs: PhpRefs) -> str:
+	""" remembers the point in time all dates were created relative to, so they can be rebased later """
+	return f"""
+set_config('epoch', {refs.time(0)}, '{EPOCH_COMPONENT}');
+"""
+
+def php_rebase(epoch: int) -> str:
+	""" moves every date populate created forward by the time since the recorded epoch and records `epoch` as the new one
+
+	Echoes how many seconds dates were moved by, or nothing if moodle wasn't (completely) populated.
+	"""
+	updates = ""
+	for table, (columns, condition) in REBASED_DATES.items():
+		# 0 (or null) means "not set" for all of these
+		assignments = ", ".join(
+			f"{column} = CASE WHEN {column} > 0 THEN {column} + $shift ELSE {column} END" for column in columns
+		)
+		where = "" if condition is None else f" WHERE {condition}"
+		updates += f'\n\t$DB->execute("UPDATE {{{table}}} SET {assignments}{where}");'
+	return f"""
+$lbpepoch = get_config('{EPOCH_COMPONENT}', 'epoch');
+if ($lbpepoch !== false) {{
+	$shift = {epoch} - (int)$lbpepoch;
+	{PHP_BEGIN}{updates}
+	// reservations are for the n-th occurrence of their slot from the epoch on (see Slot.date), which a plain shift
+	// by whole days would move onto another weekday. As they're on their slot's weekday, moving one to the same
+	// occurrence from the new epoch on only depends on its date, so a single UPDATE mapping every date does it.
+	$lbpoldday = intdiv((int)$lbpepoch, 86400);
+	$lbpnewday = intdiv({epoch}, 86400);
+	$lbpcases = [];
+	$lbpparams = [];
+	foreach ($DB->get_fieldset_sql("SELECT DISTINCT date FROM {{{DBTable.LBP_RESERVATIONS}}}") as $date) {{
+		$day = intdiv(strtotime("$date UTC"), 86400);
+		$moved = $lbpnewday + 7 * (int)floor(($day - $lbpoldday) / 7);
+		// day 0 (1970-01-01) was a thursday, so (day + 3) % 7 is 0 for mondays
+		$moved += (($day + 3) % 7 - ($moved + 3) % 7 + 7) % 7;
+		$lbpcases[] = 'WHEN ? THEN ?';
+		array_push($lbpparams, $date, gmdate('Y-m-d', $moved * 86400));
+	}}
+	if ($lbpcases) {{
+		$DB->execute(
+			"UPDATE {{{DBTable.LBP_RESERVATIONS}}} SET date = CASE date " . implode(' ', $lbpcases) . " ELSE date END",
+			$lbpparams
+		);
+	}}
+	set_config('epoch', {epoch}, '{EPOCH_COMPONENT}');
+	{PHP_COMMIT}
+	// course module info caches assignment due dates
+	rebuild_course_cache(0, true);
+	echo $shift;
 }}
-""", imports=["mod/assign/locallib"])
+"""
+
+def php_bootstrap(moodledir: str, imports: Iterable[str] = []) -> str:
+	""" php code that sets up moodle for a CLI script and requires the given files (relative to moodledir, without .php) """
+	bootstrap = """\
+define('CLI_SCRIPT', true);
+ini_set('display_errors', '1');
+ini_set('display_startup_errors', '1');
+error_reporting(E_ALL);
+"""
+	for i in ['config', *imports]:
+		# TODO: check if file exists for better exception reporting
+		fn = f"{i}.php"
+		bootstrap += f"require_once('{pathjoin(moodledir, fn)}');"
+	return bootstrap
+
+WORKER_READY = b"lbp-worker-ready\n"
+""" the line a worker prints once it's ready for scripts - anything before it was printed while bootstrapping """
+
+WORKER_HEADER = re.compile(rb"(ok|error) (\d+)\n")
+""" the line a worker replies to a script with """
+
+PHP_WORKER = f"""
+// runs scripts sent via stdin one after another, each prefixed by its length in bytes on a line of its own, and
+// replies with "ok|error <length>" on a line of its own followed by everything the script printed
+function lbp_worker_run(string $lbpcode) {{
+	global $CFG, $DB, $USER, $SITE, $PAGE, $OUTPUT;
+	eval($lbpcode);
+}}
+$lbpin = fopen('php://stdin', 'rb');
+$lbpout = fopen('php://stdout', 'wb');
+fwrite($lbpout, "{WORKER_READY.decode('ascii').strip()}\n");
+fflush($lbpout);
+while (($lbpheader = fgets($lbpin)) !== false) {{
+	$lbpcode = stream_get_contents($lbpin, (int)$lbpheader);
+	$lbpstatus = 'ok';
+	ob_start();
+	try {{
+		lbp_worker_run($lbpcode);
+	}} catch (Throwable $e) {{
+		$lbpstatus = 'error';
+		echo $e;
+		if ($DB->is_transaction_started()) {{
+			$DB->force_transaction_rollback();
+		}}
+	}}
+	// scripts may have deleted things still cached in-process (e.g. contexts of deleted courses)
+	context_helper::reset_caches();
+	$lbpoutput = ob_get_clean();
+	fwrite($lbpout, $lbpstatus . ' ' . strlen($lbpoutput) . "\n" . $lbpoutput);
+	fflush($lbpout);
+}}
+"""
+""" turns a php process with moodle bootstrapped into a worker that can run many scripts """
+
+class PhpWorker:
+	""" a resident php process with moodle already bootstrapped, which saves starting php and moodle for every script """
+
+	moodledir: str
+	""" where moodle is located """
+
+	def __init__(self, moodledir: str):
+		self.moodledir = moodledir
+		self.__process: Popen | None = None
+		self.__stderr: IO[bytes] | None = None
+		self.__preamble = b""
+
+	@property
+	def pid(self) -> int | None:
+		""" the worker's process ID, None if it isn't running """
+		return None if self.__process is None else self.__process.pid
+
+	@property
+	def alive(self) -> bool:
+		""" whether the worker is running and ready for scripts """
+		return self.__process is not None and self.__process.poll() is None
+
+	def start(self) -> None:
+		""" starts the worker, bootstrapping moodle """
+		# NOTE: stderr is only read once the worker died, so it goes to a file instead of a pipe that could fill up
+		#       (e.g. with error_log() output) and block the worker until it's read
+		self.__stderr = TemporaryFile()
+		self.__process = Popen(
+			["php", "-r", php_bootstrap(self.moodledir) + PHP_WORKER, "--"],
+			stdin=PIPE, stdout=PIPE, stderr=self.__stderr
+		)
+		# whatever moodle prints while bootstrapping (e.g. notices, with display_errors on) comes before the ready line
+		assert self.__process.stdout is not None
+		preamble = []
+		while line := self.__process.stdout.readline():
+			if line.endswith(WORKER_READY):
+				preamble.append(line[:-len(WORKER_READY)])
+				break
+			preamble.append(line)
+		self.__preamble = b"".join(preamble)
+		if self.__preamble and line:
+			Logger.warning(f"php worker printed while starting: {self.__preamble.decode('utf-8', 'replace').strip()}")
+
+	def stop(self) -> None:
+		""" lets the worker finish and waits for it to exit """
+		if self.__process is None:
+			return
+		with self.__process as p:
+			assert p.stdin is not None
+			p.stdin.close()
+			p.wait()
+		self.__process = None
+		self.__close_stderr()
+
+	def __close_stderr(self) -> bytes:
+		""" closes the file the worker's stderr went to
+
+		:return bytes: everything the worker wrote to stderr
+		"""
+		if self.__stderr is None:
+			return b""
+		with self.__stderr as f:
+			f.seek(0)
+			err = f.read()
+		self.__stderr = None
+		return err
+
+	def run(self, code: str) -> tuple[bool, bytes]:
+		""" runs a script in the worker
+
+		:param str code: php code to run, without moodle bootstrap
+		:return tuple[bool, bytes]: whether the script finished without throwing, and everything it printed
+		                            (or, if it killed the worker, everything the worker wrote to stderr)
+		"""
+		if not self.alive:
+			self.start()
+		p = self.__process
+		assert p is not None and p.stdin is not None and p.stdout is not None
+		data = code.encode('utf-8')
+		try:
+			p.stdin.write(f"{len(data)}\n".encode('utf-8') + data)
+			p.stdin.flush()
+		except BrokenPipeError:
+			pass # reported below, since there's no reply either
+		header = p.stdout.readline()
+		match = WORKER_HEADER.fullmatch(header)
+		if match is None:
+			# the script killed the worker (e.g. with a fatal error or exit()) or printed something outside of its
+			# output buffer, so there's no telling where its output ends - restarted with the next one either way
+			if header:
+				p.kill()
+			p.wait()
+			err = self.__preamble + header + p.stdout.read() + self.__close_stderr()
+			self.__process = None
+			return False, err
+		return match[1] == b'ok', p.stdout.read(int(match[2]))
+
+STREAM_CHUNK = 64 * 1024
+""" how many bytes of script output are read at once when streaming IDs """
+
+PROFILE_MARKER = '\x1e'
+""" separates a script's regular output from the profile trailer appended to it (json_encode never outputs this) """
+
+def _adapter_method(f: Callable) -> Callable:
+	""" remembers which adapter method is running, so PHP-side profiles can be attributed to it """
+	@wraps(f)
+	def wrapper(self: 'MoodleCLI', *args: Any, **kwargs: Any) -> Any:
+		outer = self.method
+		self.method = f.__name__
+		try:
+			return f(self, *args, **kwargs)
+		finally:
+			self.method = outer
+	return wrapper
+
+def php_dump(code: str) -> None:
+	""" dumps php code output for debugging purposes """
+	
+	## print with line numbers in different color
+
+
+class MoodleCLI(MoodleAdapter):
+	""" Connects to a moodle instance via the CLI scripts """
+	__slots__ = ('moodledir')
+
+	moodledir: str
+	""" where moodle is located """
+	profile: bool
+	""" whether scripts should report their execution time, peak memory and DB reads/writes """
+	method: str | None
+	""" the adapter method currently running """
+	refs: PhpRefs
+	""" how generated code refers to moodle IDs """
+	commit_interval: int
+	""" how many items bulk methods write per transaction, 0 for one transaction per call """
+	worker: PhpWorker | None
+	""" if set, scripts run in this resident php process instead of one process each """
+	
+	def __init__(self, moodledir: str, metrics: Metrics | None = None, profile: bool = False, commit_interval: int = 0):
+		self.moodledir = realpath(moodledir)
+		self.metrics = metrics if metrics is not None else Metrics()
+		self.profile = profile
+		self.method = None
+		self.refs = PhpRefs()
+		self.commit_interval = commit_interval
+		self.worker = None
+		self.__passwordhashes: dict[str, str] = {}
+	
+	@contextmanager
+	def connect(self) -> Iterator[MoodleAdapterOpen]:
+		if self.exec_uid != getuid():
+			raise OSError(f"Must run as {getpwuid(self.exec_uid).pw_name}, {getpwuid(getuid()).pw_name} instead")
+		
+		self.enable_maintenance()
+		start = perf_counter()
+		try:
+			yield self
+		finally:
+			self.disable_maintenance()
+			end = perf_counter()
+			self.metrics.downtime += end - start
+			Trace.complete("maintenance mode", "moodle", start, end)
+
+	def prepare(self, token: str) -> None:
+		if self.exec_uid != getuid():
+			raise OSError(f"Must run as {getpwuid(self.exec_uid).pw_name}, {getpwuid(getuid()).pw_name} instead")
+		if token in self.__passwordhashes:
+			return
+		stdout = self.__run_code(f"echo hash_internal_user_password('{e(token)}');", True)
+		assert stdout is not None
+		self.__passwordhashes[token] = stdout.strip()
+	
+	@contextmanager
+	def resident(self) -> Iterator[PhpWorker]:
+		""" runs scripts in a resident worker instead of a process each while this is open """
+		if self.exec_uid != getuid():
+			raise OSError(f"Must run as {getpwuid(self.exec_uid).pw_name}, {getpwuid(getuid()).pw_name} instead")
+		if self.profile:
+			Logger.warning("profiling is not supported with a resident worker")
+			self.profile = False
+
+		worker = PhpWorker(self.moodledir)
+		worker.start()
+		self.worker = worker
+		try:
+			yield worker
+		finally:
+			self.worker = None
+			worker.stop()
+
+	def enable_maintenance(self) -> None:
+		""" enables moodle maintenance mode """
+		self.__run_script(SCRIPTNAME.MAINTENANCE, ("--enable",))
+
+	def disable_maintenance(self) -> None:
+		""" disables moodle maintenance mode """
+		self.__run_script(SCRIPTNAME.MAINTENANCE, ("--disable",))
+	
+	@_adapter_method
+	def clear(self) -> None:
+		self.__run_code(PHP_CLEAR)
+
+	@_adapter_method
+	def add_users(self, users: Collection[mUser], token: str) -> None:
+		new = [user for user in users if user.moodleid_ is None]
+		Progress.advance(len(users) - len(new))
+		if new:
+			ids = self.__run_code_ids(php_add_users(new, token, self.refs, self.commit_interval, self.__passwordhashes.get(token)), ["user/lib"])
+			for userID, user in zip(ids, new, strict=True):
+				user.moodleid = userID
+				Progress.advance()
+		# get eduplanner users - this creates them for future use
+		# NOTE: only once the script is done, since the users aren't committed before that
+		for user in users:
+			self.__run_webservice_function("user_get_user", {}, as_user=user.moodleid)
+			Progress.advance()
+
+	@_adapter_method
+	def add_courses(self, courses: Collection[mCourse]) -> None:
+		ids = self.__run_code_ids(php_add_courses(courses, self.refs, self.commit_interval), ['course/lib'])
+		for courseID, course in zip(ids, courses, strict=True):
+			Logger.success(f"Created course '{course.name}' with ID {courseID}")
+			course.moodleid = courseID
+			Progress.advance()
+
+	@_adapter_method
+	def add_user_enrols(self, user: mUser, courses: Collection[mCourse]) -> None:
+		self.__run_code(php_add_user_enrols([(user, courses)], self.refs, self.commit_interval))
+		Progress.advance(len(courses))
+
+	@_adapter_method
+	def add_tasks(self, tasks: Collection[tuple[mCourse, mTask]]) -> None:
+		ids = self.__run_code_ids(php_add_tasks(tasks, self.refs, self.commit_interval), ["course/modlib", "lib/datalib"])
+		for taskID, (course, task) in zip(ids, tasks, strict=True):
+			task.moodleid = taskID
+			Progress.advance()
+			Logger.debug(lambda: f"Created task '{task.name}' in course '{course.name}' with ID {taskID}")
+
+	@_adapter_method
+	def add_submissions(self, tasks: Collection[tuple[mUser, mTask]]) -> None:
+		self.__run_code(php_add_submissions(tasks, self.refs))
+		Progress.advance(len(tasks))
+
+	@_adapter_method
+	def add_grades(self, tasks: Collection[tuple[mUser, mTask]]) -> None:
+		self.__run_code(php_add_grades(tasks, self.refs, self.commit_interval), imports=["mod/assign/locallib"])
+		Progress.advance(len(tasks))
   
-	def add_plans(self, plans: Collection[Plan]) -> None:
+	@_adapter_method
+	def add_kanban_entries(self, entries: Collection[tuple[mUser, mTask, KanbanColumn]]) -> None:
+		if not entries:
+			return # not worth a process
+		self.__run_code(php_add_kanban_entries(entries, self.refs))
+		Progress.advance(len(entries))
+
+	@_adapter_method
+	def add_reservations(self, reservations: Collection[tuple[Slot, Reservation]]) -> None:
+		if not reservations:
+			return # not worth a process
+		self.__run_code(php_add_reservations(reservations, self.refs))
+		Progress.advance(len(reservations))
+
+	@_adapter_method
+	def add_notifications(self, notifications: Collection[tuple[mUser, Notification]]) -> None:
+		if not notifications:
+			return # not worth a process
+		self.__run_code(php_add_notifications(notifications, self.refs))
+		Progress.advance(len(notifications))
+
+	def lookup_users(self, users: Iterable[mUser]) -> list[mUser]:
+		stdout = self.__run_code(f"echo json_encode($DB->get_records_menu('{DBTable.USERS}', ['deleted' => 0], '', 'username, id'));", True)
+		assert stdout is not None
+		ids = json.loads(stdout) or {} # an empty array is encoded as a list
+		missing = []
+		for user in users:
+			moodleid = ids.get(moodle_username(user))
+			if moodleid is None:
+				missing.append(user)
+			else:
+				user.moodleid = int(moodleid)
+		return missing
+
+	def lookup_slots(self, slots: Iterable[Slot]) -> list[Slot]:
+		""" sets the moodle IDs of slots created by an earlier populate run
+
+		NOTE: slots with the same time, place and size are told apart by the order they were created in
+
+		:return list[Slot]: the slots that don't exist in moodle
+		"""
+		stdout = self.__run_code(
+			f"echo json_encode(array_values($DB->get_records('{DBTable.LBP_SLOTS}', null, 'id', 'id, startunit, duration, weekday, room, size')));",
+			True,
+		)
+		assert stdout is not None
+		ids: dict[tuple[int, int, int, str, int], list[int]] = {}
+		for record in json.loads(stdout):
+			key = (int(record['startunit']), int(record['duration']), int(record['weekday']), record['room'], int(record['size']))
+			ids.setdefault(key, []).append(int(record['id']))
+		missing = []
+		for slot in slots:
+			candidates = ids.get((slot.startunit, slot.duration, int(slot.weekday), slot.room, slot.capacity))
+			if candidates:
+				slot.moodleid = candidates.pop(0)
+			else:
+				missing.append(slot)
+		return missing
+
+	def lookup_reservations(self, day: date) -> list[tuple[int, int]]:
+		""" which slots are reserved for whom on a day
+
+		:return list[tuple[int, int]]: moodle IDs of the slot and the student, per reservation
+		"""
+		stdout = self.__run_code(
+			f"echo json_encode(array_values($DB->get_records('{DBTable.LBP_RESERVATIONS}', ['date' => '{day.isoformat()}'], '', 'id, slotid, userid')));",
+			True,
+		)
+		assert stdout is not None
+		return [(int(record['slotid']), int(record['userid'])) for record in json.loads(stdout)]
+
+	def call_webservice(self, function: str, parameters: dict, as_user: int, namespace: str = "local_lbplanner", check: bool = True) -> Any:
+		""" calls a webservice function as a user, outside of populating (e.g. for load tests)
+
+		NOTE: like everything else, this exits if the function fails
+
+		:param bool check: whether to exit if the function reports an error, instead of returning {"error": {...}}
+		"""
+		return self.__run_webservice_function(function, parameters, namespace, as_user, check)
+
+	@_adapter_method
+	def record_epoch(self) -> None:
+		self.__run_code(php_record_epoch(self.refs))
+
+	@_adapter_method
+	def rebase(self) -> int | None:
+		stdout = self.__run_code(php_rebase(int(NOW.timestamp())), True)
+		assert stdout is not None
+		return int(stdout) if stdout else None
+
+	@_adapter_method
+	def add_plans(self, plans: Collection[Plan], checkpoint: Checkpoint | None = None) -> None:
 		for plan in plans:
-			Logger.debug(f"Creating plan '{plan.name}' owned by user ID {plan.owner.moodleid} with members {[m.moodleid for m in plan.members]}")
-			self.__create_plan(plan)
-			Logger.debug(f"Created plan '{plan.name}' for owner ID {plan.owner.moodleid}")
+			Logger.debug(lambda: f"Creating plan '{plan.name}' owned by user ID {plan.owner.moodleid} with members {[m.moodleid for m in plan.members]}")
+			self.__create_plan(plan, checkpoint)
+			Logger.debug(lambda: f"Created plan '{plan.name}' for owner ID {plan.owner.moodleid}")
 
-	def add_slots(self, slots: Collection[Slot]) -> None:
+	@_adapter_method
+	def add_slots(self, slots: Collection[Slot], checkpoint: Checkpoint | None = None) -> None:
 		for slot in slots:
-			Logger.debug(f"Creating slot starting at unit {slot.startunit} on weekday {slot.weekday} in room '{slot.room}' with capacity {slot.capacity}")
-			self.__create_slot(slot)
-			Logger.debug(f"Created slot ID {slot.moodleid} starting at unit {slot.startunit} on weekday {slot.weekday}")
-	
+			Logger.debug(lambda: f"Creating slot starting at unit {slot.startunit} on weekday {slot.weekday} in room '{slot.room}' with capacity {slot.capacity}")
+			self.__create_slot(slot, checkpoint)
+			Logger.debug(lambda: f"Created slot ID {slot.moodleid} starting at unit {slot.startunit} on weekday {slot.weekday}")
+
+	def __step(self, checkpoint: Checkpoint | None, stage: str, key: str, step: str, call: Callable[[], int | None]) -> int | None:
+		""" makes a call that's a step of creating something, unless the checkpoint has it as done already
 
-	def __create_slot(self, slot: Slot) -> None:
+		NOTE: the plugin refuses most of these when repeated (e.g. inviting a member twice), so resuming has to skip them
+
+		:param str stage: the stage creating it
+		:param str key: identifies what is being created within the stage
+		:param str step: identifies the step, e.g. "invite:alice"
+		:param Callable call: makes the call, returning the moodle ID it created if later steps need it
+		:return int|None: the moodle ID the step created, now or before resuming
+		"""
+		if checkpoint is not None and checkpoint.step_done(stage, key, step):
+			Logger.debug(lambda: f"Skipping {step} of {key}, which was done before resuming")
+			moodleid = checkpoint.step_id(stage, key, step)
+		else:
+			moodleid = call()
+			if checkpoint is not None:
+				checkpoint.record_step(stage, key, step, moodleid)
+		Progress.advance()
+		return moodleid
+
+	def __create_slot(self, slot: Slot, checkpoint: Checkpoint | None) -> None:
 		""" creates a slot in moodle """
-		# create slot 
-		result = self.__run_webservice_function("slots_create_slot", {
-			"startunit": slot.startunit,
-			"duration": slot.duration,
-			"weekday": slot.weekday,
-			"room": slot.room,
-			"size": slot.capacity,
-		})
-		slot.moodleid = result['id']
-		
-		# add mappings
-		Logger.debug("Adding slot mappings...")
-		for mapping in slot.mappings:
+		def create() -> int:
+			result = self.__run_webservice_function("slots_create_slot", {
+				"startunit": slot.startunit,
+				"duration": slot.duration,
+				"weekday": slot.weekday,
+				"room": slot.room,
+				"size": slot.capacity,
+			})
+			return result['id']
+
+		def add_mapping(mapping: SlotMapping) -> int:
 			result = self.__run_webservice_function("slots_add_slot_filter", {
 				"slotid": slot.moodleid,
 				"courseid": mapping.course.moodleid,
 				"vintage": mapping.clazz.value,
 			})
-			mapping.moodleid = result['id']
-			Logger.debug(f"Added mapping {mapping.moodleid} to slot {slot.moodleid}")
+			Logger.debug(lambda: f"Added mapping {result['id']} to slot {slot.moodleid}")
+			return result['id']
 
-		
-		# add supervisors
-		Logger.debug("Adding slot supervisors...")
-		for supervisor in slot.supervisors:
+		def add_supervisor(supervisor: mUser) -> None:
 			self.__run_webservice_function("slots_add_slot_supervisor", {
 				"slotid": slot.moodleid,
 				"userid": supervisor.moodleid,
 			})
-			Logger.debug(f"Added supervisor {supervisor.moodleid} to slot {slot.moodleid}")
-  
-	def __create_plan(self, plan: Plan) -> None:
+			Logger.debug(lambda: f"Added supervisor {supervisor.moodleid} to slot {slot.moodleid}")
+
+		# the slot's ID is recorded before anything is added to it, so resuming doesn't leave a half-created copy behind
+		slotid = self.__step(checkpoint, "slots", slot.id, "create", create)
+		assert slotid is not None
+		slot.moodleid = slotid
+
+		Logger.debug("Adding slot mappings...")
+		for i, mapping in enumerate(slot.mappings):
+			mappingid = self.__step(checkpoint, "slots", slot.id, f"mapping:{i}", lambda: add_mapping(mapping))
+			assert mappingid is not None
+			mapping.moodleid = mappingid
+
+		Logger.debug("Adding slot supervisors...")
+		for supervisor in slot.supervisors:
+			self.__step(checkpoint, "slots", slot.id, f"supervisor:{supervisor.id}", lambda: add_supervisor(supervisor))
+
+	def __create_plan(self, plan: Plan, checkpoint: Checkpoint | None) -> None:
 		""" creates a plan in moodle """
+		# every student owns exactly one plan
+		key = plan.owner.id
 
-		invites = {}
-	
-		# send invites as plan owner to members
-		Logger.debug("Inviting plan members...")
-		for member in plan.members:
-			
-			result =  self.__run_webservice_function("plan_invite_user", {
+		def invite(member: mUser) -> int:
+			result = self.__run_webservice_function("plan_invite_user", {
 				"inviteeid": member.moodleid
 			}, as_user=plan.owner.moodleid)
-			invites[member.moodleid] = result['id']
-			Logger.debug(f"Invited member {member.moodleid} with invite ID {result['id']}")
-		
-		# accept invites as members
-		Logger.debug("Accepting plan invites...")
-		for user_id, invite_id in invites.items():
+			Logger.debug(lambda: f"Invited member {member.moodleid} with invite ID {result['id']}")
+			return result['id']
+
+		def accept(member: mUser, invite_id: int) -> None:
 			self.__run_webservice_function("plan_accept_invite", {
 				"inviteid": invite_id
-			}, as_user=user_id)
-			Logger.debug(f"User {user_id} accepted invite ID {invite_id}")
-      
-		# set member access to write
-		Logger.debug("Setting plan member access...")
-		for member in plan.members:
+			}, as_user=member.moodleid)
+			Logger.debug(lambda: f"User {member.moodleid} accepted invite ID {invite_id}")
+
+		def update_access(member: mUser) -> None:
 			self.__run_webservice_function("plan_update_access", {
 				"accesstype": 1,
 				"memberid": member.moodleid
 			}, as_user=plan.owner.moodleid)
-			Logger.debug(f"Set member {member.moodleid} access to write")
-	
-	
-		# rename plan to plan.name
-		Logger.debug("Renaming plan...")
-		self.__run_webservice_function("plan_update_plan", {
-      		"planname": plan.name,
-      	}, as_user=plan.owner.moodleid)
-		Logger.debug(f"Renamed plan to '{plan.name}'")
-		
-  
-		now = datetime.now(UTC)
+			Logger.debug(lambda: f"Set member {member.moodleid} access to write")
 
+		def rename() -> None:
+			self.__run_webservice_function("plan_update_plan", {
+				"planname": plan.name,
+			}, as_user=plan.owner.moodleid)
+			Logger.debug(lambda: f"Renamed plan to '{plan.name}'")
 
-  
-		# add deadlines to owner's plan
-		Logger.debug("Adding plan deadlines...")
-		for deadline in plan.deadlines:
+		def set_deadline(deadline: Deadline) -> None:
 			# UTC+0 unix timestamp from start/end
-			start = now + timedelta(days=deadline.deadlinestart)
-			end = start + timedelta(days=deadline.duration)
+			start = self.refs.time(deadline.deadlinestart)
+			end = self.refs.time(deadline.deadlinestart + deadline.duration)
 			self.__run_webservice_function("plan_set_deadline", {
 				"moduleid": deadline.task.moodleid,
-				"deadlinestart": int(start.timestamp()),
-				"deadlineend": int(end.timestamp()),
+				"deadlinestart": start,
+				"deadlineend": end,
 			}, as_user=plan.owner.moodleid)
-			Logger.debug(f"Added deadline for task {deadline.task.moodleid} from {start.isoformat()} to {end.isoformat()}")
+			Logger.debug(lambda: f"Added deadline for task {deadline.task.moodleid} from {start} to {end}")
+
+		# send invites as plan owner to members
+		Logger.debug("Inviting plan members...")
+		invites = {}
+		for member in plan.members:
+			invites[member.id] = self.__step(checkpoint, "plans", key, f"invite:{member.id}", lambda: invite(member))
 
+		# accept invites as members
+		Logger.debug("Accepting plan invites...")
+		for member in plan.members:
+			invite_id = invites[member.id]
+			assert invite_id is not None
+			self.__step(checkpoint, "plans", key, f"accept:{member.id}", lambda: accept(member, invite_id))
+
+		# set member access to write
+		Logger.debug("Setting plan member access...")
+		for member in plan.members:
+			self.__step(checkpoint, "plans", key, f"access:{member.id}", lambda: update_access(member))
+
+		# rename plan to plan.name
+		Logger.debug("Renaming plan...")
+		self.__step(checkpoint, "plans", key, "rename", rename)
+
+		# add deadlines to owner's plan
+		Logger.debug("Adding plan deadlines...")
+		for deadline in plan.deadlines:
+			self.__step(checkpoint, "plans", key, f"deadline:{deadline.task.id}", lambda: set_deadline(deadline))
 
-	def __run_code(self, code: str, communicate: bool | str = False, imports: Iterable[str] = []) -> str | None:
+
+	def __run_code(self, code: str, communicate: bool = False, imports: Iterable[str] = [], function: str | None = None) -> str | None:
 		""" Popens code and stuff
 
 		:param str code: the php code to execute
-		:param bool|str: communicate: whether to communicate with the script - will be passed to stdin if string
+		:param bool communicate: whether to read what the script prints
+		:param str|None function: the webservice function this code calls, for profiling purposes
 		:return str|None: stdout if communicate was true, None otherwise
 		"""
+		if self.worker is not None:
+			return self.__run_in_worker(self.worker, code, communicate, imports, function)
+		if self.profile and not communicate:
+			# the profile trailer is written to stdout, so we always need to read it
+			communicate = True
 		out: bytes | None = None
 		err: bytes | None = None
+		start = perf_counter()
 		_p, finalcode = self.__popen_code(code, imports)
 		with _p as p:
 			if communicate:
-				out, err = p.communicate(communicate if isinstance(communicate, str) else None)
+				out, err = p.communicate()
 			
-			if p.wait() != 0:
-				if not communicate:
-					assert p.stderr is not None
-					err = p.stderr.read()
-				
-				assert err is not None
-
-				Logger.error("Encountered error in injected code")
-				Logger.debug(err.decode('utf-8'))
-				Logger.code(finalcode)
-				exit(1)
+			returncode = p.wait()
+			if returncode != 0 and not communicate:
+				assert p.stderr is not None
+				err = p.stderr.read()
+		end = perf_counter()
+		Trace.complete(function or self.method or "php", "php", start, end, {"pid": p.pid, "method": self.method}, php=True)
+		
+		self.metrics.record_process(
+			end - start,
+			code_bytes=len(finalcode.encode('utf-8')),
+			output_bytes=(0 if out is None else len(out)) + (0 if err is None else len(err)),
+		)
+		
+		if returncode != 0:
+			assert err is not None
+
+			Logger.error("Encountered error in injected code")
+			Logger.debug(err.decode('utf-8'))
+			Logger.code(finalcode)
+			exit(1)
+		
+		if self.profile and out is not None:
+			out = self.__strip_profile(out, function)
 		
 		return None if out is None else out.decode('utf-8')
 
-	def __popen_code(self, code: str, imports: Iterable[str] = []) -> tuple[Popen, str]:
+	def __run_code_ids(self, code: str, imports: Iterable[str] = []) -> Iterator[int]:
+		""" runs code that echoes NUL-terminated moodle IDs, yielding each one as soon as the script prints it
+
+		NOTE: the script is only waited for (and its errors reported) once the iterator is exhausted, so always
+		      consume all of it - e.g. zip(ids, objects, strict=True), with the IDs first
+		:param str code: the php code to execute
+		:return Iterator[int]: the IDs in the order they were printed
+		"""
+		if self.worker is not None:
+			# the worker replies in one go anyway
+			stdout = self.__run_in_worker(self.worker, code, True, imports)
+			assert stdout is not None
+			yield from (int(moodleid) for moodleid in stdout.split('\0')[:-1])
+			return
+
+		outbytes = 0
+		pending = b""
+		start = perf_counter()
+		# stderr goes to a file, so a chatty script can't block on it while we're only reading stdout
+		with TemporaryFile() as errfile:
+			_p, finalcode = self.__popen_code(code, imports, errfile)
+			with _p as p:
+				assert p.stdout is not None
+				while chunk := p.stdout.read1(STREAM_CHUNK):
+					outbytes += len(chunk)
+					*moodleids, pending = (pending + chunk).split(b"\0")
+					for moodleid in moodleids:
+						yield int(moodleid)
+				returncode = p.wait()
+			end = perf_counter()
+			errfile.seek(0)
+			err = errfile.read()
+		Trace.complete(self.method or "php", "php", start, end, {"pid": p.pid, "method": self.method}, php=True)
+
+		self.metrics.record_process(
+			end - start,
+			code_bytes=len(finalcode.encode('utf-8')),
+			output_bytes=outbytes + len(err),
+		)
+
+		if returncode != 0:
+			Logger.error("Encountered error in injected code")
+			Logger.debug((pending + err).decode('utf-8'))
+			Logger.code(finalcode)
+			exit(1)
+
+		if self.profile:
+			self.__strip_profile(pending, None)
+
+	def __run_in_worker(
+		self,
+		worker: PhpWorker,
+		code: str,
+		communicate: bool,
+		imports: Iterable[str],
+		function: str | None = None,
+	) -> str | None:
+		""" runs code in a resident worker, same as __run_code otherwise """
+		requires = "".join(f"require_once('{pathjoin(self.moodledir, f'{i}.php')}');" for i in imports)
+		start = perf_counter()
+		ok, out = worker.run(requires + code)
+		end = perf_counter()
+		Trace.complete(function or self.method or "php", "php", start, end, {"pid": worker.pid, "method": self.method}, php=True)
+		self.metrics.record_process(end - start, code_bytes=len(code.encode('utf-8')), output_bytes=len(out))
+
+		if not ok:
+			Logger.error("Encountered error in injected code")
+			Logger.debug(out.decode('utf-8'))
+			Logger.code(code)
+			exit(1)
+
+		return out.decode('utf-8') if communicate else None
+
+	def __strip_profile(self, out: bytes, function: str | None) -> bytes:
+		""" removes the profile trailer from a script's output and records it
+
+		:param bytes out: everything the script wrote to stdout
+		:param str|None function: the webservice function the script called, if any
+		:return bytes: the output without the trailer
+		"""
+		out, sep, trailer = out.rpartition(PROFILE_MARKER.encode('utf-8'))
+		if not sep:
+			Logger.warning("script did not report a profile")
+			return trailer
+		
+		profile = json.loads(trailer)
+		self.metrics.record_profile(
+			self.method or "other",
+			function,
+			profile['time'],
+			profile['memory'],
+			profile['reads'],
+			profile['writes'],
+		)
+		return out
+
+	def __popen_code(self, code: str, imports: Iterable[str] = [], stderr: Any = PIPE) -> tuple[Popen, str]:
 		""" Popens custom php code with moodle context
 
 		:param str code: the php code to execute
+		:param Any stderr: where the process' stderr goes (see Popen)
 		:return tuple[Popen, str]: the running process and the bootstrapped code
 		"""
 		
-		imports = ['config', *imports]
+		bootstrap = "$lbpprofilestart = microtime(true);\n" if self.profile else ""
+		bootstrap += php_bootstrap(self.moodledir, imports)
 		
-		bootstrap = """\
-define('CLI_SCRIPT', true);
-ini_set('display_errors', '1');
-ini_set('display_startup_errors', '1');
-error_reporting(E_ALL);
+		if self.profile:
+			# a shutdown function still runs if the code exits early
+			bootstrap += f"""
+register_shutdown_function(function() use ($lbpprofilestart) {{
+	global $DB;
+	echo "{PROFILE_MARKER}" . json_encode([
+		'time' => microtime(true) - $lbpprofilestart,
+		'memory' => memory_get_peak_usage(),
+		'reads' => $DB->perf_get_reads(),
+		'writes' => $DB->perf_get_writes(),
+	]);
+}});
 """
 		
-		for i in imports:
-			# TODO: check if file exists for better exception reporting
-			fn = f"{i}.php"
-			bootstrap += f"require_once('{pathjoin(self.moodledir, fn)}');"
-		
 		toexecute = f"{bootstrap}{code}"
 		
 		return Popen(
 			["php", '-r', toexecute, '--'],
-			stdout=PIPE, stderr=PIPE
+			stdout=PIPE, stderr=stderr
 		), toexecute
 
+	def execute(self, fp: str) -> str:
+		""" runs a self-contained php program (e.g. one emitted by compiler.compile_populate)
+
+		:param str fp: path to the program
+		:return str: the program's stdout
+		"""
+		out = self.__run_file(fp, (), True)
+		assert out is not None
+		return out
+
 	def __run_script(self, name: SCRIPTNAME, params: Iterable[str], communicate: bool | str = False) -> str | None:
 		""" Popens script and passes parameters to it
 
@@ -469,73 +1233,78 @@ error_reporting(E_ALL);
 		:param bool|str communicate: whether to communicate with the script - will be passed to stdin if string
 		:return str|None: stdout if communicate was true, None otherwise
 		"""
-  
+		return self.__run_file(pathjoin(self.script_folder, f"{name}.php"), params, communicate)
+
+	def __run_file(self, fp: str, params: Iterable[str], communicate: bool | str = False) -> str | None:
+		""" Popens a php file and passes parameters to it
+
+		:param str fp: path to the php file to execute
+		:param Iterable[str] params: parameters to pass to the script
+		:param bool|str communicate: whether to communicate with the script - will be passed to stdin if string
+		:return str|None: stdout if communicate was true, None otherwise
+		"""
+		params = tuple(params)
 		out: bytes | None = None
 		err: bytes | None = None
-		with self.__popen_script(name, params) as p:
+		stdin = communicate.encode('utf-8') if isinstance(communicate, str) else None
+		start = perf_counter()
+		with self.__popen_file(fp, params) as p:
 			if communicate:
-				out, err = p.communicate(communicate if isinstance(communicate, str) else None)
+				out, err = p.communicate(stdin)
 			
-			if p.wait() != 0:
-				if not communicate:
-					assert p.stderr is not None
-					err = p.stderr.read()
-				
-				assert err is not None
-
-				Logger.error(f"Encountered error in script {name}:")
-				Logger.debug(f"{err.decode('utf-8')}")
-				Logger.debug(f"Script Parameters: {params}")
-				exit(1)
+			returncode = p.wait()
+			if returncode != 0 and not communicate:
+				assert p.stderr is not None
+				err = p.stderr.read()
+		end = perf_counter()
+		Trace.complete(basename(fp), "php", start, end, {"pid": p.pid, "params": list(params)}, php=True)
+		
+		self.metrics.record_process(
+			end - start,
+			payload_bytes=(0 if stdin is None else len(stdin)) + sum(len(param.encode('utf-8')) for param in params),
+			output_bytes=(0 if out is None else len(out)) + (0 if err is None else len(err)),
+		)
+		
+		if returncode != 0:
+			assert err is not None
+
+			Logger.error(f"Encountered error in script {fp}:")
+			Logger.debug(f"{err.decode('utf-8')}")
+			Logger.debug(lambda: f"Script Parameters: {params}")
+			exit(1)
 		
 		return None if out is None else out.decode('utf-8')
 
-	def __popen_script(self, name: SCRIPTNAME, params: Iterable[str]) -> Popen:
-		""" Popens script and passes parameters to it
+	def __popen_file(self, fp: str, params: Iterable[str]) -> Popen:
+		""" Popens a php file and passes parameters to it
 
-		:param SCRIPTNAME name: name of the script to execute
+		:param str fp: path to the php file to execute
 		:param Iterable[str] params: parameters to pass to the script
 		:return Popen: the running process
 		"""
 		return Popen(
-			["php", '-f', pathjoin(self.script_folder, f"{name}.php"), '--', *params],
+			["php", '-f', fp, '--', *params],
 			stdout=PIPE, stderr=PIPE
 		)
   
-	def __run_webservice_function(self, function: str, parameters: dict, namespace: str = "local_lbplanner", as_user: int = 2) -> Any:
+	def __run_webservice_function(self, function: str, parameters: dict, namespace: str = "local_lbplanner", as_user: int = 2, check: bool = True) -> Any:
 		""" Calls a moodle webservice function via CLI
 
 		:param str functionname: the name of the function to call
 		:param dict parameters: the parameters to pass to the function
 		:param str namespace: the namespace of the function
 		:param int as_user: the id of the user to run this as (1 means guest, 2 means admin, everything else is normal users)
+		:param bool check: whether to exit if the function reports an error
 		:return Popen: the running process
 		"""
-		Logger.debug(f"Calling webservice function {namespace}_{function} as user ID {as_user} with parameters {parameters}")
-		# NOTE: this is mostly taken from external_api::call_external_function(…);
-		json_data = self.__run_code(f"""\
-			$USER = core_user::get_user({as_user}, '*', MUST_EXIST);
-			$externalfunctioninfo = external_api::external_function_info('{namespace}_{function}');
-			// validate parameters
-			$callable = [$externalfunctioninfo->classname, 'validate_parameters'];
-			$params = call_user_func(
-                $callable,
-                $externalfunctioninfo->parameters_desc,
-                {php_serialize(parameters)}
-            );
-			$params = array_values($params);
-			// call API function
-			$result = call_user_func_array([$externalfunctioninfo->classname, $externalfunctioninfo->methodname], $params);
-			// validate result
-			if ($externalfunctioninfo->returns_desc !== null) {{
-				$result = call_user_func([$externalfunctioninfo->classname, 'clean_returnvalue'], $externalfunctioninfo->returns_desc, $result);
-			}}
-			// return result
-			echo json_encode($result);
-			""",
-			True,
-			["lib/externallib"]
-		)
+		Logger.debug(lambda: f"Calling webservice function {namespace}_{function} as user ID {as_user} with parameters {parameters}")
+		with Trace.span(f"{namespace}_{function}", "webservice", user=as_user):
+			json_data = self.__run_code(
+				f"{PHP_CALL_EXTERNAL}echo json_encode({php_call_external(function, parameters, f'{as_user}', namespace)});",
+				True,
+				["lib/externallib"],
+				f"{namespace}_{function}",
+			)
   
 		if json_data is None or len(json_data.strip()) == 0:
 			Logger.debug("Webservice function returned no data")
@@ -547,7 +1316,7 @@ error_reporting(E_ALL);
 			Logger.debug("Webservice function returned null")
 			return None
   
-		if 'error' in json_result:
+		if 'error' in json_result and check:
 			Logger.error(f"Webservice function {namespace}_{function} returned error: {json_result['error']['message']}")
 			Logger.debug(json_data)
 			exit(1)
@@ -0,0 +1,312 @@
+from collections.abc import Sequence
+from dataclasses import asdict
+from math import log
+from os.path import join as pathjoin
+from random import Random
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Any
+import json
+
+import yaml
+
+from . import __version__
+from .logger import Logger
+from .config import Config
+from .model import Capability, Clazz, KanbanColumn, NotificationType, TaskStatus, Weekday
+from .adapter_memory import MemoryMoodle, Latency
+from .populate import populate
+
+#
+# NOTE: The benchmark runs populate() against MemoryMoodle, so the numbers only cover the python side plus the
+#       number of PHP processes a real run would spawn. That's still the part that scales with the config size.
+#       With a latency model, wall times also include what those processes and DB writes would roughly cost.
+#
+
+TASKS_PER_COURSE = 5
+STATUSES_PER_STUDENT = 4
+MEMBERS_PER_PLAN = 2
+DEADLINES_PER_PLAN = 2
+KANBAN_PER_STUDENT = 6
+NOTIFICATIONS_PER_STUDENT = 3
+SLOT_CAPACITY = 20
+RESERVATION_WEEKS = 2
+
+
+def generate_config(dp: str, size: int, seed: int = 0) -> None:
+	""" writes a complete set of config files with `size` students to a directory
+
+	:param str dp: directory to write the config files to
+	:param int size: number of students to generate, everything else is derived from it
+	:param int seed: seed for the random task assignment, so runs are comparable
+	"""
+	rng = Random(seed)
+	clazzes = list(Clazz)
+
+	courses = [
+		{
+			"name": f"Course {c:03}",
+			"tasks": [
+				{"name": f"Task {t:02}", "description": f"Task {t} of course {c}", "due": t + 1, "type": "assignment"}
+				for t in range(TASKS_PER_COURSE)
+			],
+		}
+		for c in range(max(2, size // 50))
+	]
+	taskids = [f"course_{c:03}.task_{t:02}" for c in range(len(courses)) for t in range(TASKS_PER_COURSE)]
+
+	students = [
+		{
+			"name": f"Student {u:05}",
+			"capabilities": [Capability.STUDENT.value],
+			"class": clazzes[u % len(clazzes)].value,
+			"task-status": {
+				taskid: rng.choice((TaskStatus.SUBMITTED.value, TaskStatus.COMPLETED.value))
+				for taskid in rng.sample(taskids, min(STATUSES_PER_STUDENT, len(taskids)))
+			},
+			"kanban": {
+				taskid: rng.choice(list(KanbanColumn)).value
+				for taskid in rng.sample(taskids, min(KANBAN_PER_STUDENT, len(taskids)))
+			},
+			"notifications": [
+				{"type": rng.choice(list(NotificationType)).value, "time": -rng.randrange(30), "read": rng.random() < 0.5}
+				for _ in range(NOTIFICATIONS_PER_STUDENT)
+			],
+		}
+		for u in range(size)
+	]
+	teachers = [
+		{"name": f"Teacher {u:03}", "capabilities": [Capability.TEACHER.value]}
+		for u in range(max(1, size // 20))
+	]
+
+	slots = [
+		{
+			"room": f"R{s:03}",
+			"disambiguate": s,
+			"capacity": SLOT_CAPACITY,
+			"startunit": 1 + s % 8,
+			"duration": 2,
+			"weekday": Weekday(1 + s % 5).name.lower(),
+			"mappings": [{"course": f"course_{s % len(courses):03}", "class": clazzes[s % len(clazzes)].value}],
+			"supervisors": [f"teacher_{s % len(teachers):03}"],
+			"reservations": [
+				{"user": f"student_{u:05}", "week": week}
+				for week in range(RESERVATION_WEEKS)
+				for u in rng.sample(range(size), min(SLOT_CAPACITY, size))
+			],
+		}
+		for s in range(max(1, size // 30))
+	]
+
+	# plans use disjoint groups of students, since joining a plan means leaving your own
+	groupsize = 1 + MEMBERS_PER_PLAN
+	plans = [
+		{
+			"name": f"Plan {p:04}",
+			"owner": f"student_{p * groupsize:05}",
+			"members": [f"student_{p * groupsize + m:05}" for m in range(1, groupsize)],
+			"deadlines": [
+				{"task": taskid, "deadlinestart": d, "duration": 1}
+				for d, taskid in enumerate(rng.sample(taskids, DEADLINES_PER_PLAN))
+			],
+		}
+		for p in range(size // (groupsize * 5))
+	]
+
+	for name, data in (
+		("courses", {"courses": courses}),
+		("users", {"password": "1234", "users": students + teachers}),
+		("slots", {"slots": slots}),
+		("plans", {"plans": plans}),
+	):
+		with open(pathjoin(dp, f"{name}.yml"), "w") as f:
+			yaml.safe_dump(data, f, sort_keys=False)
+
+
+def run_once(size: int, seed: int = 0, latency: Latency | None = None) -> dict[str, Any]:
+	""" generates a config of the given size and populates MemoryMoodle with it
+
+	:param int size: number of students to generate
+	:param int seed: seed for the config generator
+	:param Latency|None latency: how long MemoryMoodle should pretend calls take
+	:return dict[str, Any]: total time, process spawns and per-stage numbers of this run
+	"""
+	with TemporaryDirectory(prefix="eduplanner_bench_") as dp:
+		generate_config(dp, size, seed)
+		adapter = MemoryMoodle(latency=latency)
+		start = perf_counter()
+		populate(adapter, Config(dp))
+		total = perf_counter() - start
+
+	return {
+		"size": size,
+		"time": total,
+		"processes": adapter.metrics.total.processes,
+		"downtime": adapter.metrics.downtime,
+		"items": {
+			"courses": len(adapter.courses),
+			"tasks": len(adapter.tasks),
+			"users": len(adapter.users),
+			"enrols": len(adapter.enrols),
+			"submissions": len(adapter.submissions),
+			"grades": len(adapter.grades),
+			"plans": len(adapter.plans),
+			"slots": len(adapter.slots),
+			"kanban": len(adapter.kanban),
+			"reservations": len(adapter.reservations),
+			"notifications": len(adapter.notifications),
+		},
+		"stages": {stage.name: asdict(stage) for stage in adapter.metrics.stages.values()},
+	}
+
+
+def scaling_exponent(sizes: Sequence[float], times: Sequence[float]) -> float | None:
+	""" fits time = a * size^k and returns k (1 means linear, 2 quadratic and so on)
+
+	:return float|None: the exponent, or None if there's not enough usable data points
+	"""
+	points = [(log(s), log(t)) for s, t in zip(sizes, times) if s > 0 and t > 0]
+	if len(points) < 2:
+		return None
+	mx = sum(x for x, _ in points) / len(points)
+	my = sum(y for _, y in points) / len(points)
+	var = sum((x - mx) ** 2 for x, _ in points)
+	if var == 0:
+		return None
+	return sum((x - mx) * (y - my) for x, y in points) / var
+
+
+def benchmark(
+	sizes: Sequence[int],
+	out: str | None = None,
+	compare: str | None = None,
+	seed: int = 0,
+	latency: Latency | None = None,
+) -> dict[str, Any]:
+	""" runs populate() over configs of increasing size and reports per-stage timings
+
+	:param Sequence[int] sizes: the config sizes (number of students) to run
+	:param str|None out: file to store the results in as JSON
+	:param str|None compare: results of a previous benchmark to compare against
+	:param int seed: seed for the config generator
+	:param Latency|None latency: how long MemoryMoodle should pretend calls take, no time at all if None
+	:return dict[str, Any]: the results
+	"""
+	runs = []
+	for size in sorted(sizes):
+		Logger.info(f"benchmarking populate with {size} students...")
+		runs.append(run_once(size, seed, latency))
+
+	sizes_run = [run["size"] for run in runs]
+	stagenames = list(dict.fromkeys(name for run in runs for name in run["stages"]))
+	scaling = {
+		name: scaling_exponent(sizes_run, [run["stages"].get(name, {}).get("time", 0.0) for run in runs])
+		for name in stagenames
+	}
+	scaling["total"] = scaling_exponent(sizes_run, [run["time"] for run in runs])
+	results = {
+		"version": __version__,
+		"adapter": "memory",
+		"seed": seed,
+		"latency": asdict(latency if latency is not None else Latency()),
+		"runs": runs,
+		"scaling": scaling,
+	}
+
+	print_results(results)
+
+	if compare is not None:
+		with open(compare) as f:
+			print_comparison(json.load(f), results)
+
+	if out is not None:
+		with open(out, "w") as f:
+			json.dump(results, f, indent=4)
+		Logger.success(f"wrote benchmark results to {out}")
+
+	return results
+
+
+def _fmt_exponent(k: float | None) -> str:
+	return "n/a" if k is None else f"n^{k:.2f}"
+
+
+def _fmt_cell(time: float | None, processes: int | None) -> str:
+	cell = "-" if time is None or processes is None else f"{time * 1000:.1f}ms/{processes}"
+	return f"{cell:>18}"
+
+
+def _ratio(old: float, new: float) -> float | None:
+	return None if old == 0 else new / old
+
+
+def _fmt_ratio(ratio: float | None) -> str:
+	return "n/a" if ratio is None else f"{ratio:.2f}x"
+
+
+def print_results(results: dict[str, Any]) -> None:
+	""" prints benchmark results as a table """
+	if Logger.json:
+		Logger.results("benchmark", results)
+		return
+	Logger.flush()
+	runs = results["runs"]
+	stagenames = list(dict.fromkeys(name for run in runs for name in run["stages"]))
+	header = f"{'stage':<18}" + "".join(f"{run['size']:>18}" for run in runs) + f"{'scaling':>10}"
+	print(header)
+	print("-" * len(header))
+	for name in stagenames:
+		cells = ""
+		for run in runs:
+			stage = run["stages"].get(name)
+			cells += _fmt_cell(None, None) if stage is None else _fmt_cell(stage["time"], stage["processes"])
+		print(f"{name:<18}{cells}{_fmt_exponent(results['scaling'].get(name)):>10}")
+	print("-" * len(header))
+	print(
+		f"{'total':<18}"
+		+ "".join(_fmt_cell(run["time"], run["processes"]) for run in runs)
+		+ f"{_fmt_exponent(results['scaling'].get('total')):>10}"
+	)
+	print(f"{'downtime':<18}" + "".join(f"{run['downtime'] * 1000:>16.1f}ms" for run in runs))
+	print("(wall time / PHP processes a real run would spawn)")
+
+
+def compare_results(old: dict[str, Any], new: dict[str, Any]) -> dict[str, Any]:
+	""" the relative change in wall time between two benchmark results for the sizes both contain
+
+	:return dict[str, Any]: the old version, and per size the time ratio (new / old, None if old took no time),
+	                        processes before (None if unknown) and after, and the time ratio per stage
+	"""
+	oldruns: dict[int, dict[str, Any]] = {run["size"]: run for run in old["runs"]}
+	runs = []
+	for run in new["runs"]:
+		prev = oldruns.get(run["size"])
+		if prev is None:
+			continue
+		runs.append({
+			"size": run["size"],
+			"time": _ratio(prev["time"], run["time"]),
+			# results written before processes were counted per stage call them spawns
+			"processes": [prev.get("processes", prev.get("spawns")), run["processes"]],
+			"stages": {
+				name: _ratio(prev["stages"][name]["time"], stage["time"])
+				for name, stage in run["stages"].items()
+				if name in prev["stages"]
+			},
+		})
+	return {"version": old.get("version"), "runs": runs}
+
+
+def print_comparison(old: dict[str, Any], new: dict[str, Any]) -> None:
+	""" prints the relative change in wall time between two benchmark results for the sizes both contain """
+	comparison = compare_results(old, new)
+	if Logger.json:
+		Logger.results("comparison", comparison)
+		return
+	print(f"\ncompared to {comparison['version'] or '?'}:")
+	for run in comparison["runs"]:
+		before, after = run["processes"]
+		print(f"|\t{run['size']} students: {_fmt_ratio(run['time'])} time, {'?' if before is None else before} -> {after} processes")
+		for name, ratio in run["stages"].items():
+			print(f"|\t|\t{name}: {_fmt_ratio(ratio)}")
@@ -0,0 +1,195 @@
+from collections.abc import Iterable
+from os import remove, replace
+from os.path import dirname, exists
+from tempfile import NamedTemporaryFile
+from typing import Any, TextIO
+import json
+
+from .logger import Logger
+from .model import MoodleObject
+
+#
+# NOTE: populate() is only ever resumed with the same config it was started with, so every object can be
+#       found again by its config ID and simply gets its moodle ID re-attached. Plans and slots take several
+#       webservice calls each, which are recorded as steps one by one, so resuming doesn't repeat any that succeeded.
+#       The checkpoint itself is only rewritten when a stage completes. Progress within a stage (items and steps)
+#       is appended to a log next to it instead, so recording it doesn't get slower the more IDs there are.
+#
+
+VERSION = 3
+""" format of checkpoint files - bump this whenever it changes """
+
+
+class Checkpoint:
+	""" remembers how far populate() got, so a run that died can be resumed instead of starting over """
+
+	fp: str
+	""" where the checkpoint is stored """
+	config: str
+	""" hash of the config the run was started with """
+	stages: list[str]
+	""" stages that are done, in order """
+	ids: dict[str, dict[str, int]]
+	""" moodle IDs assigned so far, by kind and config ID """
+	done: dict[str, int]
+	""" how many items of a stage are done, for stages that go one item at a time """
+	steps: dict[str, dict[str, dict[str, int | None]]]
+	""" steps done for items still being created, by stage and item key, with the moodle ID a step created (if any) """
+
+	def __init__(self, fp: str, config: str):
+		self.fp = fp
+		self.config = config
+		self.stages = []
+		self.ids = {}
+		self.done = {}
+		self.steps = {}
+		self.__log: TextIO | None = None
+
+	@property
+	def logfp(self) -> str:
+		""" where progress within the current stage is logged """
+		return f"{self.fp}.log"
+
+	@staticmethod
+	def load(fp: str, config: str) -> 'Checkpoint':
+		""" reads a checkpoint written by an earlier run
+
+		:param str fp: where the checkpoint is stored
+		:param str config: hash of the current config, which has to match the one the checkpoint was written with
+		"""
+		if not exists(fp):
+			Logger.error(f"no checkpoint to resume from at {fp}")
+			exit(1)
+		with open(fp) as f:
+			data = json.load(f)
+		if data.get("version") != VERSION:
+			Logger.error(f"checkpoint {fp} was written by an incompatible version")
+			exit(1)
+		if data["config"] != config:
+			Logger.error(f"config has changed since checkpoint {fp} was written, can't resume")
+			exit(1)
+
+		checkpoint = Checkpoint(fp, config)
+		checkpoint.stages = data["stages"]
+		checkpoint.ids = data["ids"]
+		checkpoint.done = data["done"]
+		if exists(checkpoint.logfp):
+			with open(checkpoint.logfp) as f:
+				lines = f.read().splitlines()
+			for i, line in enumerate(lines):
+				try:
+					entry = json.loads(line)
+				except json.JSONDecodeError:
+					if i == len(lines) - 1:
+						break # the run died while writing it
+					raise
+				checkpoint.__replay(entry)
+		return checkpoint
+
+	def __replay(self, entry: dict[str, Any]) -> None:
+		""" applies an entry of the log, see __append() """
+		stage = entry["stage"]
+		if self.completed(stage):
+			return # the run died between saving the checkpoint and emptying the log
+		if "step" in entry:
+			self.steps.setdefault(stage, {}).setdefault(entry["key"], {})[entry["step"]] = entry["id"]
+		else:
+			self.__advance(stage, entry["key"], entry["ids"])
+
+	def completed(self, stage: str) -> bool:
+		""" whether a stage is already done """
+		return stage in self.stages
+
+	def attach(self, kind: str, objects: Iterable[MoodleObject]) -> None:
+		""" sets the moodle IDs recorded for objects of a kind """
+		ids = self.ids.get(kind, {})
+		for obj in objects:
+			moodleid = ids.get(obj.id) # type: ignore[attr-defined]
+			if moodleid is not None:
+				obj.moodleid = moodleid
+
+	def record(self, kind: str, objects: Iterable[MoodleObject]) -> None:
+		""" remembers the moodle IDs of objects of a kind, skipping those that don't have one yet """
+		ids = self.ids.setdefault(kind, {})
+		for obj in objects:
+			if obj.moodleid_ is not None:
+				ids[obj.id] = obj.moodleid_ # type: ignore[attr-defined]
+
+	def step_done(self, stage: str, key: str, step: str) -> bool:
+		""" whether a step of creating an item was done already
+
+		:param str stage: the stage creating the item
+		:param str key: identifies the item within the stage (e.g. the config ID of a slot)
+		:param str step: identifies the step, e.g. "invite:alice"
+		"""
+		return step in self.steps.get(stage, {}).get(key, {})
+
+	def step_id(self, stage: str, key: str, step: str) -> int | None:
+		""" the moodle ID a step that was done already created, see step_done() """
+		return self.steps.get(stage, {}).get(key, {}).get(step)
+
+	def record_step(self, stage: str, key: str, step: str, moodleid: int | None = None) -> None:
+		""" marks a step of creating an item as done and logs it, see step_done()
+
+		:param int|None moodleid: what the step created, if later steps need it (e.g. an invite to accept)
+		"""
+		self.steps.setdefault(stage, {}).setdefault(key, {})[step] = moodleid
+		self.__append({"stage": stage, "key": key, "step": step, "id": moodleid})
+
+	def complete(self, stage: str) -> None:
+		""" marks a stage as done, saves the checkpoint and empties the log """
+		self.stages.append(stage)
+		self.done.pop(stage, None)
+		self.steps.pop(stage, None)
+		self.save()
+		if self.__log is not None:
+			self.__log.close()
+			self.__log = None
+		if exists(self.logfp):
+			remove(self.logfp)
+
+	def advance(self, stage: str, key: str | None = None, objects: Iterable[MoodleObject] = ()) -> None:
+		""" marks one more item of a stage as done and logs it
+
+		:param str|None key: identifies the item, whose steps are no longer needed (see record_step())
+		:param Iterable[MoodleObject] objects: what the item created, whose moodle IDs are recorded as kind `stage`
+		"""
+		ids = {obj.id: obj.moodleid_ for obj in objects if obj.moodleid_ is not None} # type: ignore[attr-defined]
+		self.__advance(stage, key, ids)
+		self.__append({"stage": stage, "key": key, "ids": ids})
+
+	def __advance(self, stage: str, key: str | None, ids: dict[str, int]) -> None:
+		self.done[stage] = self.done.get(stage, 0) + 1
+		if key is not None:
+			self.steps.get(stage, {}).pop(key, None)
+		if ids:
+			self.ids.setdefault(stage, {}).update(ids)
+
+	def __append(self, entry: dict[str, Any]) -> None:
+		""" adds an entry to the log, which is replayed on top of the checkpoint when it's loaded """
+		if self.__log is None:
+			self.__log = open(self.logfp, "a")
+		self.__log.write(json.dumps(entry) + "\n")
+		self.__log.flush()
+
+	def save(self) -> None:
+		""" writes the checkpoint, replacing the previous one in one go """
+		data: dict[str, Any] = {
+			"version": VERSION,
+			"config": self.config,
+			"stages": self.stages,
+			"ids": self.ids,
+			"done": self.done,
+		}
+		with NamedTemporaryFile("w", dir=dirname(self.fp) or ".", prefix=".", suffix=".tmp", delete=False) as f:
+			json.dump(data, f)
+		replace(f.name, self.fp)
+
+	def remove(self) -> None:
+		""" deletes the checkpoint (and its log) once it's no longer needed """
+		if self.__log is not None:
+			self.__log.close()
+			self.__log = None
+		for fp in (self.fp, self.logfp):
+			if exists(fp):
+				remove(fp)
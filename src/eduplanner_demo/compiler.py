@@ -0,0 +1,168 @@
+from collections.abc import Iterable
+from os.path import realpath
+from typing import Any
+import json
+
+from .config import Config
+from .model import MoodleObject, Course, Task, User, Slot, Plan, TaskStatus
+from .adapter_moodlecli import (
+	MoodleCLI, PhpRefs, PhpExpr, e, php_bootstrap, php_call_external,
+	PHP_CLEAR, PHP_CALL_EXTERNAL, php_add_courses, php_add_tasks, php_add_users,
+	php_add_user_enrols, php_add_submissions, php_add_grades, php_record_epoch,
+	php_add_kanban_entries, php_add_reservations, php_add_notifications,
+)
+
+#
+# NOTE: This emits the same code MoodleCLI runs stage by stage, but as one program with a single moodle bootstrap.
+#       Instead of echoing new IDs back to python, they're kept in $ids (keyed by config ID) and referenced from there.
+#
+
+IMPORTS = ("course/lib", "course/modlib", "lib/datalib", "mod/assign/locallib", "lib/externallib", "user/lib")
+""" everything any of the stages need """
+
+KINDS: dict[type, str] = {
+	Course: "courses",
+	Task: "tasks",
+	User: "users",
+	Slot: "slots",
+}
+""" the key in $ids under which IDs of each model class are kept """
+
+
+class CompiledRefs(PhpRefs):
+	""" refers to IDs via the $ids array and to times relative to when the program runs """
+
+	def id(self, obj: MoodleObject) -> PhpExpr:
+		return PhpExpr(f"$ids['{KINDS[type(obj)]}']['{e(obj.id)}']") # type: ignore[attr-defined]
+
+	def time(self, days: int) -> PhpExpr:
+		return PhpExpr(f"($now + {days * 24 * 60 * 60})")
+
+	def store(self, kind: str) -> str:
+		return f"$ids['{kind}'][$key] = $id;"
+
+
+def php_create_plans(plans: Iterable[Plan], refs: CompiledRefs) -> str:
+	""" creates plans the same way MoodleCLI.add_plans does, but in-process """
+	code = ""
+	for plan in plans:
+		owner = refs.id(plan.owner)
+		code += f"\n// plan '{e(plan.name)}'\n"
+		for member in plan.members:
+			invite = php_call_external("plan_invite_user", {"inviteeid": refs.id(member)}, owner)
+			accept = php_call_external("plan_accept_invite", {"inviteid": PhpExpr("$invite['id']")}, refs.id(member))
+			code += f"$invite = {invite};\n{accept};\n"
+		for member in plan.members:
+			code += f"{php_call_external('plan_update_access', {'accesstype': 1, 'memberid': refs.id(member)}, owner)};\n"
+		code += f"{php_call_external('plan_update_plan', {'planname': plan.name}, owner)};\n"
+		for deadline in plan.deadlines:
+			code += php_call_external("plan_set_deadline", {
+				"moduleid": refs.id(deadline.task),
+				"deadlinestart": refs.time(deadline.deadlinestart),
+				"deadlineend": refs.time(deadline.deadlinestart + deadline.duration),
+			}, owner) + ";\n"
+	return code
+
+
+def php_create_slots(slots: Iterable[Slot], refs: CompiledRefs) -> str:
+	""" creates slots the same way MoodleCLI.add_slots does, but in-process """
+	code = ""
+	for slot in slots:
+		code += f"\n// slot '{e(slot.id)}'\n"
+		code += f"$key = '{e(slot.id)}';\n"
+		code += "$id = " + php_call_external("slots_create_slot", {
+			"startunit": slot.startunit,
+			"duration": slot.duration,
+			"weekday": slot.weekday,
+			"room": slot.room,
+			"size": slot.capacity,
+		}, "2") + "['id'];\n"
+		code += refs.store("slots") + "\n"
+		for mapping in slot.mappings:
+			code += php_call_external("slots_add_slot_filter", {
+				"slotid": refs.id(slot),
+				"courseid": refs.id(mapping.course),
+				"vintage": mapping.clazz.value,
+			}, "2") + ";\n"
+		for supervisor in slot.supervisors:
+			code += php_call_external("slots_add_slot_supervisor", {
+				"slotid": refs.id(slot),
+				"userid": refs.id(supervisor),
+			}, "2") + ";\n"
+	return code
+
+
+def compile_populate(config: Config, moodledir: str, commit_interval: int = 0) -> str:
+	""" resolves the config and turns everything populate() would do into a single php program
+
+	:param Config config: the config to populate moodle with
+	:param str moodledir: directory where moodle is installed
+	:param int commit_interval: how many items each stage writes per transaction, 0 for one transaction per stage
+	:return str: the program, which prints a JSON object of all created IDs keyed by config ID when done
+	"""
+	refs = CompiledRefs()
+
+	passwd, users, courses, slots, plans = config.read_moodle_config()
+	tasks = [(course, task) for course in courses for task in course.tasks]
+	tasks_bytaskname = {task.id: task for _, task in tasks}
+	course_bytaskname = {task.id: course for course, task in tasks}
+
+	enrols = [(user, [course_bytaskname[taskname] for taskname in user.task_status.keys()]) for user in users]
+	submissions = [
+		(user, tasks_bytaskname[name])
+		for user in users
+		for name, status in user.task_status.items()
+		if status in (TaskStatus.SUBMITTED, TaskStatus.COMPLETED)
+	]
+	completions = [
+		(user, tasks_bytaskname[name])
+		for user in users
+		for name, status in user.task_status.items()
+		if status == TaskStatus.COMPLETED
+	]
+
+	stages = (
+		("clear", PHP_CLEAR),
+		("courses", php_add_courses(courses, refs, commit_interval)),
+		("tasks", php_add_tasks(tasks, refs, commit_interval)),
+		("users", php_add_users(users, passwd, refs, commit_interval) + "".join(
+			# get eduplanner user - this creates it for future use
+			f"{php_call_external('user_get_user', {}, refs.id(user))};\n" for user in users
+		)),
+		("enrols", php_add_user_enrols(enrols, refs, commit_interval)),
+		("submissions", php_add_submissions(submissions, refs)),
+		("grades", php_add_grades(completions, refs, commit_interval)),
+		("plans", php_create_plans(plans, refs)),
+		("slots", php_create_slots(slots, refs)),
+		("kanban", php_add_kanban_entries(
+			[(user, tasks_bytaskname[name], column) for user in users for name, column in user.kanban.items()], refs
+		)),
+		("reservations", php_add_reservations(
+			[(slot, reservation) for slot in slots for reservation in slot.reservations], refs
+		)),
+		("notifications", php_add_notifications(
+			[(user, notification) for user in users for notification in user.notifications], refs
+		)),
+		("epoch", php_record_epoch(refs)),
+	)
+
+	program = "<?php\n" + php_bootstrap(realpath(moodledir), IMPORTS) + "\n" + PHP_CALL_EXTERNAL
+	program += "\n$now = time();\n"
+	program += "$ids = [" + ", ".join(f"'{kind}' => []" for kind in KINDS.values()) + "];\n"
+	for name, code in stages:
+		program += f"\n//\n// {name}\n//\n{code}"
+	program += "\necho json_encode($ids);\n"
+	return program
+
+
+def run_compiled(adapter: MoodleCLI, fp: str) -> dict[str, Any]:
+	""" runs a program emitted by compile_populate() on a moodle instance
+
+	:param MoodleCLI adapter: the moodle instance to run the program on
+	:param str fp: path to the program
+	:return dict[str, Any]: the created IDs, keyed by kind and config ID
+	"""
+	with adapter.connect():
+		with adapter.metrics.stage("compiled"):
+			stdout = adapter.execute(fp)
+	return json.loads(stdout)
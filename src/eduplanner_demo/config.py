@@ -1,8 +1,44 @@
-from os.path import exists, isdir, expanduser, realpath, join as pathjoin
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
+from glob import glob
+from os import cpu_count, makedirs, remove, replace
+from os.path import basename, exists, isdir, expanduser, realpath, relpath, join as pathjoin
+from tempfile import NamedTemporaryFile
+from typing import Any
+import hashlib
+import json
 import yaml
 import eduplanner_demo
 from eduplanner_demo.logger import Logger
-from eduplanner_demo.model import Plan, Deadline, Slot, SlotMapping, Task, Course, User, Capability, Clazz, TaskStatus, Weekday, find_course, toId, find_user, find_task
+from eduplanner_demo.trace import Trace
+from eduplanner_demo.model import Plan, Deadline, Slot, SlotMapping, Task, Course, User, Capability, Clazz, TaskStatus, Weekday, KanbanColumn, Notification, NotificationType, Reservation, find_course, toId, find_user, find_task
+
+try:
+    # libyaml-backed loader, several times faster on big configs
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader # type: ignore[assignment]
+
+CONFIG_FILES = ("courses", "users", "slots", "plans")
+"""names of all config files"""
+
+FRAGMENT_IDS: dict[str, tuple[str, Callable[[dict], str | None]]] = {
+    "courses": ("courses", lambda course: toId(course["name"]) if isinstance(course.get("name"), str) else None),
+    "users": ("users", lambda user: toId(user["name"]) if isinstance(user.get("name"), str) else None),
+    "slots": ("slots", lambda slot: toId(f"{slot.get('room', '')}.{slot['disambiguate']}") if "disambiguate" in slot else None),
+}
+"""per config, the list fragments add entries to and how to tell its entries apart, to catch duplicates across fragments
+(None for entries too broken to tell, which are left to the code reading or validating them to report)"""
+
+FRAGMENT_CACHE = expanduser("~/.cache/eduplanner_demo/fragments")
+"""where parsed fragments are kept as JSON, per config directory and config by the hash of their contents"""
+
+Origins = dict[str, str | list[tuple[str, int]]]
+"""where the parts of a config split into fragments come from: per top-level key the fragment setting it,
+or for lists the fragment and the index within it of every entry (fragments relative to the config directory)"""
+
+MoodleConfig = tuple[str, list[User], list[Course], list[Slot], list[Plan]]
+"""everything read from the config files: the default password, users, courses, slots and plans"""
 
 
 
@@ -10,7 +46,10 @@ class Config:
     __configdir: str
     """the directory with config files inside"""
 
-    def __init__(self, configdir: str | None = None):
+    __cachedir: str | None
+    """the directory parsed fragments are cached in, None to not cache them"""
+
+    def __init__(self, configdir: str | None = None, cachedir: str | None = FRAGMENT_CACHE):
         if configdir is None:
             configdir = self.find_configdir()
         else:
@@ -23,20 +62,202 @@ class Config:
                 exit(1)
 
         self.__configdir = configdir
+        self.__cachedir = cachedir
         
    
 
-    def get_config(self, name: str) -> str:
-        """Tries to return a config file matching the requested name
+    def get_config(self, name: str) -> list[str]:
+        """Tries to return the config files matching the requested name
+
+        A config is either a single file (e.g. users.yml), a directory of fragments (e.g. users.d/*.yml) or both.
 
-        :param str name: name of the config file to get (without path nor file extension)
-        :return str: the config file path
+        :param str name: name of the config to get (without path nor file extension)
+        :return list[str]: the config file paths, the single file first and fragments in alphabetical order
         """
         fp = pathjoin(self.__configdir, f"{name}.yml")
-        if not exists(fp):
-            Logger.error(f"could not find config file \"{fp}\"")
+        fps = [fp] if exists(fp) else []
+        fps.extend(sorted(glob(pathjoin(self.__configdir, f"{name}.d", "*.yml"))))
+        if not fps:
+            Logger.error(f"could not find config file \"{fp}\" nor any fragments in \"{name}.d\"")
             exit(1)
-        return fp
+        return fps
+
+    def load(self, name: str) -> Any:
+        """Parses a config without interpreting it any further
+
+        Fragments are parsed in parallel (or taken from the cache, if they haven't changed) and merged into one document.
+
+        :param str name: name of the config to load (without path nor file extension)
+        :return Any: the parsed YAML document, or None if the config is empty
+        """
+        return self.load_located(name)[0]
+
+    def load_located(self, name: str) -> tuple[Any, Origins]:
+        """Parses a config like load(), and also tells where in which fragment everything in it comes from
+
+        :param str name: name of the config to load (without path nor file extension)
+        :return tuple[Any, Origins]: the parsed YAML document and its origins (empty if it's a single file)
+        """
+        fps = self.get_config(name)
+        if len(fps) == 1:
+            with open(fps[0]) as f:
+                return (yaml.load(f, Loader=SafeLoader), {})
+
+        with Trace.span(f"load {name} fragments", "config", fragments=len(fps)):
+            documents = self.__load_fragments(name, fps)
+        return self.__merge_fragments(name, [relpath(fp, self.__configdir) for fp in fps], documents)
+
+    def __load_fragments(self, name: str, fps: list[str]) -> list[Any]:
+        """Parses several config files, reusing what the cache has for files that haven't changed
+
+        :return list[Any]: the parsed documents, in the same order as fps
+        """
+        contents = []
+        for fp in fps:
+            with open(fp, "rb") as f:
+                contents.append(f.read())
+        hashes = [hashlib.sha256(content).hexdigest() for content in contents]
+        cachedir = self.__fragment_cachedir(name)
+
+        documents: list[Any] = [None] * len(fps)
+        missing = []
+        for i, digest in enumerate(hashes):
+            cached = None if cachedir is None else pathjoin(cachedir, f"{digest}.json")
+            if cached is not None and exists(cached):
+                try:
+                    with open(cached, "rb") as f:
+                        documents[i] = json.load(f)
+                    continue
+                except (OSError, ValueError) as e:
+                    # parsed again below, which overwrites the broken entry
+                    Logger.debug(f"ignoring broken cached config fragment {cached}: {e!r}")
+            missing.append(i)
+        Logger.debug(lambda: f"{len(fps) - len(missing)} of {len(fps)} config fragments cached")
+
+        if len(missing) > 1:
+            with ProcessPoolExecutor(max_workers=min(len(missing), cpu_count() or 1)) as pool:
+                parsed = list(pool.map(_parse_fragment, [contents[i] for i in missing]))
+        else:
+            parsed = [_parse_fragment(contents[i]) for i in missing]
+
+        for i, document in zip(missing, parsed):
+            documents[i] = document
+            if cachedir is not None:
+                self.__cache_fragment(cachedir, hashes[i], document)
+        if cachedir is not None:
+            self.__prune_fragments(cachedir, set(hashes))
+        return documents
+
+    def __fragment_cachedir(self, name: str) -> str | None:
+        """Where the parsed fragments of a config are cached, None if they aren't"""
+        if self.__cachedir is None:
+            return None
+        # per config directory, so pruning one doesn't throw away what another one still uses
+        configdir = hashlib.sha256(self.__configdir.encode("utf-8")).hexdigest()[:16]
+        return pathjoin(self.__cachedir, configdir, name)
+
+    def __cache_fragment(self, cachedir: str, digest: str, document: Any) -> None:
+        """Stores a parsed fragment under the hash of its contents, unless JSON can't represent it faithfully
+        (e.g. dates, or keys that aren't strings)"""
+        try:
+            content = json.dumps(document)
+        except (TypeError, ValueError):
+            content = None
+        if content is None or json.loads(content) != document:
+            Logger.debug(f"not caching config fragment {digest}, JSON can't represent it")
+            return
+        fp = pathjoin(cachedir, f"{digest}.json")
+        try:
+            makedirs(cachedir, exist_ok=True)
+            # written next to it and moved into place, so a concurrent reader never sees half a file
+            # (under a name of its own, so concurrent writers don't write into the same temporary file either)
+            with NamedTemporaryFile("w", dir=cachedir, prefix=f"{digest}.", suffix=".tmp", delete=False) as f:
+                f.write(content)
+            try:
+                replace(f.name, fp)
+            except OSError:
+                remove(f.name)
+                raise
+        except OSError as e:
+            Logger.debug(f"could not cache config fragment: {e}")
+
+    def __prune_fragments(self, cachedir: str, used: set[str]) -> None:
+        """Removes cached fragments of a config that none of its fragments have anymore"""
+        assert self.__cachedir is not None
+        # pickles are what older versions cached
+        for fp in [*glob(pathjoin(cachedir, "*.json")), *glob(pathjoin(self.__cachedir, "*.pickle"))]:
+            if basename(fp).removesuffix(".json") in used:
+                continue
+            try:
+                remove(fp)
+            except OSError as e:
+                Logger.debug(f"could not remove cached config fragment {fp}: {e}")
+
+    def __merge_fragments(self, name: str, files: list[str], documents: list[Any]) -> tuple[Any, Origins]:
+        """Merges the fragments of a config into one document
+
+        Lists are concatenated in file order, everything else has to be the same in every fragment that sets it.
+
+        :param str name: name of the config (without path nor file extension)
+        :param list[str] files: where each fragment is, for error messages
+        :param list[Any] documents: the parsed fragments
+        :return tuple[Any, Origins]: the merged document (None if every fragment is empty) and where its parts come from
+        """
+        merged: dict[str, Any] = {}
+        setby: Origins = {}
+        firstby: dict[str, str] = {}
+        for file, document in zip(files, documents):
+            if document is None:
+                continue
+            if not isinstance(document, dict):
+                Logger.error(f"config fragment \"{file}\" is not a mapping")
+                exit(1)
+            for key, value in document.items():
+                firstby.setdefault(key, file)
+                if isinstance(value, list) and isinstance(merged.get(key, []), list):
+                    merged.setdefault(key, []).extend(value)
+                    origins = setby.setdefault(key, [])
+                    assert isinstance(origins, list)
+                    origins.extend((file, i) for i in range(len(value)))
+                elif key in merged and merged[key] != value:
+                    Logger.error(f"\"{file}\" sets {key} to something else than \"{firstby[key]}\" does")
+                    exit(1)
+                else:
+                    merged[key] = value
+                    setby[key] = file
+
+        if name in FRAGMENT_IDS:
+            key, idof = FRAGMENT_IDS[name]
+            seen: dict[str, str] = {}
+            for file, document in zip(files, documents):
+                entries = document.get(key) if isinstance(document, dict) else None
+                if not isinstance(entries, list):
+                    continue
+                for entry in entries:
+                    entryid = idof(entry) if isinstance(entry, dict) else None
+                    if entryid is None:
+                        continue
+                    if entryid in seen:
+                        Logger.error(f"{key} '{entryid}' is in both \"{seen[entryid]}\" and \"{file}\"")
+                        exit(1)
+                    seen[entryid] = file
+
+        return (merged or None, setby)
+
+    def digest(self) -> str:
+        """Hashes the contents of all config files, to tell whether they changed
+
+        :return str: the hash as hex string
+        """
+        digest = hashlib.sha256()
+        for name in CONFIG_FILES:
+            for fp in self.get_config(name):
+                if fp != pathjoin(self.__configdir, f"{name}.yml"):
+                    # entries moving between fragments changes their order
+                    digest.update(relpath(fp, self.__configdir).encode("utf-8"))
+                with open(fp, "rb") as f:
+                    digest.update(f.read())
+        return digest.hexdigest()
 
     @classmethod
     def find_configdir(cls) -> str:
@@ -65,13 +286,14 @@ class Config:
         :return list[User]: A list of User objects created from the configuration file, each
                     containing name, capabilities, class, token, and task status mappings.
         """
-        with open(self.get_config('users')) as f:
-            config = yaml.safe_load(f)
+        config = self.load('users')
 
         if config is None:
             Logger.warning("Empty user config file")
             return ([], "")
         users = []
+        # find_task() only for reporting unknown tasks, searching the list every time gets slow with lots of users
+        tasks_byid = {task.id: task for task in tasks}
         for user_data in config.get("users", []):
             capabilities = [Capability(cap) for cap in user_data.get("capabilities", [])]
             clazz = (
@@ -81,13 +303,26 @@ class Config:
             )
             task_status: dict[str, TaskStatus] = {}
             for task_id, status in user_data.get("task-status", {}).items():
-                task_status[find_task(tasks, task_id).id] = TaskStatus(status)
+                task_status[(tasks_byid.get(task_id) or find_task(tasks, task_id)).id] = TaskStatus(status)
+            kanban: dict[str, KanbanColumn] = {}
+            for task_id, column in user_data.get("kanban", {}).items():
+                kanban[(tasks_byid.get(task_id) or find_task(tasks, task_id)).id] = KanbanColumn(column)
+            notifications = [
+                Notification(
+                    type=NotificationType(notification_data["type"]),
+                    time=notification_data["time"],
+                    read=notification_data.get("read", False),
+                )
+                for notification_data in user_data.get("notifications", [])
+            ]
                 
             user = User(
                 name=user_data["name"],
                 capabilities=capabilities,
                 clazz=clazz,
                 task_status=task_status,
+                kanban=kanban,
+                notifications=notifications,
             )
             users.append(user)
             
@@ -103,12 +338,13 @@ class Config:
         :return list[Slot]: A list of Slot objects, each containing their associated mappings.
         """
 
-        with open(self.get_config('slots')) as f:
-            config = yaml.safe_load(f)
+        config = self.load('slots')
             
         if config is None:
             return []
         slots = []
+        # find_user() only for reporting unknown users, reservations can reference lots of them
+        users_byid = {user.id: user for user in users}
         for slot_data in config.get("slots", []):
             mappings = [
                  SlotMapping(
@@ -136,6 +372,14 @@ class Config:
             if len(room) > 7:
                 Logger.error(f"room '{room}' exceeds maximum length of 7 characters")
                 exit(1)
+
+            reservations = []
+            for reservation_data in slot_data.get("reservations", []):
+                user = users_byid.get(reservation_data["user"]) or find_user(users, reservation_data["user"])
+                if Capability.STUDENT not in user.capabilities:
+                    Logger.error(f"reservation holder '{user.id}' does not have STUDENT capability")
+                    exit(1)
+                reservations.append(Reservation(user=user, week=reservation_data.get("week", 0)))
                 
             slot = Slot(
                 supervisors=supervisors,
@@ -146,7 +390,12 @@ class Config:
                 room=room,
                 capacity=capacity,
                 mappings=mappings,
+                reservations=reservations,
             )
+            for week in {reservation.week for reservation in reservations}:
+                if sum(reservation.week == week for reservation in reservations) > capacity:
+                    Logger.error(f"slot '{slot.id}' has more reservations in week {week} than capacity {capacity}")
+                    exit(1)
             slots.append(slot)
             
         return slots
@@ -161,8 +410,7 @@ class Config:
         :return list[Course]: A list of Course objects, each containing their associated tasks.
         """
 
-        with open(self.get_config('courses')) as f:
-            config = yaml.safe_load(f)
+        config = self.load('courses')
             
         if config is None:
             Logger.warning("Empty course config file")
@@ -191,8 +439,7 @@ class Config:
         :return list[Plan]: A list of Plan objects, each containing their associated deadlines.
         """
 
-        with open(self.get_config('plans')) as f:
-            config = yaml.safe_load(f)
+        config = self.load('plans')
             
         if config is None:
             Logger.warning("Empty plan config file")
@@ -218,17 +465,21 @@ class Config:
         
         return plans
 
-    def read_moodle_config(self) -> tuple[str, list[User], list[Course], list[Slot], list[Plan]]:
+    def read_moodle_config(self) -> MoodleConfig:
         """Reads the Moodle configuration including users and courses.
 
         :return tuple[list[User], list[Course], list[Slot]]: A tuple containing everything read from the config files.
         """
 
-        courses = self.read_courses_config()
+        with Trace.span("read courses", "config"):
+            courses = self.read_courses_config()
         tasks = [task for course in courses for task in course.tasks]
-        (users, password) = self.read_users_config(tasks)
-        slots = self.read_slots_config(users, courses)
-        plans = self.read_plans_config(users, tasks)
+        with Trace.span("read users", "config"):
+            (users, password) = self.read_users_config(tasks)
+        with Trace.span("read slots", "config"):
+            slots = self.read_slots_config(users, courses)
+        with Trace.span("read plans", "config"):
+            plans = self.read_plans_config(users, tasks)
 
         return (
             password,
@@ -238,8 +489,13 @@ class Config:
             plans,
         )
 
+def _parse_fragment(content: bytes) -> Any:
+    """Parses a single config fragment, in a separate process if there are several"""
+    return yaml.load(content, Loader=SafeLoader)
+
 def print_config(config: Config):
     password, users, courses, slots, plans = config.read_moodle_config()
+    Logger.flush()
     print(f"Users \033[2m(password: {password})\033[0m:")
     for user in users:
         capstring =  "\n".join([f"|\t|\t|\t{cap}" for cap in user.capabilities])
@@ -254,6 +510,14 @@ def print_config(config: Config):
         )
         for task_id, status in user.task_status.items():
             print(f"|\t|\t|\t{task_id}: '{status}'")
+        if user.kanban:
+            print("|\t|\tKanban:")
+            for task_id, column in user.kanban.items():
+                print(f"|\t|\t|\t{task_id}: '{column}'")
+        if user.notifications:
+            print("|\t|\tNotifications:")
+            for notification in user.notifications:
+                print(f"|\t|\t|\t{notification.type} {notification.time} days ({'read' if notification.read else 'unread'})")
 
     print("\nCourses:")
     for course in courses:
@@ -284,6 +548,10 @@ def print_config(config: Config):
         print(f"|\t|\tSupervisors:")
         for supervisor in slot.supervisors:
             print(f"|\t|\t|\t{supervisor.name} \033[2m({supervisor.id})\033[0m")
+        if slot.reservations:
+            print(f"|\t|\tReservations:")
+            for reservation in slot.reservations:
+                print(f"|\t|\t|\t{reservation.user.name} \033[2m({reservation.user.id})\033[0m on {slot.date(reservation.week)}")
     print("Plans:")
     for plan in plans:
         print(f"|\t{plan.name}")
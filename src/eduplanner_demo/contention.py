@@ -0,0 +1,284 @@
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from datetime import date
+from os import getuid
+from queue import Empty, SimpleQueue
+from random import Random
+from threading import Barrier, BrokenBarrierError, Lock, Thread
+from time import perf_counter
+from typing import Any
+import json
+
+from .logger import Logger
+from .config import Config
+from .model import Capability, Course, Slot, User
+from .adapter_moodlecli import MoodleCLI
+from .progress import Progress
+from .loadtest import PERCENTILES, percentile, fmt_latency
+
+#
+# NOTE: Slots are stormed one after another, with every client waiting for all others before starting on the next
+#       one, so each burst only competes with itself and the results per slot aren't muddled by the slot before.
+#       Every client keeps a resident php worker (see MoodleCLI.resident), so a burst is as close to simultaneous as
+#       the plugin's own work allows. Reservations that already exist (from populate or earlier runs) are left
+#       alone and count against the slot's capacity.
+#
+
+
+@dataclass
+class SlotContention:
+	""" how a burst of reservations for a single slot went """
+
+	slot: Slot
+	""" the slot everyone tried to reserve """
+	date: date
+	""" which occurrence of the slot was reserved """
+	reserved_before: int
+	""" reservations that already existed before the burst """
+	students: list[User]
+	""" who tried to reserve it """
+	accepted: int = 0
+	""" reservations the plugin made """
+	rejected: int = 0
+	""" reservations the plugin refused (e.g. because the slot was full) """
+	failed: int = 0
+	""" calls that failed outright """
+	latencies: list[float] = field(default_factory=list)
+	""" seconds taken by every call that got an answer, accepted or not """
+	reserved_after: int = 0
+	""" reservations that exist after the burst """
+
+	@property
+	def exceeded(self) -> bool:
+		""" whether the slot ended up with more reservations than fit into it """
+		return max(self.reserved_after, self.reserved_before + self.accepted) > self.slot.capacity
+
+	def to_dict(self) -> dict[str, Any]:
+		return {
+			"slot": self.slot.id,
+			"moodleid": self.slot.moodleid,
+			"date": self.date.isoformat(),
+			"capacity": self.slot.capacity,
+			"reserved_before": self.reserved_before,
+			"attempts": len(self.students),
+			"accepted": self.accepted,
+			"rejected": self.rejected,
+			"failed": self.failed,
+			"reserved_after": self.reserved_after,
+			"exceeded": self.exceeded,
+			**{f"p{p}": percentile(self.latencies, p) for p in PERCENTILES},
+		}
+
+
+def mapped_students(slots: Sequence[Slot], users: Sequence[User], courses: Sequence[Course]) -> dict[str, list[User]]:
+	""" finds the students each slot is meant for, i.e. those in a class the slot is mapped to for a course they take
+
+	:return dict[str, list[User]]: students per slot ID
+	"""
+	course_bytaskname = {task.id: course for course in courses for task in course.tasks}
+	courses_byuser = {user.name: {course_bytaskname[name].id for name in user.task_status} for user in users}
+	students = [user for user in users if Capability.STUDENT in user.capabilities and user.clazz is not None]
+	return {
+		slot.id: [
+			user for user in students
+			if any(mapping.clazz == user.clazz and mapping.course.id in courses_byuser[user.name] for mapping in slot.mappings)
+		]
+		for slot in slots
+	}
+
+
+def contention(
+	moodledir: str,
+	config: Config,
+	week: int = 0,
+	concurrency: int = 8,
+	slots: int | None = None,
+	students: int | None = None,
+	seed: int = 0,
+	out: str | None = None,
+) -> dict[str, Any]:
+	""" has the students mapped to each populated slot reserve it at once and checks its capacity held
+
+	:param str moodledir: where moodle is installed
+	:param Config config: the config moodle was populated with
+	:param int week: which occurrence of the slots to reserve, 0 being the next one
+	:param int concurrency: number of reservations in flight at once
+	:param int|None slots: only storm this many slots, those with the most students per seat first
+	:param int|None students: only have this many of the students mapped to a slot try to reserve it
+	:param int seed: seed for picking students, so runs are comparable
+	:param str|None out: file to store the results in as JSON
+	:return dict[str, Any]: the results
+	"""
+	adapter = MoodleCLI(moodledir)
+	if adapter.exec_uid != getuid():
+		Logger.error("contention must run as the same user as moodle")
+		exit(1)
+
+	_, users, courses, allslots, _ = config.read_moodle_config()
+	Logger.info("Looking up populated users and slots...")
+	missing = adapter.lookup_users(users)
+	if missing:
+		Logger.warning(f"{len(missing)} users from the config don't exist in moodle, leaving them out")
+	missingslots = adapter.lookup_slots(allslots)
+	if missingslots:
+		Logger.warning(f"{len(missingslots)} slots from the config don't exist in moodle, leaving them out")
+
+	rng = Random(seed)
+	mapped = mapped_students(allslots, [user for user in users if user.moodleid_ is not None], courses)
+	dates = {slot.id: slot.date(week) for slot in allslots}
+	dates_byslotid = {slot.moodleid: dates[slot.id] for slot in allslots if slot.moodleid_ is not None}
+	existing = {
+		(slotid, userid)
+		for day in set(dates_byslotid.values())
+		for slotid, userid in adapter.lookup_reservations(day)
+		if dates_byslotid.get(slotid) == day
+	}
+
+	bursts: list[SlotContention] = []
+	for slot in allslots:
+		if slot.moodleid_ is None:
+			continue
+		reserved = {userid for slotid, userid in existing if slotid == slot.moodleid}
+		candidates = [user for user in mapped[slot.id] if user.moodleid not in reserved]
+		if students is not None and len(candidates) > students:
+			candidates = rng.sample(candidates, students)
+		if candidates:
+			bursts.append(SlotContention(slot, dates[slot.id], len(reserved), candidates))
+	bursts.sort(key=lambda burst: len(burst.students) / max(1, burst.slot.capacity - burst.reserved_before), reverse=True)
+	if slots is not None:
+		bursts = bursts[:slots]
+	if not bursts:
+		Logger.error("no populated slots with students mapped to them that could still reserve them")
+		exit(1)
+
+	queues: list[SimpleQueue[User]] = []
+	for burst in bursts:
+		queue: SimpleQueue[User] = SimpleQueue()
+		for student in burst.students:
+			queue.put(student)
+		queues.append(queue)
+	barrier = Barrier(concurrency)
+	lock = Lock()
+	failures: list[BaseException] = []
+
+	def client() -> None:
+		mdl = MoodleCLI(moodledir)
+		try:
+			with mdl.resident():
+				for burst, queue in zip(bursts, queues):
+					barrier.wait()
+					while True:
+						try:
+							student = queue.get_nowait()
+						except Empty:
+							break
+						result, ok = None, True
+						start = perf_counter()
+						try:
+							result = mdl.call_webservice("slots_book_reservation", {
+								"slotid": burst.slot.moodleid,
+								"date": burst.date.isoformat(),
+								"userid": student.moodleid,
+							}, as_user=student.moodleid, check=False)
+						except SystemExit:
+							ok = False # already logged
+						latency = perf_counter() - start
+						with lock:
+							if not ok:
+								burst.failed += 1
+							else:
+								burst.latencies.append(latency)
+								if isinstance(result, dict) and "error" in result:
+									burst.rejected += 1
+								else:
+									burst.accepted += 1
+							Progress.advance()
+		except BrokenBarrierError:
+			pass # another client failed, which is reported for that one
+		except BaseException as e:
+			barrier.abort() # don't leave the other clients waiting for this one
+			with lock:
+				failures.append(e)
+
+	attempts = sum(len(burst.students) for burst in bursts)
+	Logger.info(f"Making {attempts} reservations for {len(bursts)} slots with {concurrency} clients...")
+	with Progress.stage("contention", attempts):
+		start = perf_counter()
+		clients = [Thread(target=client, name=f"contention-{i}") for i in range(concurrency)]
+		for thread in clients:
+			thread.start()
+		for thread in clients:
+			thread.join()
+		wall = perf_counter() - start
+
+	if failures:
+		for failure in failures:
+			if not isinstance(failure, SystemExit): # already logged
+				Logger.error(f"contention client failed: {failure!r}")
+		Logger.error(f"{len(failures)} of {concurrency} clients failed, so the slots weren't stormed as intended")
+		exit(1)
+
+	after: dict[int, int] = {}
+	for day in {burst.date for burst in bursts}:
+		for slotid, _ in adapter.lookup_reservations(day):
+			after[slotid] = after.get(slotid, 0) + 1
+	for burst in bursts:
+		burst.reserved_after = after.get(burst.slot.moodleid, 0)
+
+	latencies = [latency for burst in bursts for latency in burst.latencies]
+	answered = sum(burst.accepted + burst.rejected for burst in bursts)
+	results = {
+		"week": week,
+		"concurrency": concurrency,
+		"seed": seed,
+		"time": wall,
+		"attempts": attempts,
+		"accepted": sum(burst.accepted for burst in bursts),
+		"rejected": sum(burst.rejected for burst in bursts),
+		"failed": sum(burst.failed for burst in bursts),
+		"error_rate": (attempts - answered) / attempts,
+		"exceeded": [burst.slot.id for burst in bursts if burst.exceeded],
+		**{f"p{p}": percentile(latencies, p) for p in PERCENTILES},
+		"slots": [burst.to_dict() for burst in bursts],
+	}
+	print_results(results)
+
+	if out is not None:
+		with open(out, "w") as f:
+			json.dump(results, f, indent=4)
+		Logger.success(f"wrote contention results to {out}")
+
+	return results
+
+
+def print_results(results: dict[str, Any]) -> None:
+	""" prints contention results as a table """
+	if Logger.json:
+		Logger.results("contention", results)
+	else:
+		Logger.flush()
+		slots = results["slots"]
+		width = max(len("slot"), *(len(slot["slot"]) for slot in slots)) + 2
+		header = (
+			f"{'slot':<{width}}{'date':<12}{'seats':>7}{'before':>8}{'tries':>7}{'ok':>6}{'refused':>9}{'failed':>8}{'after':>7}"
+			+ "".join(f"{f'p{p}':>10}" for p in PERCENTILES)
+		)
+		print(header)
+		print("-" * len(header))
+		for slot in slots:
+			print(
+				f"{slot['slot']:<{width}}{slot['date']:<12}{slot['capacity']:>7}{slot['reserved_before']:>8}{slot['attempts']:>7}"
+				f"{slot['accepted']:>6}{slot['rejected']:>9}{slot['failed']:>8}{slot['reserved_after']:>7}"
+				+ "".join(f"{fmt_latency(slot[f'p{p}']):>10}" for p in PERCENTILES)
+				+ ("  OVER CAPACITY" if slot["exceeded"] else "")
+			)
+		print("-" * len(header))
+		print(
+			f"{results['attempts']} reservations in {results['time']:.2f}s: {results['accepted']} made, {results['rejected']} refused, "
+			f"{results['failed']} failed, p50/p95/p99 "
+			+ "/".join(fmt_latency(results[f"p{p}"]) for p in PERCENTILES)
+		)
+	if results["exceeded"]:
+		Logger.error(f"capacity exceeded for {len(results['exceeded'])} slots: {', '.join(results['exceeded'])}")
+	else:
+		Logger.success("no slot ever had more reservations than seats")
@@ -0,0 +1,155 @@
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, field
+from os.path import realpath
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+import json
+
+from .logger import Logger
+from .config import Config, MoodleConfig
+from .adapter_moodlecli import MoodleCLI
+from .populate import populate
+from .trace import Trace
+
+#
+# NOTE: Every instance gets its own process. Besides running them side by side, that also gives each one its own
+#       copy of the model, since populate() sets moodle IDs on it. The config is only read and resolved once and
+#       then handed to the processes as is.
+#
+
+
+@dataclass
+class InstanceResult:
+	""" how populating a single moodle instance went """
+
+	moodledir: str
+	""" where the instance is installed """
+	time: float
+	""" wall time spent populating in seconds """
+	error: str | None
+	""" why populating failed, or None if it didn't """
+	metrics: dict[str, Any]
+	""" everything the adapter collected, see Metrics.to_dict() """
+	trace: list[dict[str, Any]] = field(default_factory=list)
+	""" the timeline of this instance, if tracing """
+
+
+def instance_checkpoint(checkpoint: Path, moodledir: str) -> Path:
+	""" the checkpoint file for one of several instances, named after where it's installed """
+	name = realpath(moodledir).strip("/").replace("/", "_") or "root"
+	return checkpoint.with_name(f"{checkpoint.stem}.{name}{checkpoint.suffix}")
+
+
+def populate_instances(
+	moodledirs: Sequence[str],
+	config: Config,
+	checkpoint: Path | None = None,
+	resume: bool = False,
+	profile: bool = False,
+	commit_interval: int = 0,
+	trace: bool = False,
+	steps: bool = False,
+) -> list[InstanceResult]:
+	""" populates several moodle instances with the same config at once
+
+	:param Sequence[str] moodledirs: where the instances are installed
+	:param Config config: the config to populate them with
+	:param Path|None checkpoint: where to record progress, gets a suffix per instance
+	:param bool resume: continue where the runs that wrote the checkpoints left off
+	:param bool profile: have PHP scripts report their execution time, peak memory and DB reads/writes
+	:param int commit_interval: see MoodleCLI.commit_interval
+	:param bool trace: record a timeline per instance (see InstanceResult.trace)
+	:param bool steps: checkpoint every webservice call creating a plan or slot (see populate())
+	:return list[InstanceResult]: how it went, in the same order as moodledirs
+	"""
+	resolved = config.read_moodle_config()
+	Logger.info(f"Populating {len(moodledirs)} instances...")
+
+	with ProcessPoolExecutor(max_workers=len(moodledirs)) as pool:
+		futures = [
+			pool.submit(
+				_populate_instance,
+				moodledir,
+				config,
+				resolved,
+				None if checkpoint is None else str(instance_checkpoint(checkpoint, moodledir)),
+				resume,
+				profile,
+				commit_interval,
+				trace,
+				steps,
+				Logger.verbose,
+				Logger.json,
+			)
+			for moodledir in moodledirs
+		]
+		return [future.result() for future in futures]
+
+
+def _populate_instance(
+	moodledir: str,
+	config: Config,
+	resolved: MoodleConfig,
+	checkpoint: str | None,
+	resume: bool,
+	profile: bool,
+	commit_interval: int,
+	trace: bool,
+	steps: bool,
+	verbose: bool,
+	json_logs: bool,
+) -> InstanceResult:
+	""" runs in a separate process per instance """
+	Logger.init(verbose, json=json_logs)
+	Logger.interactive = False # several processes can't share a status line
+	Logger.source = moodledir
+	if trace:
+		Trace.start(f"populate {moodledir}")
+
+	adapter = MoodleCLI(moodledir, profile=profile, commit_interval=commit_interval)
+	start = perf_counter()
+	error = None
+	try:
+		populate(adapter, config, checkpoint, resume, resolved, steps)
+	except SystemExit:
+		# whatever went wrong has already been logged
+		error = "failed, see log"
+	except Exception as e:
+		Logger.error(f"populating failed: {e!r}")
+		error = repr(e)
+	Logger.flush()
+	return InstanceResult(moodledir, perf_counter() - start, error, adapter.metrics.to_dict(), Trace.events)
+
+
+def print_summary(results: Sequence[InstanceResult]) -> None:
+	""" prints a table comparing how populating each instance went """
+	if Logger.json:
+		Logger.results("instances", _summary(results))
+	else:
+		Logger.flush()
+		width = max(len("instance"), *(len(result.moodledir) for result in results)) + 2
+		header = f"{'instance':<{width}}{'status':<10}{'time':>10}{'procs':>8}{'php time':>10}"
+		print(header)
+		print("-" * len(header))
+		for result in results:
+			total = result.metrics["total"]
+			print(
+				f"{result.moodledir:<{width}}{'ok' if result.error is None else 'FAILED':<10}{result.time:>9.2f}s"
+				f"{total['processes']:>8}{total['process_time']:>9.2f}s"
+			)
+	for result in results:
+		if result.error is not None:
+			Logger.error(f"{result.moodledir}: {result.error}")
+
+
+def _summary(results: Sequence[InstanceResult]) -> dict[str, dict[str, Any]]:
+	""" the results of all instances without their traces, keyed by where each instance is installed """
+	return {result.moodledir: {key: value for key, value in asdict(result).items() if key != "trace"} for result in results}
+
+
+def write_results(results: Sequence[InstanceResult], fp: str) -> None:
+	""" writes the results of all instances to a JSON file, keyed by where each instance is installed """
+	with open(fp, "w") as f:
+		json.dump(_summary(results), f, indent=4)
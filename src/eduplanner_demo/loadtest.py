@@ -0,0 +1,218 @@
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass, field
+from math import ceil
+from os import getuid
+from queue import Empty, SimpleQueue
+from random import Random
+from threading import Lock, Thread
+from time import perf_counter
+from typing import Any
+import json
+
+from .logger import Logger
+from .config import Config
+from .model import Capability, User
+from .adapter_moodlecli import MoodleCLI
+from .progress import Progress
+
+#
+# NOTE: Every concurrent client gets a resident php worker of its own (see MoodleCLI.resident), so latencies are
+#       mostly the plugin's own work instead of starting php and bootstrapping moodle for every call.
+#       Users are looked up by username, so this works against anything populated from the same config.
+#
+
+DEFAULT_MIXES: dict[Capability, dict[str, int]] = {
+	Capability.STUDENT: {
+		"user_get_user": 3,
+		"plan_get_plan": 3,
+		"courses_get_all_courses": 2,
+		"slots_get_my_slots": 2,
+	},
+	Capability.TEACHER: {
+		"user_get_user": 1,
+		"courses_get_all_courses": 1,
+		"slots_get_supervisor_slots": 2,
+	},
+}
+""" which read calls users of each kind make and how often, relative to each other """
+
+PERCENTILES = (50, 95, 99)
+""" latency percentiles to report """
+
+
+def parse_mix(spec: str) -> dict[str, int]:
+	""" parses a call mix like "user_get_user=3,plan_get_plan=1" """
+	mix = {}
+	for part in spec.split(","):
+		function, _, weight = part.partition("=")
+		mix[function.strip()] = int(weight or 1)
+	return mix
+
+
+def percentile(values: Sequence[float], p: float) -> float | None:
+	""" the value p percent of values are at or below (nearest rank), None without any """
+	if not values:
+		return None
+	ordered = sorted(values)
+	return ordered[max(0, ceil(p / 100 * len(ordered)) - 1)]
+
+
+@dataclass
+class FunctionStats:
+	""" how calls to a single webservice function went """
+
+	function: str
+	""" name of the function, without namespace """
+	calls: int = 0
+	""" number of calls made """
+	errors: int = 0
+	""" number of calls that failed """
+	latencies: list[float] = field(default_factory=list)
+	""" seconds taken by every successful call """
+
+	def percentile(self, p: float) -> float | None:
+		""" the latency below which p percent of successful calls finished, None without any """
+		return percentile(self.latencies, p)
+
+
+def plan_calls(users: Sequence[User], requests: int, mixes: Mapping[Capability, Mapping[str, int]], seed: int = 0) -> list[tuple[str, int]]:
+	""" picks which function each request calls as which user
+
+	Every request goes to a random user who has a capability with a mix, with a function picked from that mix.
+
+	:return list[tuple[str, int]]: function and moodle ID of the user to call it as, per request
+	"""
+	rng = Random(seed)
+	callers = [(user, mixes[cap]) for user in users for cap in mixes if cap in user.capabilities]
+	if not callers:
+		Logger.error("no users with any of the capabilities to load test")
+		exit(1)
+	calls = []
+	for _ in range(requests):
+		user, mix = rng.choice(callers)
+		function = rng.choices(list(mix), weights=list(mix.values()))[0]
+		calls.append((function, user.moodleid))
+	return calls
+
+
+def loadtest(
+	moodledir: str,
+	config: Config,
+	requests: int = 1000,
+	concurrency: int = 8,
+	mixes: Mapping[Capability, Mapping[str, int]] = DEFAULT_MIXES,
+	seed: int = 0,
+	out: str | None = None,
+) -> dict[str, Any]:
+	""" replays read calls as populated users against a moodle instance and reports latencies per function
+
+	:param str moodledir: where moodle is installed
+	:param Config config: the config moodle was populated with
+	:param int requests: number of calls to make in total
+	:param int concurrency: number of calls in flight at once
+	:param Mapping mixes: which calls users of each kind make, see DEFAULT_MIXES
+	:param int seed: seed for picking users and calls, so runs are comparable
+	:param str|None out: file to store the results in as JSON
+	:return dict[str, Any]: the results
+	"""
+	adapter = MoodleCLI(moodledir)
+	if adapter.exec_uid != getuid():
+		Logger.error("loadtest must run as the same user as moodle")
+		exit(1)
+
+	_, users, *_ = config.read_moodle_config()
+	Logger.info("Looking up populated users...")
+	missing = adapter.lookup_users(users)
+	if missing:
+		Logger.warning(f"{len(missing)} users from the config don't exist in moodle, leaving them out")
+	calls = plan_calls([user for user in users if user.moodleid_ is not None], requests, mixes, seed)
+
+	queue: SimpleQueue[tuple[str, int]] = SimpleQueue()
+	for call in calls:
+		queue.put(call)
+	stats: dict[str, FunctionStats] = {}
+	lock = Lock()
+
+	def client() -> None:
+		mdl = MoodleCLI(moodledir)
+		with mdl.resident():
+			while True:
+				try:
+					function, userid = queue.get_nowait()
+				except Empty:
+					return
+				ok = True
+				start = perf_counter()
+				try:
+					mdl.call_webservice(function, {}, as_user=userid)
+				except SystemExit:
+					ok = False # already logged
+				latency = perf_counter() - start
+				with lock:
+					function_stats = stats.setdefault(function, FunctionStats(function))
+					function_stats.calls += 1
+					if ok:
+						function_stats.latencies.append(latency)
+					else:
+						function_stats.errors += 1
+					Progress.advance()
+
+	Logger.info(f"Making {len(calls)} calls with {concurrency} clients...")
+	with Progress.stage("loadtest", len(calls)):
+		start = perf_counter()
+		clients = [Thread(target=client, name=f"loadtest-{i}") for i in range(concurrency)]
+		for thread in clients:
+			thread.start()
+		for thread in clients:
+			thread.join()
+		wall = perf_counter() - start
+
+	results = {
+		"requests": len(calls),
+		"concurrency": concurrency,
+		"seed": seed,
+		"time": wall,
+		"throughput": len(calls) / wall if wall > 0 else 0.0,
+		"functions": {
+			name: {
+				"calls": function_stats.calls,
+				"errors": function_stats.errors,
+				"throughput": function_stats.calls / wall if wall > 0 else 0.0,
+				**{f"p{p}": function_stats.percentile(p) for p in PERCENTILES},
+			}
+			for name, function_stats in sorted(stats.items())
+		},
+	}
+	print_results(results)
+
+	if out is not None:
+		with open(out, "w") as f:
+			json.dump(results, f, indent=4)
+		Logger.success(f"wrote load test results to {out}")
+
+	return results
+
+
+def fmt_latency(seconds: float | None) -> str:
+	""" formats a latency for a results table """
+	return "-" if seconds is None else f"{seconds * 1000:.1f}ms"
+
+
+def print_results(results: dict[str, Any]) -> None:
+	""" prints load test results as a table """
+	if Logger.json:
+		Logger.results("loadtest", results)
+		return
+	Logger.flush()
+	functions = results["functions"]
+	width = max(len("function"), *(len(name) for name in functions)) + 2
+	header = f"{'function':<{width}}{'calls':>8}{'errors':>8}{'calls/s':>10}" + "".join(f"{f'p{p}':>10}" for p in PERCENTILES)
+	print(header)
+	print("-" * len(header))
+	for name, function in functions.items():
+		print(
+			f"{name:<{width}}{function['calls']:>8}{function['errors']:>8}{function['throughput']:>10.1f}"
+			+ "".join(f"{fmt_latency(function[f'p{p}']):>10}" for p in PERCENTILES)
+		)
+	print("-" * len(header))
+	print(f"{results['requests']} calls in {results['time']:.2f}s ({results['throughput']:.1f}/s) with {results['concurrency']} clients")
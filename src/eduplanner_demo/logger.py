@@ -1,4 +1,10 @@
-from typing import Any
+from typing import Any, TextIO
+from collections.abc import Callable
+from enum import IntEnum
+from time import time
+import atexit
+import json
+import sys
 
 
 RED = "[91m"
@@ -7,23 +13,135 @@ GREEN = "[92m"
 GRAY = "[37m"
 DARK_GRAY = "[90m"
 
+BUFFER_SIZE = 64 * 1024
+""" how many characters of low-priority output may pile up before it's written out """
 
 
+class LogLevel(IntEnum):
+    """Severity of a log message. Messages below the logger's level are dropped before being formatted."""
+
+    DEBUG = 10
+    INFO = 20
+    SUCCESS = 25
+    WARNING = 30
+    ERROR = 40
+
+
+Message = str | Callable[[], str]
+"""A message, or a function returning it - use the latter for anything expensive to format, e.g. `lambda: f"{x}"`"""
+
 
 class Logger:
     """A simple logger class for printing colored messages to the console."""
-    
+
     verbose: bool = False
-    
-    
+    level: LogLevel = LogLevel.INFO
+    """The lowest level that gets printed"""
+    json: bool = False
+    """Whether to print JSON lines instead of colored text"""
+    stream: TextIO = sys.stdout
+    """Where to print to"""
+    interactive: bool = False
+    """Whether we're printing colored text to a terminal, so there's a status line that can be redrawn"""
+    source: str | None = None
+    """Where messages come from, shown with each of them (e.g. the moodle instance when populating several at once)"""
+
+    __buffer: list[str] = []
+    __buffered: int = 0
+    __status: str = ""
+
+
     @staticmethod
-    def init( verbose: bool = False):
+    def init( verbose: bool = False, json: bool = False, stream: TextIO | None = None):
         """Initializes the logger with the specified verbosity.
 
         :param bool verbose: Whether to enable verbose output
+        :param bool json: Whether to print one JSON object per line instead of colored text
+        :param TextIO stream: Where to print to, defaults to stdout
         """
+        Logger.flush()
         Logger.verbose = verbose
-    
+        Logger.level = LogLevel.DEBUG if verbose else LogLevel.INFO
+        Logger.json = json
+        Logger.stream = stream if stream is not None else sys.stdout
+        Logger.interactive = not json and Logger.stream.isatty()
+
+    @staticmethod
+    def enabled( level: LogLevel) -> bool:
+        """Whether messages of this level get printed at all
+
+        :param LogLevel level: The level to check
+        :return bool: True if messages of this level are printed
+        """
+        return level >= Logger.level
+
+    @staticmethod
+    def flush():
+        """Writes out everything that's been buffered so far"""
+        if not Logger.__buffer:
+            return
+        if Logger.__status:
+            # move the status line below the new output
+            Logger.stream.write(f"\r\033[K{''.join(Logger.__buffer)}{Logger.__status}")
+        else:
+            Logger.stream.write("".join(Logger.__buffer))
+        Logger.stream.flush()
+        Logger.__buffer.clear()
+        Logger.__buffered = 0
+
+    @staticmethod
+    def status( text: str):
+        """Shows a line of status below everything else, replacing the previous one. Does nothing unless
+        Logger.interactive is set - see Progress for how it reports otherwise.
+
+        :param str text: The status to show, or an empty string to remove it
+        """
+        if not Logger.interactive:
+            return
+        Logger.flush()
+        Logger.__status = text
+        Logger.stream.write(f"\r\033[K{text}")
+        Logger.stream.flush()
+
+    @staticmethod
+    def __write( level: LogLevel, text: str):
+        """Buffers a formatted message. Anything more important than debug output flushes right away,
+        so progress still shows up as it happens."""
+        Logger.__buffer.append(text)
+        Logger.__buffered += len(text)
+        if level > LogLevel.DEBUG or Logger.__buffered >= BUFFER_SIZE:
+            Logger.flush()
+
+    @staticmethod
+    def __log( level: LogLevel, message: Message, color: str | None = None, **extra: Any):
+        """Formats and prints a message if its level is enabled
+
+        :param LogLevel level: The level of the message
+        :param Message message: The message, or a function returning it
+        :param str color: Color for the [LEVEL] prefix (or the whole line for debug messages) in text mode
+        """
+        if level < Logger.level:
+            return
+        text = message() if callable(message) else message
+
+        if Logger.json:
+            record = {"ts": time(), "level": level.name.lower(), "message": text, **extra}
+            if Logger.source is not None:
+                record["source"] = Logger.source
+            Logger.__write(level, json.dumps(record, default=str) + "\n")
+            return
+
+        if Logger.source is not None:
+            text = f"({Logger.source}) {text}"
+
+        if level == LogLevel.DEBUG:
+            line = Logger.color(f"[DEBUG] {text}", GRAY)
+        elif color is None:
+            line = f"[{level.name}] {text}"
+        else:
+            line = f"{Logger.color(f'[{level.name}]', color)} {text}"
+        Logger.__write(level, line + "\n")
+
     @staticmethod
     def color( string: str, color: str) -> str:
         """Returns a colored string
@@ -36,46 +154,72 @@ class Logger:
 
 
     @staticmethod
-    def info(message: str):
+    def info(message: Message):
         """Prints an info message
 
-        :param str message: The message to print
+        :param Message message: The message to print
         """
-        print(f"[INFO] {message}")
+        Logger.__log(LogLevel.INFO, message)
 
     @staticmethod
-    def debug( message: str):
-        if Logger.verbose:
-            print(Logger.color(f"[DEBUG] {message}", GRAY))
+    def debug( message: Message):
+        """Prints a debug message, but only in verbose mode
+
+        :param Message message: The message to print - pass a function if it's expensive to format
+        """
+        Logger.__log(LogLevel.DEBUG, message)
 
     @staticmethod
-    def error( message: str, error: Any = None):
+    def error( message: Message, error: Any = None):
         """Prints an error message with an optional error object
 
-        :param str message: The message to print
+        :param Message message: The message to print
         :param Any error: The error that caused the message, defaults to None
         """
-        print(Logger.color(f"[ERROR]", RED), message)
-        
+        if error is None:
+            Logger.__log(LogLevel.ERROR, message, RED)
+        else:
+            Logger.__log(LogLevel.ERROR, message, RED, error=error)
+
     @staticmethod
-    def warning( message: str):
+    def warning( message: Message):
         """Prints a warning message"""
-        print(Logger.color(f"[WARNING]", YELLOW), message)
-    
+        Logger.__log(LogLevel.WARNING, message, YELLOW)
+
     @staticmethod
-    def success( message: str):
+    def success( message: Message):
         """Prints a success message"""
-        print(Logger.color(f"[SUCCESS]", GREEN), message)
-    
+        Logger.__log(LogLevel.SUCCESS, message, GREEN)
+
     @staticmethod
-    def code( code: str, debug: bool = True):
+    def results( name: str, data: Any):
+        """Reports results as a single JSON record with `data` under `name`, for JSON mode - text mode prints
+        them as tables instead, which would break the stream of JSON lines
+
+        :param str name: What the results are, used as the message and as the key they're under
+        :param Any data: The results, anything json can encode
+        """
+        Logger.__log(LogLevel.INFO, name, **{name: data})
+
+    @staticmethod
+    def code( code: Message, debug: bool = True):
         """Prints a block of code with numbered lines
 
-        :param str code: The code block to print
+        :param Message code: The code block to print
         """
+        level = LogLevel.DEBUG if debug else LogLevel.INFO
+        if level < Logger.level:
+            return
+        text = code() if callable(code) else code
 
-        if debug and not Logger.verbose:
+        if Logger.json:
+            Logger.__log(level, "code", code=text)
             return
-            
-        for i, line in enumerate(code.split('\n')):
-            print(Logger.color(f"{i+1} |".rjust(2),DARK_GRAY), Logger.color(line, GRAY))
\ No newline at end of file
+
+        Logger.__write(level, "".join(
+            f"{Logger.color(f'{i+1} |'.rjust(2), DARK_GRAY)} {Logger.color(line, GRAY)}\n"
+            for i, line in enumerate(text.split('\n'))
+        ))
+
+
+atexit.register(Logger.flush)
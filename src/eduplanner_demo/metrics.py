@@ -0,0 +1,201 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from time import perf_counter
+from typing import Any
+import json
+
+from .logger import Logger
+
+OTHER_STAGE = "other"
+""" stage that everything recorded outside of an explicit stage ends up in (e.g. toggling maintenance mode) """
+
+
+@dataclass
+class StageMetrics:
+	""" numbers collected for a single populate stage """
+
+	name: str
+	""" name of the stage """
+	time: float = 0.0
+	""" wall time spent in this stage in seconds """
+	items: int = 0
+	""" number of items (users, grades, ...) handled in this stage """
+	processes: int = 0
+	""" number of PHP processes spawned """
+	process_time: float = 0.0
+	""" wall time spent waiting on PHP processes in seconds """
+	code_bytes: int = 0
+	""" bytes of PHP code sent (including data inlined into it) """
+	payload_bytes: int = 0
+	""" bytes sent to processes via stdin and script arguments """
+	output_bytes: int = 0
+	""" bytes received from processes via stdout and stderr """
+
+
+@dataclass
+class PhpProfile:
+	""" numbers reported by the PHP scripts themselves, summed up over all scripts with the same name """
+
+	name: str
+	""" name of the adapter method or webservice function """
+	calls: int = 0
+	""" number of scripts reported """
+	time: float = 0.0
+	""" execution time inside PHP in seconds, including the moodle bootstrap """
+	peak_memory: int = 0
+	""" highest peak memory usage of any single script in bytes """
+	db_reads: int = 0
+	""" number of DB reads """
+	db_writes: int = 0
+	""" number of DB writes """
+
+	def add(self, time: float, peak_memory: int, db_reads: int, db_writes: int) -> None:
+		""" adds the numbers reported by a single script """
+		self.calls += 1
+		self.time += time
+		self.peak_memory = max(self.peak_memory, peak_memory)
+		self.db_reads += db_reads
+		self.db_writes += db_writes
+
+
+class Metrics:
+	""" collects per-stage numbers about a populate run """
+
+	stages: dict[str, StageMetrics]
+	""" all stages in the order they were first entered """
+	methods: dict[str, PhpProfile]
+	""" PHP-side numbers per adapter method (only collected when profiling) """
+	functions: dict[str, PhpProfile]
+	""" PHP-side numbers per webservice function (only collected when profiling) """
+	downtime: float
+	""" wall time moodle spent in maintenance mode in seconds """
+
+	def __init__(self):
+		self.stages = {}
+		self.methods = {}
+		self.functions = {}
+		self.downtime = 0.0
+		self.__current: StageMetrics | None = None
+
+	def get(self, name: str) -> StageMetrics:
+		""" returns the metrics of a stage, creating it if it doesn't exist yet """
+		stage = self.stages.get(name)
+		if stage is None:
+			stage = self.stages[name] = StageMetrics(name)
+		return stage
+
+	@property
+	def current(self) -> StageMetrics:
+		""" the stage currently being run """
+		return self.__current if self.__current is not None else self.get(OTHER_STAGE)
+
+	@contextmanager
+	def stage(self, name: str, items: int = 0) -> Iterator[StageMetrics]:
+		""" times a stage and attributes every process spawned in the meantime to it
+
+		:param str name: name of the stage
+		:param int items: number of items this stage handles
+		"""
+		stage = self.get(name)
+		stage.items += items
+		outer = self.__current
+		self.__current = stage
+		start = perf_counter()
+		try:
+			yield stage
+		finally:
+			stage.time += perf_counter() - start
+			self.__current = outer
+
+	def record_process(self, time: float = 0.0, code_bytes: int = 0, payload_bytes: int = 0, output_bytes: int = 0) -> None:
+		""" records a spawned PHP process in the current stage """
+		stage = self.current
+		stage.processes += 1
+		stage.process_time += time
+		stage.code_bytes += code_bytes
+		stage.payload_bytes += payload_bytes
+		stage.output_bytes += output_bytes
+
+	def record_profile(self, method: str, function: str | None, time: float, peak_memory: int, db_reads: int, db_writes: int) -> None:
+		""" records the numbers a PHP script reported about itself
+
+		:param str method: the adapter method the script was run by
+		:param str|None function: the webservice function the script called, if any
+		"""
+		self.methods.setdefault(method, PhpProfile(method)).add(time, peak_memory, db_reads, db_writes)
+		if function is not None:
+			self.functions.setdefault(function, PhpProfile(function)).add(time, peak_memory, db_reads, db_writes)
+
+	@property
+	def total(self) -> StageMetrics:
+		""" all stages summed up """
+		total = StageMetrics("total")
+		for stage in self.stages.values():
+			total.time += stage.time
+			total.items += stage.items
+			total.processes += stage.processes
+			total.process_time += stage.process_time
+			total.code_bytes += stage.code_bytes
+			total.payload_bytes += stage.payload_bytes
+			total.output_bytes += stage.output_bytes
+		return total
+
+	def to_dict(self) -> dict[str, Any]:
+		""" returns all collected metrics as JSON-serializable dict """
+		result: dict[str, Any] = {
+			"stages": [asdict(stage) for stage in self.stages.values()],
+			"total": asdict(self.total),
+			"downtime": self.downtime,
+		}
+		if self.methods:
+			result["php"] = {
+				"methods": [asdict(profile) for profile in self.methods.values()],
+				"functions": [asdict(profile) for profile in self.functions.values()],
+			}
+		return result
+
+	def write(self, fp: str) -> None:
+		""" writes all collected metrics to a JSON file """
+		with open(fp, "w") as f:
+			json.dump(self.to_dict(), f, indent=4)
+
+	def print_table(self) -> None:
+		""" prints all collected metrics as a table """
+		if Logger.json:
+			Logger.results("metrics", self.to_dict())
+			return
+		Logger.flush()
+		header = f"{'stage':<14}{'time':>10}{'items':>8}{'procs':>7}{'php time':>10}{'code':>10}{'payload':>10}{'output':>10}"
+		print(header)
+		print("-" * len(header))
+		for stage in (*self.stages.values(), self.total):
+			if stage.name == "total":
+				print("-" * len(header))
+			print(
+				f"{stage.name:<14}{stage.time:>9.2f}s{stage.items:>8}{stage.processes:>7}{stage.process_time:>9.2f}s"
+				f"{_fmt_bytes(stage.code_bytes):>10}{_fmt_bytes(stage.payload_bytes):>10}{_fmt_bytes(stage.output_bytes):>10}"
+			)
+		print(f"{'downtime':<14}{self.downtime:>9.2f}s")
+
+		for title, profiles in (("adapter method", self.methods), ("webservice function", self.functions)):
+			if not profiles:
+				continue
+			width = max(len(title), *(len(name) for name in profiles)) + 2
+			header = f"{title:<{width}}{'calls':>7}{'php time':>10}{'peak mem':>10}{'reads':>9}{'writes':>9}"
+			print()
+			print(header)
+			print("-" * len(header))
+			for profile in sorted(profiles.values(), key=lambda p: p.time, reverse=True):
+				print(
+					f"{profile.name:<{width}}{profile.calls:>7}{profile.time:>9.2f}s{_fmt_bytes(profile.peak_memory):>10}"
+					f"{profile.db_reads:>9}{profile.db_writes:>9}"
+				)
+
+
+def _fmt_bytes(n: int) -> str:
+	for unit in ("B", "KiB", "MiB"):
+		if n < 1024:
+			return f"{n}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+		n /= 1024 # type: ignore[assignment]
+	return f"{n:.1f}GiB"
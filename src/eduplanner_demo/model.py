@@ -1,7 +1,7 @@
 from enum import IntEnum, StrEnum
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from abc import ABC
-from datetime import datetime, timedelta, UTC, timezone
+from datetime import date, datetime, timedelta, UTC, timezone
 
 from .logger import Logger
 
@@ -135,6 +135,54 @@ class Clazz(StrEnum):
     B5 = "5BHIT"
 
 
+class KanbanColumn(StrEnum):
+    """
+    Enumeration of the columns on a user's kanban board.
+    """
+
+    BACKLOG = "backlog"
+    """Tasks the user hasn't planned yet."""
+    TODO = "todo"
+    """Tasks the user plans to do."""
+    INPROGRESS = "inprogress"
+    """Tasks the user is working on."""
+    DONE = "done"
+    """Tasks the user considers done."""
+
+
+class NotificationType(StrEnum):
+    """
+    Enumeration of the events eduplanner notifies users about.
+    """
+
+    INVITE = "invite"
+    """The user was invited to a plan."""
+    INVITE_ACCEPTED = "invite_accepted"
+    """Someone accepted the user's invite."""
+    INVITE_DECLINED = "invite_declined"
+    """Someone declined the user's invite."""
+    PLAN_LEFT = "plan_left"
+    """Someone left the user's plan."""
+    PLAN_REMOVED = "plan_removed"
+    """The user was removed from a plan."""
+    USER_REGISTERED = "user_registered"
+    """The user registered with eduplanner."""
+
+
+@dataclass
+class Notification(MoodleObject):
+    """
+    Represents an eduplanner notification.
+    """
+
+    type: NotificationType
+    """What the notification is about."""
+    time: int
+    """When the notification was sent in "days after now" (so usually negative)."""
+    read: bool
+    """Whether the user has read the notification."""
+
+
 @dataclass
 class User(MoodleObject):
     """
@@ -149,6 +197,10 @@ class User(MoodleObject):
     """The class the user is enrolled in."""
     task_status: dict[str, TaskStatus]
     """Task completion status mapping."""
+    kanban: dict[str, KanbanColumn] = field(default_factory=dict)
+    """The kanban column of each task the user has put on their board."""
+    notifications: list[Notification] = field(default_factory=list)
+    """Notifications the user has received."""
 
     @property
     def id(self) -> str:
@@ -165,6 +217,17 @@ class SlotMapping(MoodleObject):
     clazz: Clazz
     """The class this slot is mapped to."""
 
+@dataclass
+class Reservation(MoodleObject):
+    """
+    Represents a reservation of a slot.
+    """
+    user: User
+    """The student the slot is reserved for."""
+    week: int
+    """Which occurrence of the slot this is for, 0 being the next one."""
+
+
 @dataclass
 class Slot(MoodleObject):
     """
@@ -186,12 +249,19 @@ class Slot(MoodleObject):
     """The list of class/course mappings for this slot."""
     supervisors: list[User]
     """IDs of the users that are supervisors for this slot."""
+    reservations: list[Reservation] = field(default_factory=list)
+    """Reservations students have made for this slot."""
 
     @property
     def id(self) -> str:
         """A unique identifier generated from place and time."""
         return toId(f"{self.room}.{self.disambiguate}")
 
+    def date(self, week: int) -> date:
+        """The date of an occurrence of this slot, 0 being the next one (today included)."""
+        today = NOW.date()
+        return today + timedelta(days=(self.weekday - today.isoweekday()) % 7 + 7 * week)
+
 @dataclass
 class Deadline(MoodleObject):
     """
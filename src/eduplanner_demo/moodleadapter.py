@@ -1,8 +1,13 @@
 from abc import ABC, abstractmethod
 from contextlib import contextmanager
-from collections.abc import Iterator, Collection
+from collections.abc import Iterable, Iterator, Collection
 
-from .model import Task as mTask, User as mUser, Course as mCourse, Plan as mPlan, Slot as mSlot
+from .model import (
+	Task as mTask, User as mUser, Course as mCourse, Plan as mPlan, Slot as mSlot,
+	KanbanColumn, Notification, Reservation,
+)
+from .metrics import Metrics
+from .checkpoint import Checkpoint
 
 #
 # NOTE: MoodleAdapterOpen and MoodleAdapter are normally the same object,
@@ -11,6 +16,9 @@ from .model import Task as mTask, User as mUser, Course as mCourse, Plan as mPla
 
 class MoodleAdapterOpen(ABC):
 	""" adapter to communicate with moodle - opened and ready for communication """
+	metrics: Metrics
+	""" numbers about everything this adapter did, attributed to the stage it was done in """
+
 	@abstractmethod
 	def clear(self) -> None:
 		""" clear everything """
@@ -31,7 +39,15 @@ class MoodleAdapterOpen(ABC):
 
 	@abstractmethod
 	def add_users(self, users: Collection[mUser], token: str) -> None:
-		""" add users (NOTE: sets moodleID for users) """
+		""" add users (NOTE: sets moodleID for users, those that have one already are only set up for eduplanner) """
+		...
+
+	@abstractmethod
+	def lookup_users(self, users: Iterable[mUser]) -> list[mUser]:
+		""" sets the moodle IDs of users that exist already (e.g. created by a run that died)
+
+		:return list[mUser]: the users that don't exist in moodle
+		"""
 		...
 
 	@abstractmethod
@@ -50,18 +66,58 @@ class MoodleAdapterOpen(ABC):
 		...
 	
 	@abstractmethod
-	def add_plans(self, plans: Collection[mPlan]) -> None:
-		""" sets plans and associated tasks, and such """
+	def add_plans(self, plans: Collection[mPlan], checkpoint: Checkpoint | None = None) -> None:
+		""" sets plans and associated tasks, and such
+
+		NOTE: records every call in `checkpoint` as a step of the "plans" stage keyed by owner, skipping those done already """
 		...
 	
 	@abstractmethod
-	def add_slots(self, slots: Collection[mSlot]) -> None:
-		""" sets slots """
+	def add_slots(self, slots: Collection[mSlot], checkpoint: Checkpoint | None = None) -> None:
+		""" sets slots
+
+		NOTE: records every call in `checkpoint` as a step of the "slots" stage keyed by slot, skipping those done already """
+		...
+
+	@abstractmethod
+	def add_kanban_entries(self, entries: Collection[tuple[mUser, mTask, KanbanColumn]]) -> None:
+		""" puts tasks on users' kanban boards (NOTE: both users and tasks must have IDs set) """
+		...
+
+	@abstractmethod
+	def add_reservations(self, reservations: Collection[tuple[mSlot, Reservation]]) -> None:
+		""" reserves slots (NOTE: both slots and the reserving users must have IDs set) """
+		...
+
+	@abstractmethod
+	def add_notifications(self, notifications: Collection[tuple[mUser, Notification]]) -> None:
+		""" sends users notifications (NOTE: users must have IDs set) """
+		...
+
+	@abstractmethod
+	def record_epoch(self) -> None:
+		""" remembers that all dates were created relative to model.NOW (NOTE: only once everything is populated) """
+		...
+
+	@abstractmethod
+	def rebase(self) -> int | None:
+		""" moves all dates forward by the time passed between the recorded epoch and model.NOW
+
+		:return int|None: how many seconds dates were moved by, None if there's no epoch (i.e. not populated)
+		"""
 		...
 
 
 class MoodleAdapterClosed(ABC):
 	""" adapter to communicate with moodle - closed and dormant """
+	metrics: Metrics
+	""" numbers about everything this adapter did, attributed to the stage it was done in """
+
+	@abstractmethod
+	def prepare(self, token: str) -> None:
+		""" does everything add_users needs that doesn't have to wait until moodle is in maintenance mode (e.g. hashing the password) """
+		...
+
 	@abstractmethod
 	@contextmanager
 	def connect(self) -> Iterator[MoodleAdapterOpen]:
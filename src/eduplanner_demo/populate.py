@@ -1,54 +1,215 @@
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from datetime import timedelta
+
 from .logger import Logger
-from .model import Task, TaskStatus, User
-from .config import Config
+from .model import MoodleObject, Task, TaskStatus, User, KanbanColumn, Notification, Reservation, Slot
+from .config import Config, MoodleConfig
+from .checkpoint import Checkpoint
+from .metrics import Metrics, StageMetrics
 from .moodleadapter import MoodleAdapterClosed
+from .progress import Progress
+from .trace import Trace
+
+@contextmanager
+def _stage(metrics: Metrics, name: str, items: int, operations: int | None = None) -> Iterator[StageMetrics]:
+	""" runs a stage with metrics and progress reporting
+
+	:param int items: number of items this stage handles
+	:param int|None operations: number of steps the adapter reports progress in, if that's not one per item
+	"""
+	with (
+		metrics.stage(name, items) as stage,
+		Progress.stage(name, items if operations is None else operations),
+		Trace.span(name, "stage", items=items),
+	):
+		yield stage
 
-def populate(adapter: MoodleAdapterClosed, config: Config) -> None:
-	""" resets moodle in terms of what eduplanner cares about """
-	with adapter.connect() as mdl:
-		Logger.info("Clearing Moodle data...")
 
-		mdl.clear()
+def populate(
+	adapter: MoodleAdapterClosed,
+	config: Config,
+	checkpoint: str | None = None,
+	resume: bool = False,
+	resolved: MoodleConfig | None = None,
+	steps: bool = False,
+) -> None:
+	""" resets moodle in terms of what eduplanner cares about
 
-		passwd, users, courses, slots, plans = config.read_moodle_config()
+	:param str|None checkpoint: file to record progress in after every stage, so a run that died can be resumed
+	:param bool resume: continue where the run that wrote `checkpoint` left off instead of starting over
+	:param bool steps: also record every webservice call creating a plan or slot in `checkpoint`, so resuming
+	                   continues a half-created one instead of creating it again
+	:param MoodleConfig|None resolved: what config.read_moodle_config() returns, if it's been read already
+	                                   (NOTE: populate sets moodle IDs on these, so they can't be used twice)
+	"""
+	# NOTE: everything that doesn't need moodle to be in maintenance mode happens before it's enabled,
+	#       so the site is only down for as long as it takes to apply what's been prepared
+	metrics = adapter.metrics
+
+	with _stage(metrics, "config", 0):
+		passwd, users, courses, slots, plans = resolved if resolved is not None else config.read_moodle_config()
 		tasks = [(course, task) for course in courses for task in course.tasks]
 		course_bytaskname = {task.id: course for course, task in tasks}
 		tasks_bytaskname = {task[1].id: task[1] for task in tasks}
 		courses_byusername = {user.name: [course_bytaskname[taskname] for taskname in user.task_status.keys()] for user in users}
-		
-		Logger.success("Cleared Moodle data.")
-  
-		Logger.info("Populating Moodle data...")
-  
-		mdl.add_courses(courses)
-		Logger.success("Added courses.")
-  
-		mdl.add_tasks(tasks)
-		Logger.success("Added tasks.")
-
-		mdl.add_users(users, passwd)
-		Logger.success("Added users.")		
-  
-  
+
 		submissions2add: list[tuple[User, Task]] = []
 		completions2add: list[tuple[User, Task]] = []
 		for user in users:
-			courses = courses_byusername[user.name]
-			mdl.add_user_enrols(user, courses)
-			Logger.debug(f"Enrolled user {user.name} in courses {[c.id for c in courses]}")
-			
 			for name, status in user.task_status.items():
 				task = tasks_bytaskname[name]
 				if status in (TaskStatus.SUBMITTED, TaskStatus.COMPLETED):
 					submissions2add.append((user, task))
 				if status == TaskStatus.COMPLETED:
 					completions2add.append((user, task))
-			
-		mdl.add_submissions(submissions2add)
-		Logger.success("Added submissions.")
-		mdl.add_grades(completions2add)
-		Logger.success("Added grades.")
-		mdl.add_plans(plans)
-		Logger.success("Added plans.")
-		mdl.add_slots(slots)
-		Logger.success("Created slots.")
+		kanban2add: list[tuple[User, Task, KanbanColumn]] = [
+			(user, tasks_bytaskname[name], column) for user in users for name, column in user.kanban.items()
+		]
+		reservations2add: list[tuple[Slot, Reservation]] = [
+			(slot, reservation) for slot in slots for reservation in slot.reservations
+		]
+		notifications2add: list[tuple[User, Notification]] = [
+			(user, notification) for user in users for notification in user.notifications
+		]
+
+	progress: Checkpoint | None = None
+	if checkpoint is not None and resume:
+		progress = Checkpoint.load(checkpoint, config.digest())
+		progress.attach("courses", courses)
+		progress.attach("tasks", [task for _, task in tasks])
+		progress.attach("users", users)
+		progress.attach("slots", slots)
+		Logger.info(f"Resuming after stages: {', '.join(progress.stages) or 'none'}")
+	elif checkpoint is not None:
+		progress = Checkpoint(checkpoint, config.digest())
+
+	def done(stage: str) -> bool:
+		return progress is not None and progress.completed(stage)
+
+	def complete(stage: str, kind: str | None = None, objects: Iterable[MoodleObject] = ()) -> None:
+		if progress is None:
+			return
+		if kind is not None:
+			progress.record(kind, objects)
+		progress.complete(stage)
+
+	if not done("users"):
+		with _stage(metrics, "prepare", 0):
+			adapter.prepare(passwd)
+
+	with adapter.connect() as mdl:
+		if not done("clear"):
+			Logger.info("Clearing Moodle data...")
+			with _stage(metrics, "clear", 0):
+				mdl.clear()
+			complete("clear")
+			Logger.success("Cleared Moodle data.")
+
+		Logger.info("Populating Moodle data...")
+
+		if not done("courses"):
+			with _stage(metrics, "courses", len(courses)):
+				mdl.add_courses(courses)
+			complete("courses", "courses", courses)
+			Logger.success("Added courses.")
+
+		if not done("tasks"):
+			with _stage(metrics, "tasks", len(tasks)):
+				mdl.add_tasks(tasks)
+			complete("tasks", "tasks", [task for _, task in tasks])
+			Logger.success("Added tasks.")
+
+		if not done("users"):
+			if resume and progress is not None:
+				# with --commit-interval, the run that died may have committed some of them already
+				missing = mdl.lookup_users(users)
+				if len(missing) < len(users):
+					Logger.info(f"Found {len(users) - len(missing)} users created before, only creating the other {len(missing)}")
+			# created, then fetched once as eduplanner users
+			with _stage(metrics, "users", len(users), 2 * len(users)):
+				mdl.add_users(users, passwd)
+			complete("users", "users", users)
+			Logger.success("Added users.")
+
+		if not done("enrols"):
+			# NOTE: enrolling twice is harmless, so this is redone as a whole if it didn't finish
+			with _stage(metrics, "enrols", sum(len(usercourses) for usercourses in courses_byusername.values())):
+				for user in users:
+					usercourses = courses_byusername[user.name]
+					mdl.add_user_enrols(user, usercourses)
+					Logger.debug(lambda: f"Enrolled user {user.name} in courses {[c.id for c in usercourses]}")
+			complete("enrols")
+
+		if not done("submissions"):
+			with _stage(metrics, "submissions", len(submissions2add)):
+				mdl.add_submissions(submissions2add)
+			complete("submissions")
+			Logger.success("Added submissions.")
+		if not done("grades"):
+			with _stage(metrics, "grades", len(completions2add)):
+				mdl.add_grades(completions2add)
+			complete("grades")
+			Logger.success("Added grades.")
+
+		# plans and slots take several webservice calls each, so they're created and checkpointed one at a time,
+		# optionally with every call recorded as a step so resuming continues a half-created one instead of redoing it
+		stepped = progress if steps else None
+		if not done("plans"):
+			remainingplans = plans[progress.done.get("plans", 0):] if progress is not None else plans
+			# invite, accept and set access per member, rename once, one call per deadline
+			planoperations = sum(3 * len(plan.members) + 1 + len(plan.deadlines) for plan in remainingplans)
+			with _stage(metrics, "plans", len(remainingplans), planoperations):
+				for plan in remainingplans:
+					mdl.add_plans([plan], stepped)
+					if progress is not None:
+						progress.advance("plans", plan.owner.id)
+			complete("plans")
+			Logger.success("Added plans.")
+		if not done("slots"):
+			remainingslots = slots[progress.done.get("slots", 0):] if progress is not None else slots
+			slotoperations = sum(1 + len(slot.mappings) + len(slot.supervisors) for slot in remainingslots)
+			with _stage(metrics, "slots", len(remainingslots), slotoperations):
+				for slot in remainingslots:
+					mdl.add_slots([slot], stepped)
+					if progress is not None:
+						progress.advance("slots", slot.id, [slot])
+			complete("slots")
+			Logger.success("Created slots.")
+
+		if not done("kanban"):
+			with _stage(metrics, "kanban", len(kanban2add)):
+				mdl.add_kanban_entries(kanban2add)
+			complete("kanban")
+			Logger.success("Added kanban entries.")
+		if not done("reservations"):
+			with _stage(metrics, "reservations", len(reservations2add)):
+				mdl.add_reservations(reservations2add)
+			complete("reservations")
+			Logger.success("Added reservations.")
+		if not done("notifications"):
+			with _stage(metrics, "notifications", len(notifications2add)):
+				mdl.add_notifications(notifications2add)
+			complete("notifications")
+			Logger.success("Added notifications.")
+
+		# only now is everything there that rebase() moves
+		mdl.record_epoch()
+
+	Logger.info(f"Moodle was in maintenance mode for {metrics.downtime:.2f}s.")
+	if progress is not None:
+		progress.remove()
+
+
+def rebase(adapter: MoodleAdapterClosed) -> None:
+	""" moves every date populate created forward by the time passed since, instead of populating all over again
+
+	NOTE: all dates in the config are relative to when populate ran, so this leaves moodle as if it just did
+	"""
+	with adapter.connect() as mdl:
+		with mdl.metrics.stage("rebase"):
+			shift = mdl.rebase()
+	if shift is None:
+		Logger.error("moodle has not been (completely) populated, nothing to rebase")
+		exit(1)
+	Logger.success(f"Moved all dates forward by {timedelta(seconds=shift)}.")
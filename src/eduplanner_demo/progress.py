@@ -0,0 +1,84 @@
+from collections.abc import Iterator
+from contextlib import contextmanager
+from time import monotonic
+
+from .logger import Logger
+
+REDRAW_INTERVAL = 0.1
+""" minimum seconds between redraws of the status line on a terminal """
+REPORT_INTERVAL = 10.0
+""" seconds between progress lines when not printing to a terminal """
+
+
+def _fmt_duration(seconds: float) -> str:
+	seconds = int(seconds)
+	if seconds < 60:
+		return f"{seconds}s"
+	if seconds < 60 * 60:
+		return f"{seconds // 60}m{seconds % 60:02}s"
+	return f"{seconds // 3600}h{seconds // 60 % 60:02}m"
+
+
+class Progress:
+	""" tracks how many items of the current populate stage are done
+
+	The adapters report every completed item via Progress.advance(). On a terminal this shows up as a live status
+	line, otherwise a line is logged every REPORT_INTERVAL seconds.
+	"""
+
+	name: str | None = None
+	""" the stage currently running """
+	total: int = 0
+	""" how many items the current stage handles """
+	done: int = 0
+	""" how many items of the current stage are done """
+
+	__start: float = 0.0
+	__last: float = 0.0
+
+	@staticmethod
+	@contextmanager
+	def stage(name: str, total: int) -> Iterator[None]:
+		""" reports progress for a stage while it's running
+
+		:param str name: the name of the stage
+		:param int total: how many items the stage handles
+		"""
+		outer = (Progress.name, Progress.total, Progress.done, Progress.__start)
+		Progress.name = name
+		Progress.total = total
+		Progress.done = 0
+		Progress.__start = Progress.__last = monotonic()
+		try:
+			yield
+		finally:
+			Logger.status("")
+			Progress.name, Progress.total, Progress.done, Progress.__start = outer
+
+	@staticmethod
+	def advance(n: int = 1) -> None:
+		""" marks n items of the current stage as done """
+		if Progress.name is None or n == 0:
+			return
+		Progress.done += n
+		now = monotonic()
+		if now - Progress.__last < (REDRAW_INTERVAL if Logger.interactive else REPORT_INTERVAL):
+			return
+		Progress.__last = now
+		if Logger.interactive:
+			Logger.status(Progress.describe())
+		else:
+			Logger.info(Progress.describe)
+
+	@staticmethod
+	def describe() -> str:
+		""" the progress of the current stage, including its rate and estimated time left """
+		elapsed = monotonic() - Progress.__start
+		rate = Progress.done / elapsed if elapsed > 0 else 0.0
+		text = f"{Progress.name}: {Progress.done}/{Progress.total}"
+		if Progress.total > 0:
+			text += f" ({Progress.done / Progress.total:.0%})"
+		text += f", {rate:.1f}/s"
+		if rate > 0 and Progress.done < Progress.total:
+			text += f", ETA {_fmt_duration((Progress.total - Progress.done) / rate)}"
+		return text
@@ -1,57 +1,196 @@
 from .logger import Logger
-from .model import Capability, Clazz, Course, TaskStatus, User, Weekday
-from .config import Config
-from os.path import join as pathjoin
+from .model import Capability, Clazz, Course, KanbanColumn, NotificationType, TaskStatus, User, Weekday
+from collections.abc import Callable
+from os import chmod, replace
+from os.path import dirname, join as pathjoin
+from tempfile import NamedTemporaryFile
+from typing import Any
+import hashlib
+import json
+import re
 
-config = Config()
+HASH_PATTERN = re.compile(r'"\$comment":\s*"generated by eduplanner_demo schemagen from inputs ([0-9a-f]{64})"')
+""" finds the input hash in the first few bytes of a generated schema """
+HASH_HEAD_SIZE = 256
+""" how many bytes at the start of a schema file the input hash has to be in """
 
-courses = config.read_courses_config()
 
+def schemagen(dp: str, courses: list[Course], users: list[User], compact: bool = False, force: bool = False) -> None:
+    """Generates schema files to a folder, skipping those whose inputs haven't changed since they were last generated
 
-def schemagen(dp: str, courses: list[Course], users: list[User]) -> None:
-    """Generates schema files to a folder
-
-    :param list[Course] courses: existing courses to take into account
     :param str dp: directory path to save schema files to
+    :param list[Course] courses: existing courses to take into account
+    :param list[User] users: existing users to take into account
+    :param bool compact: write JSON without any whitespace instead of indenting it
+    :param bool force: regenerate every file, even if its inputs haven't changed
     """
     
     Logger.info(f"generating schema files to {dp}...")
 
+    tasks = [
+        (task.id, task.name, task.description, course.name)
+        for course in courses
+        for task in course.tasks
+    ]
+    teachers = [user.id for user in users if Capability.TEACHER in user.capabilities]
+    students = [user.id for user in users if Capability.STUDENT in user.capabilities]
+    # everything else a schema depends on: the code generating it and the output format
+    generator = (_generator_digest(), compact)
 
-    Logger.debug("Generating user schema...")
+    schemas: tuple[tuple[str, Any, Callable[[], dict[str, Any]]], ...] = (
+        (
+            "courses.yml.schema.json",
+            generator,
+            courses_schema,
+        ),
+        (
+            "users.yml.schema.json",
+            (
+                generator,
+                tasks,
+                [c.value for c in Clazz],
+                [c.value for c in Capability],
+                [s.value for s in TaskStatus],
+                [k.value for k in KanbanColumn],
+                [t.value for t in NotificationType],
+            ),
+            lambda: users_schema(courses),
+        ),
+        (
+            "slots.yml.schema.json",
+            (generator, [c.id for c in courses], teachers, students, [c.value for c in Clazz], [w.name for w in Weekday]),
+            lambda: slots_schema(courses, users),
+        ),
+        (
+            "plans.yml.schema.json",
+            (generator, [task[0] for task in tasks], students),
+            lambda: plans_schema(courses, users),
+        ),
+    )
 
-    status_props = {
-        task.id: {
-            "type": "string",
-            "description": task.description.strip(),
+    for fn, inputs, build in schemas:
+        fp = pathjoin(dp, fn)
+        digest = hashlib.sha256(json.dumps(inputs).encode()).hexdigest()
+        if not force and _read_hash(fp) == digest:
+            Logger.debug(f"{fn} is up to date")
+            continue
+
+        Logger.debug(f"Generating {fn}...")
+        schema = {"$comment": f"generated by eduplanner_demo schemagen from inputs {digest}", **build()}
+        if compact:
+            _write_atomic(fp, json.dumps(schema, separators=(",", ":")))
+        else:
+            _write_atomic(fp, json.dumps(schema, indent=4))
+        Logger.success(fn)
+
+
+def _generator_digest() -> str:
+    """hash of this module, so changes to how schemas are built regenerate them"""
+    with open(__file__, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _read_hash(fp: str) -> str | None:
+    """Returns the input hash a schema file was generated from, if it exists and has one"""
+    try:
+        with open(fp) as f:
+            head = f.read(HASH_HEAD_SIZE)
+    except OSError:
+        return None
+    match = HASH_PATTERN.search(head)
+    return match.group(1) if match is not None else None
+
+
+def _write_atomic(fp: str, content: str) -> None:
+    """Writes a file so that readers only ever see either its old or its new content"""
+    with NamedTemporaryFile("w", dir=dirname(fp) or ".", prefix=".", suffix=".tmp", delete=False) as f:
+        f.write(content)
+    chmod(f.name, 0o644) # temporary files are only readable by their owner
+    replace(f.name, fp)
+
+
+def ref(name: str) -> dict[str, str]:
+    """Returns a reference to a definition in the $defs of the same schema
+
+    :param str name: name of the definition
+    """
+    # escape as JSON pointer (RFC 6901)
+    return {"$ref": "#/$defs/" + name.replace("~", "~0").replace("/", "~1")}
+
+
+def courses_schema() -> dict[str, Any]:
+    """Builds the schema for courses.yml, which doesn't depend on any other config"""
+
+    COURSES_SCHEMA = {
+        "$schema": "https://json-schema.org/draft/2020-12/schema",
+        "title": "EduPlanner Demo Courses Config",
+        "type": "object",
+        "required": ["courses"],
+        "properties": {
+            "courses": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "required": ["name", "tasks"],
+                    "properties": {
+                        "name": {"type": "string"},
+                        "id": {"type": "integer"},
+                        "tasks": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "required": ["name", "description", "due", "type"],
+                                "properties": {
+                                    "name": {"type": "string"},
+                                    "type": {
+                                        "enum": ["assignment", "exam"],
+                                        "default": "assignment",
+                                    },
+                                    "description": {"type": "string"},
+                                    "due": {
+                                        "type": "integer",
+                                        "minimum": 0,
+                                        "description": "Days from the creation of the task until due",
+                                    },
+                                },
+                                "additionalProperties": False,
+                            },
+                        },
+                    },
+                    "additionalProperties": False,
+                },
+            }
+        },
+        "additionalProperties": False,
+    }
+
+    return COURSES_SCHEMA
+
+
+def users_schema(courses: list[Course]) -> dict[str, Any]:
+    """Builds the schema for users.yml
+
+    :param list[Course] courses: existing courses, whose tasks users can have a status for
+    """
+
+    # what a task is described as is defined once, and shared by its task-status and kanban entries
+    task_defs = {
+        f"task:{task.id}": {
             "title": f"{task.name} ({course.name.strip()})",
-            "enum": [
-                TaskStatus.COMPLETED.value,
-                TaskStatus.SUBMITTED.value,
-            ],
+            "description": task.description.strip(),
         }
         for course in courses
         for task in course.tasks
     }
 
-    plan_props = {
-        task.id: {
-            "type": "object",
-            "description": task.description.strip(),
-            "title": f"{task.name} ({course.name.strip()})",
-            "properties": {
-                "start": {
-                    "type": "integer",
-                    "minimum": 0,
-                    "description": "number of days from today when the task is planned to be started",
-                },
-                "end": {
-                    "type": "integer",
-                    "minimum": 0,
-                    "description": "number of days from today when the task is planned to be due",
-                },
-            },
-        }
+    status_props = {
+        task.id: {**ref("task-status"), "allOf": [ref(f"task:{task.id}")]}
+        for course in courses
+        for task in course.tasks
+    }
+
+    kanban_props = {
+        task.id: {**ref("kanban-column"), "allOf": [ref(f"task:{task.id}")]}
         for course in courses
         for task in course.tasks
     }
@@ -61,6 +200,56 @@ def schemagen(dp: str, courses: list[Course], users: list[User]) -> None:
         "title": "EduPlanner Demo Users Config",
         "type": "object",
         "required": ["users", "password"],
+        "$defs": {
+            "task-status": {
+                "type": "string",
+                "enum": [
+                    TaskStatus.COMPLETED.value,
+                    TaskStatus.SUBMITTED.value,
+                ],
+            },
+            "class": {
+                "type": "string",
+                "enum": [c.value for c in Clazz],
+            },
+            "capability": {
+                "type": "string",
+                "enum": [c.value for c in Capability],
+            },
+            "staff-capability": {
+                "type": "string",
+                "enum": [
+                    c.value
+                    for c in Capability
+                    if c != Capability.STUDENT
+                ],
+            },
+            "kanban-column": {
+                "type": "string",
+                "enum": [c.value for c in KanbanColumn],
+            },
+            "notifications": {
+                "type": "array",
+                "description": "Notifications the user has received.",
+                "items": {
+                    "type": "object",
+                    "required": ["type", "time"],
+                    "properties": {
+                        "type": {
+                            "type": "string",
+                            "enum": [t.value for t in NotificationType],
+                        },
+                        "time": {
+                            "type": "integer",
+                            "description": "Days after now when the notification was sent (usually negative).",
+                        },
+                        "read": {"type": "boolean", "default": False},
+                    },
+                    "additionalProperties": False,
+                },
+            },
+            **task_defs,
+        },
         "properties": {
             "password": {
                 "type": "string",
@@ -86,10 +275,14 @@ def schemagen(dp: str, courses: list[Course], users: list[User]) -> None:
                                     "properties": status_props,
                                     "additionalProperties": False,
                                 },
-                                "class": {
-                                    "type": "string",
-                                    "enum": [c.value for c in Clazz],
+                                "kanban": {
+                                    "type": "object",
+                                    "description": "Map<String, backlog|todo|inprogress|done>",
+                                    "properties": kanban_props,
+                                    "additionalProperties": False,
                                 },
+                                "notifications": ref("notifications"),
+                                "class": ref("class"),
                                 "name": {"type": "string"},
                                 "submitted_tasks": {
                                     "type": "array",
@@ -97,10 +290,7 @@ def schemagen(dp: str, courses: list[Course], users: list[User]) -> None:
                                 },
                                 "capabilities": {
                                     "type": "array",
-                                    "items": {
-                                        "type": "string",
-                                        "enum": [c.value for c in Capability],
-                                    },
+                                    "items": ref("capability"),
                                 },
                             },
                             "additionalProperties": False,
@@ -109,21 +299,12 @@ def schemagen(dp: str, courses: list[Course], users: list[User]) -> None:
                             "type": "object",
                             "required": ["name", "capabilities"],
                             "properties": {
-                                "class": {
-                                    "type": "string",
-                                    "enum": [c.value for c in Clazz],
-                                },
+                                "class": ref("class"),
                                 "name": {"type": "string"},
+                                "notifications": ref("notifications"),
                                 "capabilities": {
                                     "type": "array",
-                                    "items": {
-                                        "type": "string",
-                                        "enum": [
-                                            c.value
-                                            for c in Capability
-                                            if c != Capability.STUDENT
-                                        ],
-                                    },
+                                    "items": ref("staff-capability"),
                                 },
                             },
                             "additionalProperties": False,
@@ -135,23 +316,31 @@ def schemagen(dp: str, courses: list[Course], users: list[User]) -> None:
         "additionalProperties": False,
     }
 
-    fn = "users.yml.schema.json"
-    fp = pathjoin(dp, fn)
+    return USER_SCHEMA
 
-    with open(fp, "w") as f:
-        import json
 
-        json.dump(USER_SCHEMA, f, indent=4)
-        
-    Logger.success(fn)
+def slots_schema(courses: list[Course], users: list[User]) -> dict[str, Any]:
+    """Builds the schema for slots.yml
 
-    Logger.debug("Generating slots schema...")
+    :param list[Course] courses: existing courses slots can be mapped to
+    :param list[User] users: existing users, of which teachers can supervise slots
+    """
 
     SLOTS_SCHEMA = {
         "$schema": "https://json-schema.org/draft/2020-12/schema",
         "title": "EduPlanner Demo Slots Config",
         "type": "object",
         "required": ["slots"],
+        "$defs": {
+            "class": {
+                "type": "string",
+                "enum": [c.value for c in Clazz],
+            },
+            "student": {
+                "type": "string",
+                "enum": [u.id for u in users if Capability.STUDENT in u.capabilities],
+            },
+        },
         "properties": {
             "slots": {
                 "type": "array",
@@ -159,7 +348,7 @@ def schemagen(dp: str, courses: list[Course], users: list[User]) -> None:
                     "type": "object",
                     "required": [
                         "weekday",
-                        "start",
+                        "startunit",
                         "duration",
                         "supervisors",
                         "room",
@@ -174,7 +363,7 @@ def schemagen(dp: str, courses: list[Course], users: list[User]) -> None:
                                 w.name.lower() for w in Weekday
                             ]
                         },
-                        "start_hour": {"type": "integer", "minimum": 1, "maximum": 16},
+                        "startunit": {"type": "integer", "minimum": 1, "maximum": 16},
                         "duration": {
                             "type": "integer",
                             "minimum": 1,
@@ -199,10 +388,7 @@ def schemagen(dp: str, courses: list[Course], users: list[User]) -> None:
                                 "type": "object",
                                 "required": ["class", "course"],
                                 "properties": {
-                                    "class": {
-                                        "type": "string",
-                                        "enum": [c.value for c in Clazz],
-                                    },
+                                    "class": ref("class"),
                                     "course": {
                                         "type": "string",
                                         "enum": [c.id for c in courses],
@@ -210,29 +396,56 @@ def schemagen(dp: str, courses: list[Course], users: list[User]) -> None:
                                 },
                             },
                         },
+                        "reservations": {
+                            "type": "array",
+                            "description": "Students who reserved this slot.",
+                            "items": {
+                                "type": "object",
+                                "required": ["user"],
+                                "properties": {
+                                    "user": ref("student"),
+                                    "week": {
+                                        "type": "integer",
+                                        "minimum": 0,
+                                        "default": 0,
+                                        "description": "Which occurrence of the slot, 0 being the next one.",
+                                    },
+                                },
+                                "additionalProperties": False,
+                            },
+                        },
                     },
                 },
                 "additionalProperties": False,
             }
         },
     }
-    
-    fn = "slots.yml.schema.json"
-    fp = pathjoin(dp, fn)
-    with open(fp, "w") as f:
-        import json
 
-        json.dump(SLOTS_SCHEMA, f, indent=4)
+    return SLOTS_SCHEMA
 
-    Logger.success(fn)
 
-    Logger.debug("Generating plans schema...")
+def plans_schema(courses: list[Course], users: list[User]) -> dict[str, Any]:
+    """Builds the schema for plans.yml
+
+    :param list[Course] courses: existing courses, whose tasks plans can have deadlines for
+    :param list[User] users: existing users, of which students can own and be members of plans
+    """
 
     PLANS_SCHEMA = {
         "$schema": "https://json-schema.org/draft/2020-12/schema",
         "title": "EduPlanner Demo Plans Config",
         "type": "object",
         "required": ["plans"],
+        "$defs": {
+            "student": {
+                "type": "string",
+                "enum": [
+                    user.id
+                    for user in users
+                    if Capability.STUDENT in user.capabilities
+                ],
+            },
+        },
         "properties": {
             "plans": {
                 "type": "array",
@@ -242,25 +455,13 @@ def schemagen(dp: str, courses: list[Course], users: list[User]) -> None:
                     "properties": {
                         "name": {"type": "string"},
                         "owner": {
+                            **ref("student"),
                             "description": "The owner of the plan.",
-                            "type": "string",
-                            "enum": [
-                                user.id
-                                for user in users
-                                if Capability.STUDENT in user.capabilities
-                            ],
                         },
                         "members": {
                             "type": "array",
                             "description": "Users the plan is shared with (write access)",
-                            "items": {
-                                "type": "string",
-                                "enum": [
-                                    user.id
-                                    for user in users
-                                    if Capability.STUDENT in user.capabilities
-                                ],
-                            },
+                            "items": ref("student"),
                         },
                         "deadlines": {
                             "type": "array",
@@ -295,18 +496,4 @@ def schemagen(dp: str, courses: list[Course], users: list[User]) -> None:
         },
     }
 
-
-
-
-    fn = "plans.yml.schema.json"
-    fp = pathjoin(dp, fn)
-    with open(fp, "w") as f:
-        import json
-
-        json.dump(PLANS_SCHEMA, f, indent=4)
-
-    Logger.success(fn)
-  
-
-  
-    
+    return PLANS_SCHEMA
@@ -0,0 +1,117 @@
+from copy import deepcopy
+from os import remove
+from os.path import exists
+from time import perf_counter, time
+from typing import Any
+import json
+import socket
+
+from .logger import Logger
+from .config import Config
+from .adapter_moodlecli import MoodleCLI
+from .metrics import Metrics
+from .populate import populate
+
+#
+# NOTE: The server handles one request at a time, so requests are serialised simply by not accepting the next
+#       connection before the current one is done. A request is a single JSON object on a line of its own, e.g.
+#       {"command": "populate"}, and gets a single line of JSON back.
+#
+
+COMMANDS = ("reset", "populate", "status")
+""" what the server can be asked to do """
+
+
+class Server:
+	""" keeps the resolved config and a warm php worker around, and resets moodle on request """
+
+	def __init__(self, adapter: MoodleCLI, config: Config):
+		self.adapter = adapter
+		self.config = config
+		self.started = time()
+		self.requests = 0
+		self.last: dict[str, Any] | None = None
+		""" the reply to the last reset or populate request """
+
+		Logger.info("Reading config...")
+		self.resolved = config.read_moodle_config()
+
+	def handle(self, request: dict[str, Any]) -> dict[str, Any]:
+		""" runs a single request
+
+		:param dict request: the request, with the command under "command"
+		:return dict: the reply, with "ok" set to whether the request succeeded
+		"""
+		command = request.get("command")
+		if command not in COMMANDS:
+			return {"ok": False, "error": f"unknown command {command!r}, expected one of {', '.join(COMMANDS)}"}
+		self.requests += 1
+
+		if command == "status":
+			assert self.adapter.worker is not None
+			return {
+				"ok": True,
+				"uptime": time() - self.started,
+				"requests": self.requests,
+				"worker": self.adapter.worker.alive,
+				"last": self.last,
+			}
+
+		Logger.info(f"Running {command}...")
+		self.adapter.metrics = Metrics()
+		start = perf_counter()
+		try:
+			if command == "reset":
+				with self.adapter.connect() as mdl:
+					mdl.clear()
+			else:
+				# populate sets moodle IDs on the model, so every run needs a fresh copy
+				populate(self.adapter, self.config, resolved=deepcopy(self.resolved))
+		except SystemExit:
+			# MoodleCLI has already logged what went wrong
+			reply: dict[str, Any] = {"ok": False, "error": "failed, see server log"}
+		except Exception as e:
+			Logger.error(f"{command} failed: {e!r}")
+			reply = {"ok": False, "error": repr(e)}
+		else:
+			reply = {"ok": True}
+		reply["command"] = command
+		reply["time"] = perf_counter() - start
+		reply["downtime"] = self.adapter.metrics.downtime
+		reply["stages"] = {name: stage.time for name, stage in self.adapter.metrics.stages.items()}
+		self.last = reply
+		Logger.info(f"{command} took {reply['time']:.2f}s")
+		return reply
+
+
+def serve(socket_path: str, adapter: MoodleCLI, config: Config) -> None:
+	""" answers requests on a unix socket until interrupted
+
+	:param str socket_path: where to create the socket
+	:param MoodleCLI adapter: the moodle instance to reset
+	:param Config config: the config to populate it with
+	"""
+	server = Server(adapter, config)
+	if exists(socket_path):
+		remove(socket_path) # left over from a server that didn't shut down cleanly
+	with adapter.resident(), socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+		sock.bind(socket_path)
+		sock.listen()
+		Logger.success(f"Listening on {socket_path}")
+		try:
+			while True:
+				connection, _ = sock.accept()
+				with connection, connection.makefile("rwb") as stream:
+					for line in stream:
+						try:
+							request = json.loads(line)
+						except json.JSONDecodeError as e:
+							reply = {"ok": False, "error": f"invalid request: {e}"}
+						else:
+							reply = server.handle(request if isinstance(request, dict) else {})
+						stream.write(json.dumps(reply).encode('utf-8') + b"\n")
+						stream.flush()
+		except KeyboardInterrupt:
+			Logger.info("Shutting down...")
+		finally:
+			remove(socket_path)
@@ -0,0 +1,90 @@
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from os import getpid
+from threading import get_native_id
+from time import perf_counter
+from typing import Any
+import json
+
+#
+# NOTE: Timestamps are taken from perf_counter(), which is system-wide on linux, so traces recorded by several
+#       processes (see fanout) line up when merged. PHP processes are run one after another, so they all go on a
+#       single track of the python process that spawned them, with their actual PIDs in each span's args.
+#
+
+PHP_TRACK = 1
+""" thread ID under which PHP processes show up (real thread IDs are never this low) """
+
+
+class Trace:
+	""" collects a timeline of a run in chrome's trace event format, viewable in perfetto or chrome://tracing """
+
+	enabled: bool = False
+	""" whether anything is recorded """
+	events: list[dict[str, Any]] = []
+	""" everything recorded so far """
+
+	@staticmethod
+	def start(name: str = "eduplanner_demo") -> None:
+		""" starts recording
+
+		:param str name: what to call this process in the timeline
+		"""
+		Trace.enabled = True
+		Trace.events = []
+		pid = getpid()
+		Trace.__metadata("process_name", pid, pid, name)
+		Trace.__metadata("thread_name", pid, get_native_id(), "python")
+		Trace.__metadata("thread_name", pid, PHP_TRACK, "php processes")
+
+	@staticmethod
+	def __metadata(kind: str, pid: int, tid: int, name: str) -> None:
+		Trace.events.append({"name": kind, "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+
+	@staticmethod
+	def complete(name: str, category: str, start: float, end: float, args: dict[str, Any] | None = None, php: bool = False) -> None:
+		""" records a span that's already over
+
+		:param float start: perf_counter() when the span started
+		:param float end: perf_counter() when the span ended
+		:param dict|None args: anything else worth showing about the span
+		:param bool php: whether this is a PHP process, which goes on a track of its own
+		"""
+		if not Trace.enabled:
+			return
+		event: dict[str, Any] = {
+			"name": name,
+			"cat": category,
+			"ph": "X",
+			"ts": start * 1_000_000,
+			"dur": (end - start) * 1_000_000,
+			"pid": getpid(),
+			"tid": PHP_TRACK if php else get_native_id(),
+		}
+		if args:
+			event["args"] = args
+		Trace.events.append(event)
+
+	@staticmethod
+	@contextmanager
+	def span(name: str, category: str, **args: Any) -> Iterator[None]:
+		""" records a span around whatever runs inside it """
+		if not Trace.enabled:
+			yield
+			return
+		start = perf_counter()
+		try:
+			yield
+		finally:
+			Trace.complete(name, category, start, perf_counter(), args)
+
+	@staticmethod
+	def extend(events: Iterable[dict[str, Any]]) -> None:
+		""" adds events recorded by another process """
+		Trace.events.extend(events)
+
+	@staticmethod
+	def write(fp: str) -> None:
+		""" writes everything recorded so far as a JSON trace file """
+		with open(fp, "w") as f:
+			json.dump({"traceEvents": Trace.events, "displayTimeUnit": "ms"}, f)
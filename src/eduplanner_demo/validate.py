@@ -0,0 +1,343 @@
+from collections.abc import Callable, Hashable, Iterable, Iterator
+from dataclasses import dataclass, replace
+from typing import Any
+import re
+
+from .logger import Logger
+from .config import Config, Origins, CONFIG_FILES
+from .model import Capability, Course, Task, User, toId
+from .schemagen import courses_schema, users_schema, slots_schema, plans_schema
+
+#
+# NOTE: Config.read_* stop at the first problem they run into, which is fine for populating but not for editing
+#       a config. This checks the raw YAML instead and collects everything wrong with it. Cross-file rules are checked
+#       here directly via index dicts, the generated schemas (if jsonschema is installed) take care of the rest.
+#
+
+MAX_UNIT = 16
+""" the last unit of a school day """
+MAX_ROOM_LENGTH = 7
+""" how long room names may be """
+MAX_LISTED_VALUES = 16
+""" enums with more values than this (e.g. all user IDs) aren't listed in messages """
+
+
+@dataclass
+class Violation:
+	""" a single problem found in a config file """
+
+	file: str
+	""" name of the config file (without path nor file extension) """
+	path: str
+	""" where in the file the problem is, e.g. users[3].task-status """
+	message: str
+	""" what's wrong """
+	fragment: str | None = None
+	""" the fragment the problem is in (relative to the config directory), if the config is split into several """
+
+	def __str__(self) -> str:
+		return f"{self.fragment or f'{self.file}.yml'}: {self.path or '<root>'}: {self.message}"
+
+
+def validate(config: Config) -> list[Violation]:
+	""" checks all config files against their schemas and the rules spanning multiple files
+
+	:param Config config: the configs to check
+	:return list[Violation]: everything wrong with the configs, in file order
+	"""
+	located = {name: config.load_located(name) for name in CONFIG_FILES}
+	documents = {name: document for name, (document, _) in located.items()}
+	rules = _Rules(documents)
+	rules.check()
+
+	try:
+		import jsonschema # noqa: F401
+	except ImportError:
+		Logger.warning("jsonschema is not installed, only checking rules spanning multiple files")
+		return [_locate(violation, located[violation.file][1]) for violation in rules.violations]
+
+	# the schemas already check the cross-file rules via enums, but the rules report those more helpfully
+	reported = {(violation.file, violation.path) for violation in rules.violations}
+	violations = rules.violations + [
+		violation
+		for violation in _check_schemas(documents, rules.courses, rules.users)
+		if (violation.file, violation.path) not in reported
+	]
+	order = {name: i for i, name in enumerate(CONFIG_FILES)}
+	violations.sort(key=lambda violation: order[violation.file])
+	return [_locate(violation, located[violation.file][1]) for violation in violations]
+
+
+_TOPLEVEL_PATH = re.compile(r"(?P<key>[^.\[]+)(?:\[(?P<index>\d+)\](?P<rest>.*))?")
+
+
+def _locate(violation: Violation, origins: Origins) -> Violation:
+	""" points a violation found in a config merged from fragments at the fragment it's in """
+	if not origins:
+		return violation # a single file
+	match = _TOPLEVEL_PATH.fullmatch(violation.path)
+	origin = origins.get(match["key"]) if match is not None else None
+	if isinstance(origin, str):
+		return replace(violation, fragment=origin)
+	if isinstance(origin, list) and match is not None and match["index"] is not None and int(match["index"]) < len(origin):
+		fragment, index = origin[int(match["index"])]
+		return replace(violation, fragment=fragment, path=f"{match['key']}[{index}]{match['rest']}")
+	return replace(violation, fragment=f"{violation.file}.d") # about the config as a whole
+
+
+def _fmt_path(parts: Iterable[str | int]) -> str:
+	path = ""
+	for part in parts:
+		path += f"[{part}]" if isinstance(part, int) else f".{part}" if path else part
+	return path
+
+
+def _entries(document: Any, key: str) -> Iterator[tuple[int, dict[str, Any]]]:
+	""" yields the index and content of every well-formed entry in a top-level list """
+	entries = document.get(key) if isinstance(document, dict) else None
+	if not isinstance(entries, list):
+		return
+	for i, entry in enumerate(entries):
+		if isinstance(entry, dict):
+			yield i, entry
+
+
+def _strings(entry: dict[str, Any], key: str) -> Iterator[tuple[int, str]]:
+	""" yields the index and value of every string in a list inside an entry """
+	values = entry.get(key)
+	if not isinstance(values, list):
+		return
+	for i, value in enumerate(values):
+		if isinstance(value, str):
+			yield i, value
+
+
+class _Rules:
+	""" checks the rules spanning multiple config files """
+
+	def __init__(self, documents: dict[str, Any]):
+		self.documents = documents
+		self.violations: list[Violation] = []
+		self.courses: list[Course] = []
+		""" every well-formed course, for building schemas from """
+		self.users: list[User] = []
+		""" every well-formed user, for building schemas from """
+		self.__courses: set[str] = set()
+		self.__tasks: set[str] = set()
+		self.__capabilities: dict[str, set[str]] = {}
+
+	def report(self, file: str, path: str, message: str) -> None:
+		self.violations.append(Violation(file, path, message))
+
+	def check(self) -> None:
+		self.check_courses()
+		self.check_users()
+		self.check_slots()
+		self.check_plans()
+
+	def check_courses(self) -> None:
+		for i, course_data in _entries(self.documents["courses"], "courses"):
+			name = course_data.get("name")
+			if not isinstance(name, str):
+				continue
+			if toId(name) in self.__courses:
+				self.report("courses", f"courses[{i}].name", f"duplicate course '{toId(name)}'")
+				continue
+			self.__courses.add(toId(name))
+
+			tasks = []
+			for j, task_data in _entries(course_data, "tasks"):
+				if not isinstance(task_data.get("name"), str):
+					continue
+				task = Task(
+					name=task_data["name"],
+					parent=toId(name),
+					due=task_data.get("due", 0),
+					description=task_data.get("description", "") or "",
+				)
+				if task.id in self.__tasks:
+					self.report("courses", f"courses[{i}].tasks[{j}].name", f"duplicate task '{task.id}'")
+					continue
+				self.__tasks.add(task.id)
+				tasks.append(task)
+			self.courses.append(Course(name=name, tasks=tasks))
+
+	def check_users(self) -> None:
+		capabilities = {c.value for c in Capability}
+		for i, user_data in _entries(self.documents["users"], "users"):
+			name = user_data.get("name")
+			if not isinstance(name, str):
+				continue
+			if toId(name) in self.__capabilities:
+				self.report("users", f"users[{i}].name", f"duplicate user '{toId(name)}'")
+				continue
+
+			user_capabilities = {value for _, value in _strings(user_data, "capabilities") if value in capabilities}
+			self.__capabilities[toId(name)] = user_capabilities
+			self.users.append(User(
+				name=name,
+				capabilities=[Capability(value) for value in user_capabilities],
+				clazz=None,
+				task_status={},
+			))
+
+			for key in ("task-status", "kanban"):
+				statuses = user_data.get(key)
+				if isinstance(statuses, dict):
+					for task in statuses:
+						if task not in self.__tasks:
+							self.report("users", f"users[{i}].{key}", f"unknown task '{task}'")
+
+	def check_user(self, file: str, path: str, userid: str, capability: Capability, role: str) -> None:
+		""" checks that a user exists and has a capability """
+		capabilities = self.__capabilities.get(userid)
+		if capabilities is None:
+			self.report(file, path, f"unknown user '{userid}'")
+		elif capability.value not in capabilities:
+			self.report(file, path, f"{role} '{userid}' does not have the {capability.name} capability")
+
+	def check_slots(self) -> None:
+		slots: set[str] = set()
+		for i, slot_data in _entries(self.documents["slots"], "slots"):
+			path = f"slots[{i}]"
+			for j, supervisor in _strings(slot_data, "supervisors"):
+				self.check_user("slots", f"{path}.supervisors[{j}]", supervisor, Capability.TEACHER, "supervisor")
+			for j, mapping in _entries(slot_data, "mappings"):
+				course = mapping.get("course")
+				if isinstance(course, str) and course not in self.__courses:
+					self.report("slots", f"{path}.mappings[{j}].course", f"unknown course '{course}'")
+
+			room = slot_data.get("room", "")
+			if isinstance(room, str):
+				if len(room) > MAX_ROOM_LENGTH:
+					self.report("slots", f"{path}.room", f"room '{room}' is longer than {MAX_ROOM_LENGTH} characters")
+				slot = toId(f"{room}.{slot_data.get('disambiguate')}")
+				if slot in slots:
+					self.report("slots", f"{path}.disambiguate", f"duplicate slot '{slot}'")
+				slots.add(slot)
+
+			capacity = slot_data.get("capacity")
+			reserved: dict[Any, set[str]] = {}
+			for j, reservation in _entries(slot_data, "reservations"):
+				user = reservation.get("user")
+				week = reservation.get("week", 0)
+				if not isinstance(user, str) or not isinstance(week, Hashable):
+					continue # the schemas report these
+				self.check_user("slots", f"{path}.reservations[{j}].user", user, Capability.STUDENT, "reservation holder")
+				if user in reserved.setdefault(week, set()):
+					self.report("slots", f"{path}.reservations[{j}].user", f"'{user}' already reserved this slot in week {week}")
+				reserved[week].add(user)
+				if isinstance(capacity, int) and len(reserved[week]) == capacity + 1:
+					self.report("slots", f"{path}.reservations[{j}]", f"more reservations in week {week} than capacity {capacity}")
+
+			startunit = slot_data.get("startunit", 1)
+			duration = slot_data.get("duration", 1)
+			if isinstance(startunit, int) and isinstance(duration, int) and startunit + duration > MAX_UNIT:
+				self.report(
+					"slots", f"{path}.duration",
+					f"slot starting at unit {startunit} with duration {duration} exceeds maximum unit {MAX_UNIT}"
+				)
+
+	def check_plans(self) -> None:
+		for i, plan_data in _entries(self.documents["plans"], "plans"):
+			path = f"plans[{i}]"
+			owner = plan_data.get("owner")
+			if isinstance(owner, str):
+				self.check_user("plans", f"{path}.owner", owner, Capability.STUDENT, "plan owner")
+			for j, member in _strings(plan_data, "members"):
+				self.check_user("plans", f"{path}.members[{j}]", member, Capability.STUDENT, "plan member")
+
+			tasks: set[str] = set()
+			for j, deadline in _entries(plan_data, "deadlines"):
+				task = deadline.get("task")
+				if not isinstance(task, str):
+					continue
+				if task not in self.__tasks:
+					self.report("plans", f"{path}.deadlines[{j}].task", f"unknown task '{task}'")
+				elif task in tasks:
+					self.report("plans", f"{path}.deadlines[{j}].task", f"task '{task}' already has a deadline in this plan")
+				tasks.add(task)
+
+
+def _check_schemas(documents: dict[str, Any], courses: list[Course], users: list[User]) -> Iterator[Violation]:
+	""" checks every config file against the schema schemagen would generate for it """
+	from jsonschema import Draft202012Validator
+	from jsonschema.exceptions import ValidationError
+	from jsonschema.validators import extend
+
+	# enums of user and task IDs can get huge - check them against sets, and don't list them in messages
+	sets: dict[int, tuple[list[Any], set[Any]]] = {}
+
+	def enum(validator: Any, enums: list[Any], instance: Any, schema: dict[str, Any]) -> Iterator[Any]:
+		if not isinstance(instance, Hashable):
+			# can't be one of them (no enum has lists or objects), leave it to the type check next to the enum if there is one
+			if "type" not in schema:
+				yield ValidationError(f"{instance!r} is not one of the allowed values")
+			return
+		allowed = sets.get(id(enums))
+		if allowed is None:
+			allowed = sets[id(enums)] = (enums, {value for value in enums if isinstance(value, str)})
+		if instance not in allowed[1] and instance not in enums:
+			if len(enums) > MAX_LISTED_VALUES:
+				yield ValidationError(f"{instance!r} is not one of the allowed values")
+			else:
+				yield ValidationError(f"{instance!r} is not one of {enums!r}")
+
+	# the stock implementation walks all properties of the schema (e.g. every task for task-status) for every object
+	def properties(validator: Any, properties: dict[str, Any], instance: Any, schema: dict[str, Any]) -> Iterator[Any]:
+		if not validator.is_type(instance, "object"):
+			return
+		for name, value in instance.items():
+			if name in properties:
+				yield from validator.descend(value, properties[name], path=name, schema_path=name)
+
+	Validator = extend(Draft202012Validator, {"enum": enum, "properties": properties})
+
+	schemas: dict[str, Callable[[], dict[str, Any]]] = {
+		"courses": courses_schema,
+		"users": lambda: users_schema(courses),
+		"slots": lambda: slots_schema(courses, users),
+		"plans": lambda: plans_schema(courses, users),
+	}
+	for name, build in schemas.items():
+		if documents[name] is None:
+			continue # empty files are allowed
+		validator = Validator(_inline_refs(build()))
+		for error in validator.iter_errors(documents[name]):
+			for cause in _causes(error):
+				yield Violation(name, _fmt_path(cause.absolute_path), cause.message)
+
+
+def _inline_refs(schema: dict[str, Any]) -> dict[str, Any]:
+	""" replaces references to $defs with the definitions themselves, saving a lookup every time one is checked
+
+	This only works for the schemas generated by schemagen, which only ever reference their own $defs and
+	none of whose definitions reference each other.
+	"""
+	defs = schema.get("$defs", {})
+
+	def inline(node: Any) -> Any:
+		if isinstance(node, list):
+			return [inline(item) for item in node]
+		if not isinstance(node, dict):
+			return node
+		node = {key: inline(value) for key, value in node.items()}
+		ref = node.pop("$ref", None)
+		if ref is None:
+			return node
+		name = ref.removeprefix("#/$defs/").replace("~1", "/").replace("~0", "~")
+		return {**defs[name], **node}
+
+	return {key: inline(value) if key != "$defs" else value for key, value in schema.items()}
+
+
+def _causes(error: Any) -> list[Any]:
+	""" for anyOf/oneOf errors, the errors of the alternative that came closest to matching, else just the error """
+	if not error.context:
+		return [error]
+	alternatives: dict[Any, list[Any]] = {}
+	for cause in error.context:
+		alternatives.setdefault(cause.relative_schema_path[0], []).append(cause)
+	# the alternative that got deepest into the document before failing is most likely the one that was meant
+	closest = max(alternatives.values(), key=lambda causes: max(len(cause.absolute_path) for cause in causes))
+	return [nested for cause in closest for nested in _causes(cause)]
@@ -0,0 +1,66 @@
+from os.path import dirname, join as pathjoin
+from pathlib import Path
+import json
+import os
+import subprocess
+import sys
+
+SRC = pathjoin(dirname(dirname(__file__)), "src")
+""" where the package is, so this doesn't depend on it being installed """
+
+SIZES = (5, 10)
+""" students per benchmarked config, small enough to run in no time """
+
+OLD_RESULTS = {
+	"version": "0.0.0",
+	"adapter": "memory",
+	"seed": 0,
+	"runs": [
+		{
+			"size": 5,
+			"time": 0.01,
+			"spawns": 30,
+			"stages": {"users": {"name": "users", "time": 0.001, "items": 7, "spawns": 8}},
+		},
+	],
+	"scaling": {},
+}
+""" results as written before 'spawns' was renamed to 'processes' """
+
+
+def run(*args: str, cwd: Path) -> subprocess.CompletedProcess:
+	env = {**os.environ, "PYTHONPATH": SRC + os.pathsep + os.environ.get("PYTHONPATH", "")}
+	return subprocess.run([sys.executable, *args], env=env, cwd=cwd, capture_output=True, text=True, check=True)
+
+
+def test_benchmark(tmp_path: Path) -> None:
+	out = tmp_path / "results.json"
+	run("-m", "eduplanner_demo", "benchmark", "--sizes", ",".join(map(str, SIZES)), "-o", str(out), cwd=tmp_path)
+	with open(out) as f:
+		results = json.load(f)
+	assert [run["size"] for run in results["runs"]] == list(SIZES)
+	for result in results["runs"]:
+		assert result["processes"] > 0
+		assert result["items"]["users"] > result["size"] # the students plus some teachers
+		assert result["stages"]["users"]["items"] == result["items"]["users"]
+
+
+def test_compare_with_old_results(tmp_path: Path) -> None:
+	old = tmp_path / "old.json"
+	with open(old, "w") as f:
+		json.dump(OLD_RESULTS, f)
+	result = run(
+		"-m", "eduplanner_demo", "--log-format", "json",
+		"benchmark", "--sizes", ",".join(map(str, SIZES)), "--compare", str(old),
+		cwd=tmp_path,
+	)
+	# with JSON logs, stdout is nothing but JSON lines, tables included
+	records = [json.loads(line) for line in result.stdout.splitlines()]
+	comparisons = [record["comparison"] for record in records if record["message"] == "comparison"]
+	assert len(comparisons) == 1
+	runs = comparisons[0]["runs"]
+	assert [run["size"] for run in runs] == [5] # the only size both have
+	assert runs[0]["processes"][0] == 30
+	assert runs[0]["processes"][1] > 0
+	assert "users" in runs[0]["stages"]
+
@@ -0,0 +1,58 @@
+from os.path import dirname, join as pathjoin
+from pathlib import Path
+import sys
+
+SRC = pathjoin(dirname(dirname(__file__)), "src")
+""" where the package is, so this doesn't depend on it being installed """
+
+sys.path.insert(0, SRC)
+
+from eduplanner_demo.adapter_memory import MemoryMoodle # noqa: E402
+from eduplanner_demo.benchmark import generate_config # noqa: E402
+from eduplanner_demo.config import Config # noqa: E402
+from eduplanner_demo.model import Capability # noqa: E402
+from eduplanner_demo.populate import populate # noqa: E402
+
+SIZE = 30
+""" students in the generated config, enough for every kind of object to show up """
+
+STAGES = (
+	"config", "prepare", "clear", "courses", "tasks", "users", "enrols", "submissions", "grades",
+	"plans", "slots", "kanban", "reservations", "notifications",
+)
+""" every stage populate reports metrics for """
+
+EMPTY_STAGES = ("config", "prepare", "clear")
+""" stages without items """
+
+
+def test_populate(tmp_path: Path) -> None:
+	generate_config(str(tmp_path), SIZE)
+	config = Config(str(tmp_path), cachedir=None)
+	_, users, courses, slots, plans = config.read_moodle_config()
+
+	adapter = MemoryMoodle()
+	# MemoryMoodle asserts every reference (e.g. grading a submission that doesn't exist) like a foreign key would
+	populate(adapter, config)
+
+	assert len(adapter.users) == len(users)
+	assert len(adapter.courses) == len(courses)
+	assert len(adapter.tasks) == sum(len(course.tasks) for course in courses)
+	assert len(adapter.slots) == len(slots)
+	assert len(adapter.plans) == len(plans)
+	assert len(adapter.reservations) == sum(len(slot.reservations) for slot in slots)
+	assert len(adapter.notifications) == sum(len(user.notifications) for user in users)
+	assert sum(Capability.STUDENT in user.capabilities for user in adapter.users.values()) == SIZE
+	assert adapter.epoch is not None
+
+	metrics = adapter.metrics
+	# plus "other" for what happens outside of stages, e.g. turning maintenance mode on and off
+	assert [name for name in metrics.stages if name != "other"] == list(STAGES)
+	for name in STAGES:
+		stage = metrics.stages[name]
+		assert stage.time >= 0
+		if name not in EMPTY_STAGES:
+			assert stage.items > 0, f"{name} has no items"
+			assert stage.processes > 0, f"{name} spawned no processes"
+	assert metrics.total.processes == sum(stage.processes for stage in metrics.stages.values())
+	assert metrics.downtime > 0
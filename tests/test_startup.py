@@ -0,0 +1,48 @@
+from os.path import dirname, join as pathjoin
+from time import perf_counter
+import os
+import subprocess
+import sys
+
+import pytest
+
+SRC = pathjoin(dirname(dirname(__file__)), "src")
+""" where the package is, so this doesn't depend on it being installed """
+
+STARTUP_BUDGET = 1.0
+""" seconds --help and --version may take at most (the fastest of a few runs, so a busy machine doesn't fail this) """
+
+RUNS = 3
+""" how many times each command is timed """
+
+HEAVY_MODULES = ("yaml", "eduplanner_demo.adapter_moodlecli", "eduplanner_demo.config", "eduplanner_demo.schemagen")
+""" modules that only the subcommands needing them may import """
+
+
+def run(*args: str) -> subprocess.CompletedProcess:
+	env = {**os.environ, "PYTHONPATH": SRC + os.pathsep + os.environ.get("PYTHONPATH", "")}
+	return subprocess.run([sys.executable, *args], env=env, capture_output=True, text=True, check=True)
+
+
+@pytest.mark.parametrize("flag", ["--help", "--version"])
+def test_startup_time(flag: str) -> None:
+	times = []
+	for _ in range(RUNS):
+		start = perf_counter()
+		run("-m", "eduplanner_demo", flag)
+		times.append(perf_counter() - start)
+	assert min(times) < STARTUP_BUDGET, f"{flag} took {min(times):.2f}s, more than the budget of {STARTUP_BUDGET}s"
+
+
+@pytest.mark.parametrize("flag", ["--help", "--version"])
+def test_no_heavy_imports(flag: str) -> None:
+	# -X importtime lists every imported module on stderr as "import time: self | cumulative | module"
+	result = run("-X", "importtime", "-m", "eduplanner_demo", flag)
+	imported = {
+		line.rsplit("|", 1)[1].strip()
+		for line in result.stderr.splitlines()
+		if line.startswith("import time:") and "|" in line
+	}
+	assert "eduplanner_demo" in imported
+	for module in HEAVY_MODULES:
+		assert module not in imported, f"{flag} imports {module}"
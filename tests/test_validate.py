@@ -0,0 +1,52 @@
+from os.path import dirname, join as pathjoin
+from pathlib import Path
+import shutil
+import sys
+
+import pytest
+import yaml
+
+SRC = pathjoin(dirname(dirname(__file__)), "src")
+""" where the package is, so this doesn't depend on it being installed """
+CONFIG = pathjoin(dirname(dirname(__file__)), "config")
+""" the example configs """
+
+sys.path.insert(0, SRC)
+
+from eduplanner_demo.config import Config # noqa: E402
+from eduplanner_demo.validate import validate # noqa: E402
+
+
+def edit(path: Path, change) -> None:
+	with open(path) as f:
+		document = yaml.safe_load(f)
+	change(document)
+	with open(path, "w") as f:
+		yaml.safe_dump(document, f)
+
+
+@pytest.fixture
+def configdir(tmp_path: Path) -> Path:
+	shutil.copytree(CONFIG, tmp_path, dirs_exist_ok=True)
+	return tmp_path
+
+
+def test_example_config_is_valid(configdir: Path) -> None:
+	assert validate(Config(str(configdir), cachedir=None)) == []
+
+
+def test_unhashable_values_are_violations(configdir: Path) -> None:
+	pytest.importorskip("jsonschema")
+
+	def listclass(document) -> None:
+		document["users"][0]["class"] = [document["users"][0]["class"]]
+
+	def listweek(document) -> None:
+		document["slots"][0]["reservations"][0]["week"] = [1]
+
+	edit(configdir / "users.yml", listclass)
+	edit(configdir / "slots.yml", listweek)
+
+	violations = {(violation.file, violation.path) for violation in validate(Config(str(configdir), cachedir=None))}
+	assert ("users", "users[0].class") in violations
+	assert ("slots", "slots[0].reservations[0].week") in violations